@@ -15,14 +15,19 @@
 #The data values are pixel centre registered i.e. they refer to elevations at the centre of grid cells.
 #This grid file format is suitable for use with the GEBCO Digital Atlas Software Interface and GEBCO Grid display software and packages such as Generic Mapping Tools (GMT).
 
-import arcpy
+#Current GEBCO releases (GEBCO_2019 onwards, 15 arc seconds) are 2D netCDF grids, elevation(lat, lon) with lat running south to north.
+#These are read through a cache of whole decompressed netCDF chunks, and are addressed north to south like the 1D grid, so everything above the reader works on either.
+
+#arcpy is only needed inside ArcGIS Pro. The reader and the exports also run from the command line without it
+try:
+	import arcpy
+except ImportError:
+	arcpy = None
 import geodetic
 import math
 import sys
 import os.path
-import math
 import pprint
-import math
 import time
 from datetime import datetime
 from datetime import timedelta
@@ -30,17 +35,56 @@ import os
 
 sys.path.append('c://infinitytool//ggtool//shared')
 
-import geodetic
 # import pyproj
 
 
 from argparse import ArgumentParser
+from collections import OrderedDict
+import re
+import struct
+import zlib
 import numpy as np
 from netCDF4 import Dataset
-#from scipy.interpolate import RectBivariateSpline
 
 VERSION = "3.0"
 
+#the raw grid is a small fixed size header followed by the 'z' variable as little endian int16, in the same order as the 1D netCDF file.
+RAW_MAGIC = b"GGGEBCO1"
+RAW_HEADER_FORMAT = "<8sI2d2d2d2d2i"	#magic, version, x_range, y_range, z_range, spacing, dimension
+RAW_HEADER_SIZE = 128
+RAW_VERSION = 1
+
+#GEBCO is pixel centre registered. Cell i spans i to i+1 cells from the north or west edge of the grid and its value is at i+0.5. cellIndex, row2Latitude and col2Longitude hold this rule, and every conversion between coordinates and cells goes through them
+#a position within this fraction of a cell of an edge is taken to be on it, so coordinates written out and read back land in the same cell
+CELL_EDGE_TOLERANCE = 1e-6
+
+#sampleDepths reads the grid in windows of this many cells square, so only the windows holding points are read
+SAMPLE_TILE_SIZE = 240
+
+#the exports format and write this many points at a time, so a large extraction never holds its text in memory
+EXPORT_CHUNK_POINTS = 1048576
+
+#block reductions for decimation, of a (latitudes, blockSize, longitudes, blockSize) block. Reducing the rows of each block first works on whole contiguous bands, which is several times faster than reducing both axes at once
+#elevations are negative below sea level, so the shoalest depth is the highest elevation
+DECIMATION_METHODS = OrderedDict([
+	("shoalest", lambda block: block.max(axis=1).max(axis=2)),
+	("mean", lambda block: block.mean(axis=1).mean(axis=2)),
+	("median", lambda block: np.median(block, axis=(1, 3))),
+	("deepest", lambda block: block.min(axis=1).min(axis=2)),
+	])
+
+#overview levels built by buildPyramid, as multiples of the GEBCO interval. Each level holds the min, mean and max of the cells it covers
+PYRAMID_LEVELS = (2, 4, 8, 16, 32, 64)
+PYRAMID_BANDS = ("min", "mean", "max")
+#the pyramid band each decimation is reduced from. A sample is one real cell and a median needs every cell, so neither can come from the overviews and both read the source grid
+PYRAMID_BAND_FOR = {"shoalest": "max", "mean": "mean", "deepest": "min"}
+
+#default memory budget for the decompressed chunks of a 2D netCDF grid. GEBCOReader takes another as chunkCacheBytes, and the command line as -chunkmb
+CHUNK_CACHE_BYTES = 256*1024*1024
+
+#the .prj written beside a BIL export, so ArcGIS knows the grid is WGS84 geographicals
+WGS84_WKT = 'GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]]'
+
 class Toolbox(object):
 	def __init__(self):
 		"""Define the toolbox (the name of the toolbox is the name of the .pyt file)."""
@@ -61,7 +105,7 @@ class GEBCOExtractorTool(object):
 		"""Define parameter definitions"""
 		# First parameter
 		param0 = arcpy.Parameter(
-			displayName="GEBCO Bathymetry (GEBCO_2014_1D.nc)",
+			displayName="GEBCO Bathymetry (GEBCO_2014_1D.nc, a 2D grid such as GEBCO_2023.nc, or a converted .ggraw)",
 			name="GEBCOBathy",
 			datatype="DEFile",
 			parameterType="Required",
@@ -108,7 +152,56 @@ class GEBCOExtractorTool(object):
 			direction="Input")
 		param5.value = 86
 
-		params = [param0, param1, param2, param3, param4, param5]
+		param6 = arcpy.Parameter(
+			displayName="Tile Cache Folder (optional). GEBCO tiles are cached here so repeat extractions over the same area do not re-read the global file",
+			name="TileCacheFolder",
+			datatype="DEFolder",
+			parameterType="Optional",
+			direction="Input")
+
+		param7 = arcpy.Parameter(
+			displayName="Tile Cache Memory Budget (MB)",
+			name="TileCacheMB",
+			datatype="Field",
+			parameterType="Optional",
+			direction="Input")
+		param7.value = 256
+
+		param8 = arcpy.Parameter(
+			displayName="Export File (optional). The extracted depths are also written to this file. .xyz or .csv for text, .npy for an array of x, y, z, .npz for the grid, .bil for a raster with a world file, .nc for a netCDF subset",
+			name="ExportFile",
+			datatype="DEFile",
+			parameterType="Optional",
+			direction="Output")
+
+		param9 = arcpy.Parameter(
+			displayName="Export EPSG Code (optional). Project the exported .xyz, .csv or .npy points into this coordinate system (needs pyproj). Leave empty for WGS84 geographicals",
+			name="ExportEPSG",
+			datatype="Field",
+			parameterType="Optional",
+			direction="Input")
+
+		param10 = arcpy.Parameter(
+			displayName="Load As. Points adds a feature per cell to the Survey_Sounding_Grid, Raster loads the grid as one GEBCO_Bathymetry raster dataset",
+			name="LoadAs",
+			datatype="GPString",
+			parameterType="Required",
+			direction="Input")
+		param10.filter.type = "ValueList"
+		param10.filter.list = ["Points", "Raster", "Points and Raster"]
+		param10.value = "Points"
+
+		param11 = arcpy.Parameter(
+			displayName="Decimation Method. Shoalest keeps the shallowest depth in each decimated block, which is conservative for line spacing. Sample keeps one cell per block",
+			name="DecimationMethod",
+			datatype="GPString",
+			parameterType="Required",
+			direction="Input")
+		param11.filter.type = "ValueList"
+		param11.filter.list = ["Shoalest", "Mean", "Median", "Deepest", "Sample"]
+		param11.value = "Shoalest"
+
+		params = [param0, param1, param2, param3, param4, param5, param6, param7, param8, param9, param10, param11]
 
 		return params
 
@@ -140,9 +233,14 @@ class GEBCOExtractorTool(object):
 		TLLon				= float(parameters[3].valueAsText)
 		BLLat				= float(parameters[4].valueAsText)
 		BLLon				= float(parameters[5].valueAsText)
+		loadAs				= parameters[10].valueAsText or "Points"
+		decimationMethod	= parameters[11].valueAsText or "Shoalest"
 
 		#open the file...
 		gebco				= GEBCOReader(inputFile)
+		if parameters[6].valueAsText:
+			cacheMB = float(parameters[7].valueAsText) if parameters[7].valueAsText else 256
+			gebco.enableTileCache(parameters[6].valueAsText, maxBytes=int(cacheMB * 1024 * 1024))
 
 		# show the user something is happening...
 		arcpy.ResetEnvironments()
@@ -150,7 +248,7 @@ class GEBCOExtractorTool(object):
 
 		#test to ensure the OUTPUT polyline featureclass exists in the SSDM format + create if not
 		FCName = "Survey_Sounding_Grid" #Official SSDM V2 FC name
-		if not gebco.checkSoundingGridFCExists(FCName, spatialReference):
+		if loadAs != "Raster" and not gebco.checkSoundingGridFCExists(FCName, spatialReference):
 			return 1
 
 		#get the map extents from the current map...
@@ -175,11 +273,14 @@ class GEBCOExtractorTool(object):
 		boundingBox = [[TLLon, TLLat], [BLLon, BLLat]]
 		arcpy.AddMessage("Extracting GEBCO data within Map View bounding box: %.3f, %.3f, %.3f, %.3f" %(boundingBox[0][0], boundingBox[0][1], boundingBox[1][0], boundingBox[1][1], ))
 
-		gebco.loadBoundingBoxDepths(boundingBox, decimation)
+		gebco.loadBoundingBoxDepths(boundingBox, decimation, decimationMethod)
 
-		outputFile = "c:/temp/gebcoExtraction.xyz"
-		# gebco.exportDepthsToCSV(outputFile)
-		gebco.DepthsToFeatureClass(FCName)
+		if parameters[8].valueAsText:
+			gebco.exportDepths(parameters[8].valueAsText, parameters[9].valueAsText or None)
+		if loadAs != "Raster":
+			gebco.DepthsToFeatureClass(FCName)
+		if loadAs != "Points":
+			gebco.DepthsToRaster("GEBCO_Bathymetry")
 
 		return
 
@@ -194,6 +295,13 @@ def main():
 	parser.add_argument('-y1', dest='y1', action='store', default=-30, help='bounding box top left Y. [Default: -30]')
 	parser.add_argument('-x2', dest='x2', action='store', default=115, help='bounding box bottom right X. [Default: 115]')
 	parser.add_argument('-y2', dest='y2', action='store', default=-35, help='bounding box bottom right Y. [Default:-35]')
+	parser.add_argument('-cache', dest='cacheFolder', action='store', default='', help='-cache <folder> : cache compressed 1 degree GEBCO tiles in this folder so repeat extractions are fast.')
+	parser.add_argument('-cachemb', dest='cacheMB', action='store', default='256', help='-cachemb <MB> : memory budget for decoded tiles held in the cache. [Default: 256]')
+	parser.add_argument('-chunkmb', dest='chunkMB', action='store', default=str(CHUNK_CACHE_BYTES // (1024 * 1024)), help='-chunkmb <MB> : memory budget for the decompressed chunks of a 2D netCDF input. [Default: %d]' % (CHUNK_CACHE_BYTES // (1024 * 1024)))
+	parser.add_argument('-raw', dest='rawFile', action='store', default='', help='-raw <GEBCO_2014_1D.ggraw> : one-time conversion of the netCDF input into a raw grid which is then memory mapped on subsequent runs. Use the raw file as the -i input afterwards.')
+	parser.add_argument('-pyramid', dest='pyramid', action='store_true', default=False, help='-pyramid : one-time build of x2 to x64 overview levels of the input beside it, so decimated extractions of large areas read the overviews rather than the full grid.')
+	parser.add_argument('-d', dest='decimation', action='store', default='shoalest', help='-d <shoalest|mean|deepest|median|sample> : how each step x step block is reduced to one depth. shoalest is conservative for line spacing, and like mean and deepest reads the -pyramid overviews. sample keeps one cell per block and always reads the full grid. [Default: shoalest]')
+	parser.add_argument('-epsg', dest='epsg', action='store', default='', help='-epsg <32750> : project the .xyz, .csv or .npy output into this EPSG coordinate system (needs pyproj). [Default: WGS84 geographicals]')
 
 	if len(sys.argv)==1:
 		parser.print_help()
@@ -201,23 +309,50 @@ def main():
 
 	args = parser.parse_args()
 
-	gebco = GEBCOReader(args.inputFile)
+	gebco = GEBCOReader(args.inputFile, chunkCacheBytes=int(float(args.chunkMB) * 1024 * 1024))
+	if len(args.rawFile) > 0:
+		gebco.convertToRawGrid(args.rawFile)
+		return
+	if args.pyramid:
+		gebco.buildPyramid()
+		return
+	if len(args.cacheFolder) > 0:
+		gebco.enableTileCache(args.cacheFolder, maxBytes=int(float(args.cacheMB) * 1024 * 1024))
 	# boundingBox = [[110,-30], [115,-35]] #top left, bottom right.
 	boundingBox = [[float(args.x1), float(args.y1)], [float(args.x2), float(args.y2)]]
-	gebco.loadBoundingBoxDepths(boundingBox, float(args.step))
+	gebco.loadBoundingBoxDepths(boundingBox, float(args.step), args.decimation)
 
-	args.outputFile = "c:/temp/gebcoExtraction.xyz"
-	gebco.exportDepthsToCSV(args.outputFile)
+	gebco.exportDepths(args.outputFile, args.epsg or None)
 
 class GEBCOReader:
-	'''Class to read a GEBCO 1D global bathymetry file, rapidly access the data at any given coordinate'''
-	def __init__(self, fileName):
+	'''Class to read a GEBCO global bathymetry file, rapidly access the data at any given coordinate. The file can either be the original 1D netCDF, a current 2D netCDF, or a raw grid created with convertToRawGrid, which is memory mapped'''
+	def __init__(self, fileName, chunkCacheBytes=CHUNK_CACHE_BYTES):
 		if not os.path.isfile(fileName):
 			print ("file not found:", fileName)
 		self.fileName = fileName
+		self.nc = None
+		self.tileCache = None
+		self.chunkCache = None
+		self.chunkCacheBytes = chunkCacheBytes
+
+		if isRawGrid(fileName):
+			self.openRawGrid(fileName)
+		else:
+			self.openNetCDF(fileName)
+
+		self.longitude = np.empty(0)
+		self.latitude = np.empty(0)
+		self.depths = np.empty((0, 0), dtype=np.int16)
+		self.stepSize = 1
+		self.pyramid = self.openPyramid()
+		return
 
+	def openNetCDF(self, fileName):
+		'''open a GEBCO netCDF file, either the 1D layout with a flat 'z' variable, or the 2D layout with elevation(lat, lon)'''
 		self.nc = Dataset(fileName, 'r', Format='NETCDF4')
 		# print(self.nc.variables)
+		if 'z' not in self.nc.variables:
+			return self.openNetCDF2D()
 
 		# get coordinates variables
 		self.longitudeVariable = self.nc.variables['x_range'][:]
@@ -226,10 +361,140 @@ class GEBCOReader:
 		self.spacing = self.nc.variables['spacing'][:]
 		self.dimension = self.nc.variables['dimension'][:]
 
-		self.longitude = []
-		self.latitude = []
-		self.depths = []
-		return
+		#the depths themselves. we read these as plain int16 slices, so switch off the netCDF masking
+		self.nc.set_auto_mask(False)
+		self.z = self.nc.variables['z']
+
+	def openNetCDF2D(self):
+		'''open a 2D GEBCO netCDF grid, or an extraction written by exportDepthsToNetCDF. The lat and lon variables are the cell centres, so the ranges are taken half a cell beyond them to match the 1D x_range and y_range. Reads go through a cache of whole decompressed chunks'''
+		self.nc.set_auto_mask(False)
+		variables = self.nc.variables
+		latitude = np.asarray(variables['lat'][:], dtype=np.float64)
+		longitude = np.asarray(variables['lon'][:], dtype=np.float64)
+		elevation = variables['elevation']
+
+		self.spacing = np.array([gridResolution(self.nc, 'lon', longitude), gridResolution(self.nc, 'lat', latitude)])
+		self.dimension = np.array([len(longitude), len(latitude)])
+		#the north west edge is half a cell beyond the first centres, the inverse of row2Latitude and col2Longitude, and the grid runs a whole number of cells from it. cellIndex then floors every centre into its own cell
+		west = longitude.min() - self.spacing[0] / 2
+		north = latitude.max() + self.spacing[1] / 2
+		self.longitudeVariable = np.array([west, west + len(longitude) * self.spacing[0]])
+		self.latitudeVariable = np.array([north - len(latitude) * self.spacing[1], north])
+		self.zVariable = np.array(elevation.actual_range if 'actual_range' in elevation.ncattrs() else [0.0, 0.0], dtype=np.float64)
+		self.z = None
+		#rows are addressed north to south like the 1D grid, so they are flipped if the file runs south to north
+		self.chunkCache = GEBCOChunkCache(elevation, flipRows=latitude[0] < latitude[-1], maxBytes=self.chunkCacheBytes)
+
+	def openRawGrid(self, fileName):
+		'''open a raw grid created by convertToRawGrid. The depths are memory mapped read-only, so reads come straight from the page cache and the mapping is shared between processes'''
+		with open(fileName, 'rb') as f:
+			header = struct.unpack(RAW_HEADER_FORMAT, f.read(struct.calcsize(RAW_HEADER_FORMAT)))
+		if header[0] != RAW_MAGIC:
+			raise ValueError("%s is not a raw GEBCO grid" % (fileName))
+		if header[1] != RAW_VERSION:
+			raise ValueError("%s is a version %d raw grid, this reader needs version %d. Convert the netCDF file again with -raw" % (fileName, header[1], RAW_VERSION))
+		self.longitudeVariable = np.array(header[2:4])
+		self.latitudeVariable = np.array(header[4:6])
+		self.zVariable = np.array(header[6:8])
+		self.spacing = np.array(header[8:10])
+		self.dimension = np.array(header[10:12])
+
+		count = int(self.dimension[0]) * int(self.dimension[1])
+		if os.path.getsize(fileName) < RAW_HEADER_SIZE + count * 2:
+			raise ValueError("%s is shorter than its %d x %d grid, it may be an incomplete conversion" % (fileName, self.dimension[0], self.dimension[1]))
+		self.z = np.memmap(fileName, dtype='<i2', mode='r', offset=RAW_HEADER_SIZE, shape=(count,))
+
+	def convertToRawGrid(self, rawFileName, bandsPerWrite=120):
+		'''one-time conversion of the 'z' variable into a flat little endian int16 file with a small header recording x_range, y_range, spacing and dimension. Open the resulting file with GEBCOReader to use the memory mapped backend'''
+		addMessage ("Converting %s to raw grid:%s..." % (self.fileName, rawFileName))
+		columns = int(self.dimension[0])
+		rows = int(self.dimension[1])
+		with open(rawFileName, 'wb') as f:
+			f.write(rawGridHeader(self.longitudeVariable, self.latitudeVariable, self.zVariable, self.spacing, (columns, rows)))
+			#copy a block of latitude bands at a time so we never hold the whole grid in memory
+			for row in range(0, rows, bandsPerWrite):
+				lastRow = min(row + bandsPerWrite, rows)
+				if self.z is not None:
+					block = np.asarray(self.z[row * columns : lastRow * columns], dtype='<i2')
+				else:
+					block = self.readSourceBlock(np.arange(row, lastRow), np.arange(columns)).astype('<i2')
+				f.write(block.tobytes())
+		addMessage ("Raw grid written: %d rows x %d columns" % (rows, columns))
+		return rawFileName
+
+	def buildPyramid(self, levels=PYRAMID_LEVELS):
+		'''one-time build of overview levels of the grid, each holding the min, mean and max of the level x level cells it covers. Every level is a raw grid in the pyramid folder beside the source, so it is memory mapped like the source. The source is read once, a band of rows at a time, and each band is reduced to every level'''
+		folder = self.pyramidFolder()
+		addMessage ("Building pyramid levels %s in %s..." % (", ".join("x%d" % (level) for level in levels), folder))
+		if not os.path.isdir(folder):
+			os.makedirs(folder)
+		columns = int(self.dimension[0])
+		rows = int(self.dimension[1])
+		#each band of rows is a whole number of cells at every level, so only the last band and the last column need padding
+		bandRows = 1
+		for level in levels:
+			bandRows = bandRows * level // math.gcd(bandRows, level)
+
+		files = {}
+		try:
+			for level in levels:
+				dimension = (-(-columns // level), -(-rows // level))
+				for band in PYRAMID_BANDS:
+					files[(level, band)] = open(self.pyramidFileName(level, band), 'wb')
+					files[(level, band)].write(rawGridHeader(self.longitudeVariable, self.latitudeVariable, self.zVariable, np.asarray(self.spacing) * level, dimension))
+
+			for row in range(0, rows, bandRows):
+				block = self.readSourceBlock(np.arange(row, min(row + bandRows, rows)), np.arange(columns))
+				for level in levels:
+					padding = ((0, -len(block) % level), (0, -columns % level))
+					#the edges are padded by repeating the last row and column, which leaves the min and max exact
+					padded = np.pad(block, padding, mode='edge')
+					cells = padded.reshape(padded.shape[0] // level, level, padded.shape[1] // level, level)
+					files[(level, "min")].write(cells.min(axis=1).min(axis=2).astype('<i2').tobytes())
+					files[(level, "max")].write(cells.max(axis=1).max(axis=2).astype('<i2').tobytes())
+					#repeated cells would weigh the mean of a part cell at the edge towards its last row and column, so the mean is padded with nan and averages only the cells there are
+					padded = np.pad(block.astype(np.float64), padding, mode='constant', constant_values=np.nan)
+					cells = padded.reshape(padded.shape[0] // level, level, padded.shape[1] // level, level)
+					files[(level, "mean")].write(np.round(np.nanmean(cells, axis=(1, 3))).astype('<i2').tobytes())
+		finally:
+			for f in files.values():
+				f.close()
+		self.closePyramid()
+		self.pyramid = self.openPyramid()
+		addMessage ("Pyramid written: %d levels" % (len(levels)))
+		return folder
+
+	def pyramidFolder(self):
+		return os.path.splitext(self.fileName)[0] + "_pyramid"
+
+	def pyramidFileName(self, level, band):
+		return os.path.join(self.pyramidFolder(), "x%d_%s.ggraw" % (level, band))
+
+	def openPyramid(self):
+		'''open the overview levels built by buildPyramid, if there are any, as {level: {band: GEBCOReader}}'''
+		pyramid = {}
+		folder = self.pyramidFolder()
+		if not os.path.isdir(folder):
+			return pyramid
+		for name in os.listdir(folder):
+			match = re.match(r"x(\d+)_(min|mean|max)\.ggraw$", name)
+			if match:
+				pyramid.setdefault(int(match.group(1)), {})[match.group(2)] = GEBCOReader(os.path.join(folder, name))
+		return pyramid
+
+	def closePyramid(self):
+		for bands in self.pyramid.values():
+			for reader in bands.values():
+				reader.close()
+		self.pyramid = {}
+
+	def pyramidLevel(self, blockSize, decimation):
+		'''return the coarsest pyramid (level, reader) whose cells divide the decimation blocks exactly, or (1, self) to read the source grid'''
+		band = PYRAMID_BAND_FOR.get(decimation)
+		for level in sorted(self.pyramid, reverse=True):
+			if band in self.pyramid[level] and blockSize % level == 0:
+				return level, self.pyramid[level][band]
+		return 1, self
 
 	def checkSoundingGridFCExists(self, FCName, spatialReference):
 		# check the output SSDM 'sounding_grid' FC is in place and if not, make it
@@ -271,8 +536,11 @@ class GEBCOReader:
 			return True
 
 
-	def loadBoundingBoxDepths(self, boundingBox, stepSize):
-		'''load a bounding box from the GEBCO dataset into a numpy array so we can interpolate and access the depths with ease. Bounding box is top left and bottom right in the format:[[x1,y1,[x2,y2]]'''
+	def loadBoundingBoxDepths(self, boundingBox, stepSize, decimation="sample"):
+		'''load a bounding box from the GEBCO dataset into a numpy array so we can interpolate and access the depths with ease. Bounding box is top left and bottom right in the format:[[x1,y1,[x2,y2]]
+		decimation is how each stepSize x stepSize block of cells is reduced to one depth: sample keeps one cell in each block, shoalest, mean, median or deepest reduce every cell in the block, so shoals between the samples are not lost
+		A box may cross the antimeridian, e.g. [[170, -10], [-170, -20]], and is read as two column ranges stitched into one grid
+		The longitudes and latitudes loaded are the centres of the cells, or blocks of cells, read, so sampleDepths at them returns the sampled depths'''
 
 		#add a couple of extra grid nodes to ensure we have good coverage.
 		#boundingBox[0][0] -= self.spacing[0] * 5
@@ -280,74 +548,334 @@ class GEBCOReader:
 		#boundingBox[1][0] += self.spacing[0] * 5
 		#boundingBox[1][1] -= self.spacing[1] * 5
 
-		self.latitude = np.arange(boundingBox[1][1], boundingBox[0][1], self.spacing[1] * stepSize)
-		self.longitude = np.arange(boundingBox[0][0], boundingBox[1][0], self.spacing[0] * stepSize)
-
-		for lat in np.nditer(self.latitude):
-			d=[]
-			for lon in np.nditer(self.longitude):
-				idx = self.coordinate2Index(lat, lon)
-				z = self.nc.variables['z'][idx]
-				d.append(z)
-			self.depths.append(d)
-			arcpy.AddMessage ("Loading row for Latitude: %.3f" % (lat))
-
-		arcpy.AddMessage ("depths records loaded: %d" % (len(self.longitude) * len(self.latitude)))
+		#a box which crosses the antimeridian has its east edge west of its west edge, so carry on east past 180. The longitudes stay continuous, e.g. 170 to 190, and the columns wrap
+		west = boundingBox[0][0]
+		east = boundingBox[1][0]
+		if east < west and self.wrapsLongitude():
+			east += 360
+		north = boundingBox[0][1]
+		south = boundingBox[1][1]
+
+		#the extraction is every stepSize'th cell whose centre is in the box, counted from the north west. Nothing lies beyond the poles
+		rows = self.cellRange(self.latitudeOffset(north), self.latitudeOffset(south), stepSize, int(self.dimension[1]))
+		cols = self.cellRange(self.longitudeOffset(west), self.longitudeOffset(east), stepSize, None if self.wrapsLongitude() else int(self.dimension[0]))
+
+		if decimation.lower() != "sample" and stepSize > 1:
+			#a block is a whole number of cells, sample alone can step between them
+			if stepSize != int(stepSize):
+				raise ValueError("%s decimation reduces whole blocks of cells, so the step must be a whole number, not %g" % (decimation, stepSize))
+			self.stepSize = int(stepSize)
+			self.depths = self.readDecimatedBlock(rows, cols, self.stepSize, decimation.lower())
+		else:
+			if self.pyramid and stepSize > 1:
+				addMessage ("A sample decimation reads the input grid, only shoalest, mean and deepest read the pyramid")
+			self.stepSize = stepSize
+			#read the whole block in one pass, one slice per latitude band rather than one read per grid cell. The grid is held south to north
+			self.latitude = self.row2Latitude(rows[::-1])
+			self.longitude = self.col2Longitude(cols)
+			self.depths = self.readBlock(rows[::-1], self.wrapColumns(cols))
+
+		addMessage ("depths records loaded: %d" % (len(self.longitude) * len(self.latitude)))
+		if self.tileCache is not None:
+			addMessage (self.tileCache.statistics())
+		if self.chunkCache is not None:
+			addMessage (self.chunkCache.statistics())
+
+	def readDecimatedBlock(self, rows, cols, blockSize, decimation):
+		'''read every cell under the decimated grid in one block and reduce each blockSize x blockSize block of it to one depth. rows and cols are the north west cells of the blocks. The block is reshaped to (latitudes, blockSize, longitudes, blockSize) with no copy, so the reduction costs less than the read. The coordinates become the centres of the blocks.
+		If there is a pyramid, the cells are read from the coarsest level which divides the blocks, with the blocks moved onto the cells of that level'''
+		if decimation not in DECIMATION_METHODS:
+			raise ValueError("unknown decimation %s, use sample, %s" % (decimation, ", ".join(DECIMATION_METHODS)))
+		latitudeCount = len(rows)
+		longitudeCount = len(cols)
+		topRow = int(rows[0]) if latitudeCount > 0 else 0
+		westCol = int(cols[0]) if longitudeCount > 0 else 0
+		level, reader = self.pyramidLevel(blockSize, decimation)
+		if level > 1:
+			addMessage ("Reading the x%d %s pyramid level" % (level, PYRAMID_BAND_FOR[decimation]))
+			topRow -= topRow % level
+			westCol -= westCol % level
+		elif self.pyramid:
+			addMessage ("No pyramid level serves a %s decimation of %d, reading the input grid" % (decimation, blockSize))
+		cellsPerBlock = blockSize // level
+		readRows = np.clip(np.arange(topRow // level, topRow // level + latitudeCount * cellsPerBlock), 0, int(reader.dimension[1]) - 1)
+		readCols = np.arange(westCol // level, westCol // level + longitudeCount * cellsPerBlock)
+		block = reader.readBlock(readRows, reader.wrapColumns(readCols)).reshape(latitudeCount, cellsPerBlock, longitudeCount, cellsPerBlock)
+		depths = DECIMATION_METHODS[decimation](block)
+		self.latitude = self.row2Latitude(topRow + np.arange(latitudeCount)[::-1] * blockSize + (blockSize - 1) / 2)
+		self.longitude = self.col2Longitude(westCol + np.arange(longitudeCount) * blockSize + (blockSize - 1) / 2)
+		#back to south to north like the sampled grid, and int16 so the exports stay compact
+		return np.round(depths[::-1]).astype(np.int16)
+
+	def enableTileCache(self, cacheFolder, tileDegrees=1.0, maxBytes=256*1024*1024):
+		'''route all reads through a cache of compressed tiles held in cacheFolder, with decoded tiles kept in memory up to maxBytes'''
+		self.tileCache = GEBCOTileCache(self, cacheFolder, tileDegrees, maxBytes)
+		return self.tileCache
+
+	def readBlock(self, rows, cols):
+		'''read a 2D block of depths from the grid given arrays of row and column indices. If the tile cache is enabled the block is assembled from cached tiles.
+		Columns which wrap around the antimeridian, e.g. the last few columns then the first few, are read as separate increasing ranges and stitched together, so each range is still one slice per row'''
+		cols = np.asarray(cols)
+		wraps = np.flatnonzero(np.diff(cols) < 0)
+		if len(wraps) > 0:
+			return np.hstack([self.readBlock(rows, part) for part in np.split(cols, wraps + 1)])
+		if self.tileCache is not None:
+			return self.tileCache.readBlock(rows, cols)
+		return self.readSourceBlock(rows, cols)
+
+	def readSourceBlock(self, rows, cols):
+		'''read a 2D block of depths directly from the file. Each row is read as a single slice of the 1D 'z' variable, or a 2D grid is assembled from its chunks'''
+		if self.chunkCache is not None:
+			return self.chunkCache.readBlock(np.asarray(rows), np.asarray(cols))
+		depths = np.empty((len(rows), len(cols)), dtype=np.int16)
+		if len(rows) == 0 or len(cols) == 0:
+			return depths
+		for i, row in enumerate(rows):
+			depths[i] = self.readBand(row, cols)
+		return depths
+
+	def readBand(self, row, cols):
+		'''read the requested columns from a single latitudinal band. Evenly stepped columns are read with one strided slice, anything else with one contiguous slice which is then indexed'''
+		start = int(row) * int(self.dimension[0])
+		colMin = int(cols.min())
+		colMax = int(cols.max())
+		steps = np.diff(cols)
+		if len(cols) > 1 and steps[0] > 0 and np.all(steps == steps[0]):
+			return np.asarray(self.z[start + colMin : start + colMax + 1 : int(steps[0])], dtype=np.int16)
+		band = np.asarray(self.z[start + colMin : start + colMax + 1], dtype=np.int16)
+		return band[cols - colMin]
+
+	def sampleDepths(self, latitude, longitude, method="bilinear"):
+		'''sample the grid at arrays of coordinates, returning float elevations in the shape of the inputs. method is nearest, bilinear or bicubic (Catmull-Rom).
+		The values are at the centres of the grid cells, so nearest returns the cell containing each point. The points are grouped by the window of the grid they fall in, and each window is read once through readBlock, so the tile cache is used if it is enabled. There is one python step per window, not per point'''
+		latitude = np.asarray(latitude, dtype=np.float64)
+		longitude = np.asarray(longitude, dtype=np.float64)
+		shape = np.broadcast(latitude, longitude).shape
+		latitude = np.broadcast_to(latitude, shape).ravel()
+		longitude = np.broadcast_to(longitude, shape).ravel()
+		depths = np.empty(len(latitude))
+		if len(depths) == 0:
+			return depths.reshape(shape)
+
+		#fractional row and column, measured from the centre of the first cell
+		rows = self.latitudeOffset(latitude) - 0.5
+		cols = self.longitudeOffset(longitude) - 0.5
+		if method == "nearest":
+			baseRows = self.cellIndex(rows + 0.5)
+			baseCols = self.cellIndex(cols + 0.5)
+			offsets = np.arange(1)
+		elif method == "bilinear":
+			baseRows = np.floor(rows).astype(np.int64)
+			baseCols = np.floor(cols).astype(np.int64)
+			offsets = np.arange(2)
+		elif method == "bicubic":
+			baseRows = np.floor(rows).astype(np.int64)
+			baseCols = np.floor(cols).astype(np.int64)
+			offsets = np.arange(-1, 3)
+		else:
+			raise ValueError("unknown interpolation method: %s" % (method))
+		rowWeights = interpolationWeights(rows - baseRows, method)
+		colWeights = interpolationWeights(cols - baseCols, method)
+
+		#group the points by window, and read each window with the margin the interpolation needs
+		rowCount = int(self.dimension[1])
+		colCount = int(self.dimension[0])
+		wrapsLongitude = self.wrapsLongitude()
+		if wrapsLongitude:
+			baseCols = baseCols % colCount
+		windowRows = np.clip(baseRows, 0, rowCount - 1) // SAMPLE_TILE_SIZE
+		windowCols = np.clip(baseCols, 0, colCount - 1) // SAMPLE_TILE_SIZE
+		windows = windowRows * (colCount // SAMPLE_TILE_SIZE + 1) + windowCols
+		order = np.argsort(windows, kind='stable')
+		starts = np.flatnonzero(np.diff(windows[order], prepend=-1))
+		ends = np.append(starts[1:], len(order))
+		for start, end in zip(starts, ends):
+			points = order[start:end]
+			pointRows = baseRows[points][:, None] + offsets
+			pointCols = baseCols[points][:, None] + offsets
+			#cells beyond the poles repeat the edge cell. Cells beyond the antimeridian wrap around in a global grid, and repeat the edge cell otherwise
+			pointRows = np.clip(pointRows, 0, rowCount - 1)
+			if not wrapsLongitude:
+				pointCols = np.clip(pointCols, 0, colCount - 1)
+			firstRow = int(pointRows.min())
+			firstCol = int(pointCols.min())
+			block = self.readBlock(np.arange(firstRow, int(pointRows.max()) + 1), np.arange(firstCol, int(pointCols.max()) + 1) % colCount).astype(np.float64)
+			values = block[(pointRows - firstRow)[:, :, None], (pointCols - firstCol)[:, None, :]]
+			depths[points] = np.einsum('ni,nij,nj->n', rowWeights[points], values, colWeights[points])
+		return depths.reshape(shape)
 
 	def DepthsToFeatureClass(self, FCName):
-		print("Writing data to:%s..." % (FCName))
-
-		cursor = arcpy.da.InsertCursor(FCName, ["SHAPE@", "ELEVATION"])
-
-
-
-		row = 0
-		for lat in np.nditer(self.latitude):
-			col = 0
-			for lon in np.nditer(self.longitude):
-				Z = float(self.depths[row][col])
-				X = float(lon)
-				Y = float(lat)
-				pt = arcpy.Point(X,Y,Z)
-				cursor.insertRow([pt, Z])
-				#f.write("%.8f, %.8f, %.1f\n" % (lon, lat, self.depths[row][col]))
-				col += 1
-			row += 1
+		'''load the depths into the point featureclass in one bulk write. The points are built as a numpy structured array, turned into an in_memory featureclass in one call, and appended to the geodatabase in one go, rather than one arcpy.Point and insertRow per cell'''
+		addMessage ("Writing data to:%s..." % (FCName))
+		points = np.empty(self.depths.size, dtype=[("X", np.float64), ("Y", np.float64), ("Z", np.float64), ("ELEVATION", np.float64)])
+		points["X"] = np.tile(self.longitude, len(self.latitude))
+		points["Y"] = np.repeat(self.latitude, len(self.longitude))
+		points["Z"] = self.depths.ravel()
+		points["ELEVATION"] = points["Z"]
+
+		memoryFCName = "in_memory\\GEBCOSoundings"
+		if arcpy.Exists(memoryFCName):
+			arcpy.Delete_management(memoryFCName)
+		arcpy.da.NumPyArrayToFeatureClass(points, memoryFCName, ["X", "Y", "Z"], arcpy.SpatialReference(4326))
+		arcpy.Append_management(memoryFCName, FCName, "NO_TEST")
+		arcpy.Delete_management(memoryFCName)
+		addMessage ("%d points written" % (len(points)))
 		return
 
-	# def exportDepthsToCSV(self, fileName):
-	# 	projection = None
-	# 	arcpy.AddMessage ("Writing data to:%s..." % (fileName))
-	# 	# projection = self.loadProj(32726)
-
-	# 	#load the python proj projection object library if the user has requested it
-	# 	# geo = geodetic.geodesy(args.epsg)
-
-	# 	f = open(fileName, "w")
-	# 	row = 0
-	# 	for lat in np.nditer(self.latitude):
-	# 		col = 0
-	# 		for lon in np.nditer(self.longitude):
-	# 			if projection is not None:
-	# 				x,y = geo.convertToGrid(longitude, latitude)
-
-	# 				x,y = projection(float(lon),float(lat))
-	# 				f.write("%.8f,%.8f,%.1f\n" % (x, y, self.depths[row][col]))
-	# 			else:
-	# 				f.write("%.8f,%.8f,%.1f\n" % (lon, lat, self.depths[row][col]))
-	# 			col += 1
-	# 		row += 1
-	# 	f.close()
-	# 	return
+	def DepthsToRaster(self, rasterName):
+		'''load the depths as one int16 raster dataset in WGS84, rather than a point per cell'''
+		addMessage ("Writing data to raster:%s..." % (rasterName))
+		xStep, yStep = self.gridStep()
+		west, south, east, north = self.gridEdges()
+		#rasters run north to south from the lower left corner of the bottom left cell
+		lowerLeft = arcpy.Point(west, south)
+		raster = arcpy.NumPyArrayToRaster(np.ascontiguousarray(self.depths[::-1]), lowerLeft, xStep, yStep)
+		if arcpy.Exists(rasterName):
+			arcpy.Delete_management(rasterName)
+		raster.save(rasterName)
+		arcpy.DefineProjection_management(rasterName, arcpy.SpatialReference(4326))
+		addMessage ("Raster written: %d rows x %d columns" % (self.depths.shape[0], self.depths.shape[1]))
+		return rasterName
+
+	def exportDepths(self, fileName, EPSGCode=None):
+		'''write the depths loaded by loadBoundingBoxDepths to a file, in a format chosen by the extension: .npz, .bil, .nc and .npy are binary, anything else is xyz text. EPSGCode projects the .npy and text points, the grids stay in WGS84'''
+		extension = os.path.splitext(fileName)[1].lower()
+		if EPSGCode and extension in (".npz", ".bil", ".nc"):
+			addMessage ("%s is a grid, so it is written in WGS84 geographicals rather than EPSG:%s" % (fileName, EPSGCode))
+		if extension == ".npz":
+			return self.exportDepthsToNPZ(fileName)
+		if extension == ".bil":
+			return self.exportDepthsToBIL(fileName)
+		if extension == ".nc":
+			return self.exportDepthsToNetCDF(fileName)
+		if extension == ".npy":
+			return self.exportDepthsToNPY(fileName, EPSGCode)
+		return self.exportDepthsToCSV(fileName, EPSGCode)
+
+	def exportDepthsToCSV(self, fileName, EPSGCode=None, chunkPoints=EXPORT_CHUNK_POINTS):
+		'''write the depths as x,y,z text, a chunk of latitude bands at a time. The text is formatted as bytes with numpy rather than one write per point. Geographicals have 8 decimals, projected coordinates 3'''
+		addMessage ("Writing data to:%s..." % (fileName))
+		projection = self.loadProj(EPSGCode) if EPSGCode else None
+		#the longitudes, latitudes and every possible int16 depth are formatted once, then each chunk is a gather of their bytes
+		if projection is None:
+			longitudeText = geodetic.formatField(self.longitude, 8)
+			latitudeText = geodetic.formatField(self.latitude, 8)
+		depthText = geodetic.formatField(np.arange(-32768, 32768), 1)
+		with open(fileName, "wb") as f:
+			for rows in self.exportChunks(chunkPoints):
+				rowIndex = np.repeat(rows, len(self.longitude))
+				colIndex = np.tile(np.arange(len(self.longitude)), len(rows))
+				if projection is None:
+					xText = longitudeText[colIndex]
+					yText = latitudeText[rowIndex]
+				else:
+					x, y = projection.transform(self.longitude[colIndex], self.latitude[rowIndex])
+					xText = geodetic.formatField(x, 3)
+					yText = geodetic.formatField(y, 3)
+				separator = np.full((len(rowIndex), 1), ord(","), dtype=np.uint8)
+				newline = np.full((len(rowIndex), 1), ord("\n"), dtype=np.uint8)
+				zText = depthText[self.depths[rows].ravel().astype(np.int64) + 32768]
+				text = np.hstack([xText, separator, yText, separator, zText, newline]).ravel()
+				#the fields are padded with zero bytes, which are dropped here
+				f.write(text[text != 0].tobytes())
+		addMessage ("%d points written" % (self.depths.size))
+		return fileName
+
+	def exportDepthsToNPY(self, fileName, EPSGCode=None, chunkPoints=EXPORT_CHUNK_POINTS):
+		'''write the depths as an (n, 3) float64 array of x, y, z. The array is memory mapped and filled a chunk at a time'''
+		addMessage ("Writing data to:%s..." % (fileName))
+		projection = self.loadProj(EPSGCode) if EPSGCode else None
+		points = np.lib.format.open_memmap(fileName, mode="w+", dtype=np.float64, shape=(self.depths.size, 3))
+		start = 0
+		for rows in self.exportChunks(chunkPoints):
+			x = np.tile(self.longitude, len(rows))
+			y = np.repeat(self.latitude[rows], len(self.longitude))
+			if projection is not None:
+				x, y = projection.transform(x, y)
+			end = start + len(x)
+			points[start:end, 0] = x
+			points[start:end, 1] = y
+			points[start:end, 2] = self.depths[rows].ravel()
+			start = end
+		points.flush()
+		del points
+		addMessage ("%d points written" % (self.depths.size))
+		return fileName
+
+	def exportDepthsToNPZ(self, fileName):
+		'''write the grid as it is held, the longitude and latitude axes and the int16 depths, which is the most compact form'''
+		addMessage ("Writing data to:%s..." % (fileName))
+		np.savez_compressed(fileName, longitude=self.longitude, latitude=self.latitude, depths=self.depths)
+		return fileName
+
+	def exportDepthsToBIL(self, fileName):
+		'''write the grid as a raw band interleaved int16 raster, with the .hdr, .blw world file and .prj ArcGIS and GDAL need to open it'''
+		addMessage ("Writing data to:%s..." % (fileName))
+		xStep, yStep = self.gridStep()
+		#rasters run north to south, the loaded grid south to north
+		np.ascontiguousarray(self.depths[::-1], dtype='<i2').tofile(fileName)
+		baseName = os.path.splitext(fileName)[0]
+		#ULXMAP and ULYMAP are the centre of the north west cell, which row2Latitude and col2Longitude gave the loaded grid
+		with open(baseName + ".hdr", "w") as f:
+			f.write("BYTEORDER I\nLAYOUT BIL\nNROWS %d\nNCOLS %d\nNBANDS 1\nNBITS 16\nPIXELTYPE SIGNEDINT\n" % (self.depths.shape[0], self.depths.shape[1]))
+			f.write("ULXMAP %.10f\nULYMAP %.10f\nXDIM %.10f\nYDIM %.10f\n" % (self.longitude[0], self.latitude[-1], xStep, yStep))
+		#the world file refers to the same cell centre
+		with open(baseName + ".blw", "w") as f:
+			f.write("%.10f\n0.0\n0.0\n%.10f\n%.10f\n%.10f\n" % (xStep, -yStep, self.longitude[0], self.latitude[-1]))
+		with open(baseName + ".prj", "w") as f:
+			f.write(WGS84_WKT)
+		return fileName
+
+	def exportDepthsToNetCDF(self, fileName):
+		'''write the grid as a compressed CF netCDF subset, with lat and lon axes and an int16 elevation variable, the same layout as the 2D GEBCO grids'''
+		addMessage ("Writing data to:%s..." % (fileName))
+		nc = Dataset(fileName, 'w', format='NETCDF4')
+		try:
+			nc.title = "GEBCO extraction from %s" % (os.path.basename(self.fileName))
+			nc.Conventions = "CF-1.6"
+			#the cell size, so a grid of a single row or column reopens with it
+			nc.geospatial_lon_resolution, nc.geospatial_lat_resolution = self.gridStep()
+			nc.createDimension("lat", len(self.latitude))
+			nc.createDimension("lon", len(self.longitude))
+			latitude = nc.createVariable("lat", "f8", ("lat",))
+			latitude.units = "degrees_north"
+			latitude.standard_name = "latitude"
+			#the cell centres, which is how the 2D GEBCO grids and openNetCDF2D register them
+			latitude[:] = self.latitude
+			longitude = nc.createVariable("lon", "f8", ("lon",))
+			longitude.units = "degrees_east"
+			longitude.standard_name = "longitude"
+			longitude[:] = self.longitude
+			elevation = nc.createVariable("elevation", "i2", ("lat", "lon"), zlib=True)
+			elevation.units = "m"
+			elevation.standard_name = "height_above_reference_ellipsoid"
+			elevation[:] = self.depths
+		finally:
+			nc.close()
+		return fileName
+
+	def exportChunks(self, chunkPoints):
+		'''yield arrays of the latitude bands to export together, about chunkPoints points at a time'''
+		bands = max(1, chunkPoints // max(1, len(self.longitude)))
+		for row in range(0, len(self.latitude), bands):
+			yield np.arange(row, min(row + bands, len(self.latitude)))
+
+	def gridStep(self):
+		'''the longitude and latitude interval of the loaded grid, stepSize cells of the source grid. It is taken from the grid rather than the loaded coordinates, so a single row or column is right too'''
+		return float(self.spacing[0]) * self.stepSize, float(self.spacing[1]) * self.stepSize
+
+	def gridEdges(self):
+		'''the west, south, east and north edges of the loaded grid, half an interval beyond the centres of its outer cells'''
+		xStep, yStep = self.gridStep()
+		return (float(self.longitude[0]) - xStep / 2, float(self.latitude[0]) - yStep / 2, float(self.longitude[-1]) + xStep / 2, float(self.latitude[-1]) + yStep / 2)
 
 	def loadProj(self, EPSGCode):
-		'''load a pyproj object using the supplied code'''
-		# wgs84=pyproj.Proj("+init=EPSG:4326") # LatLon with WGS84 datum used by GPS units and Google Earth
+		'''load a pyproj transformer from WGS84 into the supplied EPSG code. It projects whole arrays of longitudes and latitudes in one call'''
 		try:
-			projection = pyproj.Proj("+init=EPSG:" + str(EPSGCode))
-		except:
-			return None
-		return projection
+			import pyproj
+		except ImportError:
+			raise ImportError("pyproj is needed to export projected coordinates, leave the EPSG code empty for geographicals")
+		return pyproj.Transformer.from_crs("EPSG:4326", "EPSG:" + str(EPSGCode), always_xy=True)
 
 	def coordinate2Index(self, latitude, longitude):
 		'''convert a latitude/longitude into the 1D index used to access the GEBCO bathymetry'''
@@ -356,35 +884,277 @@ class GEBCOReader:
 		#latitudinal bands of 360 degrees x 120 points per degree = 43,200 values.
 		#arrays start at the northwest of the planet...
 
-		row = round((90 - latitude) / self.spacing[0])
-		col = round((longitude + 180) / self.spacing[1])
-		idx = clamp(row * self.dimension[0] + col, 0, (self.dimension[0] * self.dimension[1]))
-		return idx
+		#clamping the flat index let a point beyond the pole or the antimeridian wrap into the wrong row, so the row is clamped and the column wraps on their own
+		row = int(self.latitude2Row([latitude])[0])
+		col = int(self.longitude2Col([longitude])[0])
+		return row * int(self.dimension[0]) + col
+
+	def latitude2Row(self, latitude):
+		'''convert an array of latitudes into the grid rows which contain them'''
+		rows = self.cellIndex(self.latitudeOffset(latitude))
+		return np.clip(rows, 0, int(self.dimension[1]) - 1)
+
+	def longitude2Col(self, longitude):
+		'''convert an array of longitudes into the grid columns which contain them. The columns of a global grid wrap around the antimeridian'''
+		cols = self.cellIndex(self.longitudeOffset(longitude))
+		if self.wrapsLongitude():
+			return cols % int(self.dimension[0])
+		return np.clip(cols, 0, int(self.dimension[0]) - 1)
+
+	def latitudeOffset(self, latitude):
+		'''the distance of latitudes south of the north edge of the grid, in cells'''
+		return (float(self.latitudeVariable[1]) - np.asarray(latitude, dtype=np.float64)) / float(self.spacing[1])
+
+	def longitudeOffset(self, longitude):
+		'''the distance of longitudes east of the west edge of the grid, in cells'''
+		return (np.asarray(longitude, dtype=np.float64) - float(self.longitudeVariable[0])) / float(self.spacing[0])
+
+	def cellIndex(self, offsets):
+		'''the cells holding positions given in cells from the north or west edge of the grid. Cell i spans offsets i to i+1, and a position on an edge belongs to the cell south or east of it'''
+		return np.floor(np.asarray(offsets, dtype=np.float64) + CELL_EDGE_TOLERANCE).astype(np.int64)
+
+	def cellRange(self, start, end, step=1, count=None):
+		'''every step'th cell whose centre lies from offset start up to, but not including, offset end. A count keeps the cells inside a grid of that many cells'''
+		first = int(np.ceil(start - 0.5 - CELL_EDGE_TOLERANCE))
+		last = int(np.ceil(end - 0.5 - CELL_EDGE_TOLERANCE))
+		if count is not None:
+			first = max(first, 0)
+			last = min(last, count)
+		return (first + np.arange(0, max(last - first, 0), step)).astype(np.int64)
+
+	def row2Latitude(self, rows):
+		'''the latitudes of the centres of grid rows. Fractional rows give the latitudes between them'''
+		return float(self.latitudeVariable[1]) - (np.asarray(rows, dtype=np.float64) + 0.5) * float(self.spacing[1])
+
+	def col2Longitude(self, cols):
+		'''the longitudes of the centres of grid columns. Columns beyond the east edge carry on past it, so a box across the antimeridian keeps continuous longitudes'''
+		return float(self.longitudeVariable[0]) + (np.asarray(cols, dtype=np.float64) + 0.5) * float(self.spacing[0])
+
+	def wrapColumns(self, cols):
+		'''bring columns beyond the edges of the grid back onto it, around the antimeridian if the grid is global, otherwise onto the edge column'''
+		if self.wrapsLongitude():
+			return np.asarray(cols) % int(self.dimension[0])
+		return np.clip(cols, 0, int(self.dimension[0]) - 1)
+
+	def wrapsLongitude(self):
+		'''True if the grid covers all 360 degrees of longitude, so its columns wrap around the antimeridian'''
+		return abs(float(self.longitudeVariable[1]) - float(self.longitudeVariable[0]) - 360.0) < float(self.spacing[0]) / 2
 
 	def close(self):
-		self.nc.close()
-
-def clamp(n, minn, maxn):
-    return max(min(maxn, n), minn)
+		if self.nc is not None:
+			self.nc.close()
+		self.z = None
+		self.chunkCache = None
+		self.closePyramid()
+
+class GEBCOTileCache:
+	'''Cache of square tiles of a GEBCO grid. Each tile is stored zlib compressed in a local folder, and decoded tiles are kept in an in-memory LRU limited to a byte budget'''
+	def __init__(self, reader, cacheFolder, tileDegrees=1.0, maxBytes=256*1024*1024):
+		self.reader = reader
+		self.cacheFolder = cacheFolder
+		self.tileSize = max(1, int(round(tileDegrees / float(reader.spacing[1]))))
+		self.maxBytes = maxBytes
+		self.filePrefix = "%s_%d" % (os.path.splitext(os.path.basename(reader.fileName))[0], self.tileSize)
+
+		self.tiles = OrderedDict()
+		self.bytesInMemory = 0
+		self.memoryHits = 0
+		self.diskHits = 0
+		self.misses = 0
+		self.evictions = 0
+
+		if not os.path.exists(cacheFolder):
+			os.makedirs(cacheFolder)
+
+	def readBlock(self, rows, cols):
+		'''assemble a 2D block of depths for the requested row and column indices from the tiles which cover them'''
+		depths = np.empty((len(rows), len(cols)), dtype=np.int16)
+		if len(rows) == 0 or len(cols) == 0:
+			return depths
+		tileRows = rows // self.tileSize
+		tileCols = cols // self.tileSize
+		for tileRow in np.unique(tileRows):
+			rowMask = np.flatnonzero(tileRows == tileRow)
+			localRows = rows[rowMask] - tileRow * self.tileSize
+			for tileCol in np.unique(tileCols):
+				colMask = np.flatnonzero(tileCols == tileCol)
+				localCols = cols[colMask] - tileCol * self.tileSize
+				tile = self.getTile(int(tileRow), int(tileCol))
+				depths[np.ix_(rowMask, colMask)] = tile[np.ix_(localRows, localCols)]
+		return depths
+
+	def getTile(self, tileRow, tileCol):
+		'''return a decoded tile, from memory if we have it, then the local disk, and finally the GEBCO file itself'''
+		key = (tileRow, tileCol)
+		tile = self.tiles.get(key)
+		if tile is not None:
+			self.tiles.move_to_end(key)
+			self.memoryHits += 1
+			return tile
+
+		fileName = self.tileFileName(tileRow, tileCol)
+		if os.path.isfile(fileName):
+			tile = self.readTile(fileName, tileRow, tileCol)
+			self.diskHits += 1
+		else:
+			tile = self.loadTile(tileRow, tileCol)
+			self.writeTile(fileName, tile)
+			self.misses += 1
+
+		self.tiles[key] = tile
+		self.bytesInMemory += tile.nbytes
+		while self.bytesInMemory > self.maxBytes and len(self.tiles) > 1:
+			oldKey, oldTile = self.tiles.popitem(last=False)
+			self.bytesInMemory -= oldTile.nbytes
+			self.evictions += 1
+		return tile
+
+	def tileShape(self, tileRow, tileCol):
+		'''tiles along the eastern and southern edges of the grid may be partial'''
+		rows = min(self.tileSize, int(self.reader.dimension[1]) - tileRow * self.tileSize)
+		cols = min(self.tileSize, int(self.reader.dimension[0]) - tileCol * self.tileSize)
+		return (rows, cols)
+
+	def loadTile(self, tileRow, tileCol):
+		'''read a complete tile from the GEBCO file'''
+		rows, cols = self.tileShape(tileRow, tileCol)
+		firstRow = tileRow * self.tileSize
+		firstCol = tileCol * self.tileSize
+		return self.reader.readSourceBlock(np.arange(firstRow, firstRow + rows), np.arange(firstCol, firstCol + cols))
+
+	def readTile(self, fileName, tileRow, tileCol):
+		with open(fileName, 'rb') as f:
+			data = zlib.decompress(f.read())
+		return np.frombuffer(data, dtype='<i2').astype(np.int16).reshape(self.tileShape(tileRow, tileCol))
+
+	def writeTile(self, fileName, tile):
+		#write to a temporary file first so a concurrent reader never sees half a tile
+		tempName = "%s.%d.tmp" % (fileName, os.getpid())
+		with open(tempName, 'wb') as f:
+			f.write(zlib.compress(tile.astype('<i2').tobytes(), 6))
+		os.replace(tempName, fileName)
+
+	def tileFileName(self, tileRow, tileCol):
+		return os.path.join(self.cacheFolder, "%s_%d_%d.tile" % (self.filePrefix, tileRow, tileCol))
+
+	def statistics(self):
+		'''summary of cache activity, useful to size the memory budget'''
+		return "Tile cache: memory hits %d, disk hits %d, misses %d, evictions %d, %d tiles %.1f MB in memory (budget %.1f MB)" % (self.memoryHits, self.diskHits, self.misses, self.evictions, len(self.tiles), self.bytesInMemory / 1048576.0, self.maxBytes / 1048576.0)
+
+class GEBCOChunkCache:
+	'''Read a 2D netCDF grid a whole chunk at a time, as it is stored, and keep the decompressed chunks in an in-memory LRU limited to a byte budget. Contiguous grids are read in square windows instead'''
+	def __init__(self, variable, flipRows=False, maxBytes=CHUNK_CACHE_BYTES):
+		self.variable = variable
+		self.flipRows = flipRows
+		self.maxBytes = maxBytes
+		self.shape = variable.shape
+		chunking = variable.chunking()
+		if chunking is None or chunking == 'contiguous':
+			chunking = (SAMPLE_TILE_SIZE, SAMPLE_TILE_SIZE)
+		self.chunkShape = (int(chunking[0]), int(chunking[1]))
+
+		self.chunks = OrderedDict()
+		self.bytesInMemory = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def readBlock(self, rows, cols):
+		'''assemble a 2D block of depths for the requested rows, counted north to south, and columns from the chunks which cover them'''
+		depths = np.empty((len(rows), len(cols)), dtype=np.int16)
+		if len(rows) == 0 or len(cols) == 0:
+			return depths
+		if self.flipRows:
+			rows = self.shape[0] - 1 - rows
+		chunkRows = rows // self.chunkShape[0]
+		chunkCols = cols // self.chunkShape[1]
+		for chunkRow in np.unique(chunkRows):
+			rowMask = np.flatnonzero(chunkRows == chunkRow)
+			localRows = rows[rowMask] - chunkRow * self.chunkShape[0]
+			for chunkCol in np.unique(chunkCols):
+				colMask = np.flatnonzero(chunkCols == chunkCol)
+				localCols = cols[colMask] - chunkCol * self.chunkShape[1]
+				chunk = self.getChunk(int(chunkRow), int(chunkCol))
+				depths[np.ix_(rowMask, colMask)] = chunk[np.ix_(localRows, localCols)]
+		return depths
+
+	def getChunk(self, chunkRow, chunkCol):
+		'''return a decompressed chunk, reading the whole chunk from the file if it is not in memory'''
+		key = (chunkRow, chunkCol)
+		chunk = self.chunks.get(key)
+		if chunk is not None:
+			self.chunks.move_to_end(key)
+			self.hits += 1
+			return chunk
+
+		firstRow = chunkRow * self.chunkShape[0]
+		firstCol = chunkCol * self.chunkShape[1]
+		chunk = np.asarray(self.variable[firstRow : firstRow + self.chunkShape[0], firstCol : firstCol + self.chunkShape[1]], dtype=np.int16)
+		self.misses += 1
+
+		self.chunks[key] = chunk
+		self.bytesInMemory += chunk.nbytes
+		while self.bytesInMemory > self.maxBytes and len(self.chunks) > 1:
+			oldKey, oldChunk = self.chunks.popitem(last=False)
+			self.bytesInMemory -= oldChunk.nbytes
+			self.evictions += 1
+		return chunk
+
+	def statistics(self):
+		'''summary of chunk cache activity'''
+		return "Chunk cache: %dx%d chunks, hits %d, misses %d, evictions %d, %d chunks %.1f MB in memory (budget %.1f MB)" % (self.chunkShape[0], self.chunkShape[1], self.hits, self.misses, self.evictions, len(self.chunks), self.bytesInMemory / 1048576.0, self.maxBytes / 1048576.0)
+
+def addMessage(msg):
+	'''report progress in ArcGIS Pro, or on the console when run from the command line'''
+	if arcpy is not None:
+		arcpy.AddMessage(msg)
+	else:
+		print(msg)
+
+def rawGridHeader(xRange, yRange, zRange, spacing, dimension):
+	'''the fixed size header of a raw grid'''
+	header = struct.pack(RAW_HEADER_FORMAT, RAW_MAGIC, RAW_VERSION,
+		float(xRange[0]), float(xRange[1]),
+		float(yRange[0]), float(yRange[1]),
+		float(zRange[0]), float(zRange[1]),
+		float(spacing[0]), float(spacing[1]),
+		int(dimension[0]), int(dimension[1]))
+	return header.ljust(RAW_HEADER_SIZE, b"\0")
+
+def gridResolution(nc, axis, centres):
+	'''the cell size along the lat or lon axis of a 2D netCDF grid, from its geospatial_lat_resolution or geospatial_lon_resolution attribute, or else the spacing of the cell centres'''
+	attribute = "geospatial_%s_resolution" % (axis)
+	if attribute in nc.ncattrs():
+		#some writers add the units, e.g. "0.004166666666666667 degrees"
+		value = nc.getncattr(attribute)
+		if isinstance(value, str):
+			value = value.split()[0]
+		return abs(float(value))
+	if len(centres) < 2:
+		raise ValueError("%s has a single %s cell and no %s attribute, so its cell size is unknown" % (nc.filepath(), axis, attribute))
+	return abs(float(centres[-1]) - float(centres[0])) / (len(centres) - 1)
+
+def isRawGrid(fileName):
+	'''return True if the file is a raw grid created by GEBCOReader.convertToRawGrid'''
+	try:
+		with open(fileName, 'rb') as f:
+			return f.read(len(RAW_MAGIC)) == RAW_MAGIC
+	except OSError:
+		return False
+
+def interpolationWeights(t, method):
+	'''return the weights of the neighbouring cells for fractional positions t, one row per position. Bilinear uses the cells at 0 and 1, bicubic the Catmull-Rom weights of the cells at -1, 0, 1 and 2'''
+	if method == "nearest":
+		return np.ones((len(t), 1))
+	if method == "bilinear":
+		return np.column_stack((1 - t, t))
+	t2 = t * t
+	t3 = t2 * t
+	return np.column_stack((
+		(-t3 + 2 * t2 - t) / 2,
+		(3 * t3 - 5 * t2 + 2) / 2,
+		(-3 * t3 + 4 * t2 + t) / 2,
+		(t3 - t2) / 2))
 
 if __name__ == "__main__":
 		main()
-
-##### scipy interpolator  not yet implemented####
-	# def InterpolateDepths():
-	# 	'''we may need to interpolate depths so we can work in smaller areas.  This is not ideal, but gebco is the best we have'''
-	# 	# latitude = np.array([1,2,3,4])
-	# 	# longitude = np.array([1,2,3,4,5])
-	# 	# depths = np.array([
-	# 	# 	[4,1,4,4,2],
-	# 	# 	[4,2,2,999,6],
-	# 	# 	[3,7,4,3,5],
-	# 	# 	[2,4,5,3,4]
-	# 	# ])
-	# 	# grid = RectBivariateSpline(latitude, longitude, depths)
-
-	# def GetDepthAt(self, latitude, longitude):
-	# 	z = grid.__call__(1,1)
-	# 	return grid
-
-#####END OF BLOCK####
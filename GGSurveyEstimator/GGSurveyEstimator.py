@@ -8,18 +8,36 @@
 
 import arcpy
 import geodetic
+import json
+import lineplanner
 import math
+import multiprocessing
+import numpy as np
 import os.path
 import math
 import pprint
+import soundinggrid
+import surveyreport
 import math
 import time
+import uuid
 from datetime import datetime
 from datetime import timedelta
 import os
+import sys
 
 VERSION = "5.98"
 
+#decimals written for the vertices of survey lines, as fine as the default xy resolution of a file geodatabase, 1e-9 degrees or 0.0001m
+GEOGRAPHIC_VERTEX_PLACES = 9
+GRID_VERTEX_PLACES = 4
+
+#the line count and length of each prefix are cached in this table alongside the run lines, so the entire survey totals do not need a full table scan
+SUMMARY_TABLE_SUFFIX = "_Summary"
+
+#the report samples the depth profiles of this many lines at a time, so memory stays bounded on very large plans
+PROFILE_CHUNK_LINES = 10000
+
 class Toolbox(object):
 	def __init__(self):
 		"""Define the toolbox (the name of the toolbox is the name of the .pyt file)."""
@@ -27,7 +45,7 @@ class Toolbox(object):
 		self.alias = "GG Survey Estimator Toolbox"
 
 		# List of tool classes associated with this toolbox
-		self.tools = [SurveyEstimatorTool]
+		self.tools = [SurveyEstimatorTool, BatchSurveyEstimatorTool]
 
 class SurveyEstimatorTool(object):
 	def __init__(self):
@@ -43,7 +61,7 @@ class SurveyEstimatorTool(object):
 		sse.loadConfig()
 
 		param0 = arcpy.Parameter(
-			displayName="Primary Line Spacing (m) (e.g. Spacing = Depth*MBESCoverage, or -1 to compute depths based on SSDM Survey_Sounding_Grid Feature Class)",
+			displayName="Primary Line Spacing (m) (e.g. Spacing = Depth*MBESCoverage, or -1 to compute depths based on SSDM Survey_Sounding_Grid Feature Class, or -2 to adapt the spacing of every line to the depths along the swath edge of the previous line)",
 			name="lineSpacing",
 			datatype="Field",
 			parameterType="Required",
@@ -51,7 +69,7 @@ class SurveyEstimatorTool(object):
 		param0.value = sse.lineSpacing
 
 		param1 = arcpy.Parameter(
-			displayName="MBESCoverageMultiplier (only used when autocomputing the line spacing with the Survey_Sounding_Grid, if manually setting line spacing, ignore this. Use GGGebcoExtractor to create a sounding grid!)",
+			displayName="MBESCoverageMultiplier (only used when autocomputing the line spacing (-1 or -2) with the Survey_Sounding_Grid, if manually setting line spacing, ignore this. Use GGGebcoExtractor to create a sounding grid!)",
 			name="MBESCoverageMultiplier",
 			datatype="Field",
 			parameterType="Required",
@@ -59,7 +77,7 @@ class SurveyEstimatorTool(object):
 		param1.value = sse.MBESCoverageMultiplier
 
 		param2 = arcpy.Parameter(
-			displayName="Primary Survey Line Heading (deg). Set this to -1 for the optimal line heading to be comuted, which is parallel to the long axis of the survey area.",
+			displayName="Primary Survey Line Heading (deg). Set this to -1 for the optimal line heading to be comuted, which is parallel to the long axis of the survey area. Set this to -2 to search for the heading with the shortest total survey duration.",
 			name="lineHeading",
 			datatype="Field",
 			parameterType="Required",
@@ -114,7 +132,43 @@ class SurveyEstimatorTool(object):
 			direction="Input")
 		param8.value = sse.SkipReport
 
-		params = [param0, param1, param2, param3, param4, param5, param6, param7, param8]
+		param9 = arcpy.Parameter(
+			displayName="Columnar Report. Also write the survey lines to a Parquet (needs pyarrow) or NumPy NPZ file for analysis.",
+			name="ColumnarReport",
+			datatype="GPString",
+			parameterType="Required",
+			direction="Input")
+		param9.filter.type = "ValueList"
+		param9.filter.list = ["None", "NPZ", "Parquet"]
+		param9.value = sse.ColumnarReport
+
+		param10 = arcpy.Parameter(
+			displayName="Report Scope. Current Polygon only reads the lines of this line prefix, which is much faster in a large project. Entire Survey reports every line. The entire survey totals are always reported.",
+			name="ReportScope",
+			datatype="GPString",
+			parameterType="Required",
+			direction="Input")
+		param10.filter.type = "ValueList"
+		param10.filter.list = ["Current Polygon", "Entire Survey"]
+		param10.value = sse.ReportScope
+
+		param11 = arcpy.Parameter(
+			displayName="GEBCO File (1D netCDF or raw grid) to sample the depth along every line in the report. Leave this empty to sample the Survey_Sounding_Grid instead.",
+			name="GEBCOFile",
+			datatype="DEFile",
+			parameterType="Optional",
+			direction="Input")
+		param11.value = sse.GEBCOFile or None
+
+		param12 = arcpy.Parameter(
+			displayName="Depth Sample Interval (m). The report lists the min, mean and max depth along each line, and the percentage of the line where the swath (depth * MBESCoverageMultiplier) is narrower than the line spacing. 0 to leave out the depths.",
+			name="DepthSampleInterval",
+			datatype="GPDouble",
+			parameterType="Required",
+			direction="Input")
+		param12.value = sse.DepthSampleInterval
+
+		params = [param0, param1, param2, param3, param4, param5, param6, param7, param8, param9, param10, param11, param12]
 
 		return params
 
@@ -141,6 +195,105 @@ class SurveyEstimatorTool(object):
 		sse.compute(parameters)
 		return
 
+class BatchSurveyEstimatorTool(object):
+	def __init__(self):
+		"""Define the tool (tool name is the name of the class)."""
+		self.label = "GG Hydrographic Batch Survey Estimator " + VERSION
+		self.description = "Compute a hydrographic survey line plan for every polygon in a layer, with each block planned in a worker process"
+		self.canRunInBackground = False
+
+	def getParameterInfo(self):
+		"""Define parameter definitions"""
+
+		sse = surveyEstimator()
+		sse.loadConfig()
+
+		param0 = arcpy.Parameter(
+			displayName="Survey Blocks. Every polygon in this layer is planned as a separate block, or only the selected polygons if there is a selection.",
+			name="surveyBlocks",
+			datatype="GPFeatureLayer",
+			parameterType="Required",
+			direction="Input")
+
+		param1 = arcpy.Parameter(
+			displayName="Primary Line Spacing (m)",
+			name="lineSpacing",
+			datatype="Field",
+			parameterType="Required",
+			direction="Input")
+		param1.value = sse.lineSpacing
+
+		param2 = arcpy.Parameter(
+			displayName="Primary Survey Line Heading (deg). Set this to -1 to use the long axis of each block, or -2 to search for the heading with the shortest duration of each block.",
+			name="lineHeading",
+			datatype="Field",
+			parameterType="Required",
+			direction="Input")
+		param2.value = sse.lineHeading
+
+		param3 = arcpy.Parameter(
+			displayName="LinePrefix.  The lines of each block are prefixed LinePrefix_B<ObjectID>.  Keep this short, as line names are limited to 20 characters.",
+			name="linePrefix",
+			datatype="Field",
+			parameterType="Required",
+			direction="Input")
+		param3.value = sse.linePrefix
+
+		param4 = arcpy.Parameter(
+			displayName="Vessel Speed in Knots.  This is used to compute the duration of the survey.",
+			name="vesselSpeedInKnots",
+			datatype="Field",
+			parameterType="Required",
+			direction="Input")
+		param4.value = sse.vesselSpeedInKnots
+
+		param5 = arcpy.Parameter(
+			displayName="Turn Duration in Minutes. This is used to compute the duration of the survey",
+			name="turnDuration",
+			datatype="Field",
+			parameterType="Required",
+			direction="Input")
+		param5.value = sse.turnDuration
+
+		param6 = arcpy.Parameter(
+			displayName="CrossLine Multiplier (e.g. 15 times primary line spacing, 0 for no crosslines)",
+			name="crossLineMultiplier",
+			datatype="Field",
+			parameterType="Required",
+			direction="Input")
+		param6.value = sse.crossLineMultiplier
+
+		param7 = arcpy.Parameter(
+			displayName="Worker Processes. The number of blocks planned at the same time, 0 for one per cpu.",
+			name="workers",
+			datatype="GPLong",
+			parameterType="Required",
+			direction="Input")
+		param7.value = 0
+
+		param8 = arcpy.Parameter(
+			displayName="Skip the generation of reports.",
+			name="SkipReport",
+			datatype="Boolean",
+			parameterType="Required",
+			direction="Input")
+		param8.value = sse.SkipReport
+
+		params = [param0, param1, param2, param3, param4, param5, param6, param7, param8]
+
+		return params
+
+	def isLicensed(self):
+		"""Set whether tool is licensed to execute."""
+		return True
+
+	def execute(self, parameters, messages):
+		"""Compute a survey line plan for every polygon in the input layer."""
+		arcpy.AddMessage ("#####GG Batch Survey Estimator : %s #####" % (VERSION))
+		sse = surveyEstimator()
+		sse.computeBatch(parameters)
+		return
+
 class surveyEstimator:
 	'''Class to estimate hydrogrpahic survey durations using a polygon and some user specified criteria.  Output is a line plan and csv sheet ready for Excel.'''
 	def __init__(self):
@@ -154,6 +307,10 @@ class surveyEstimator:
 		self.crossLineMultiplier = "15"
 		self.GenerateReport = "False"
 		self.SkipReport = "True"
+		self.ColumnarReport = "None"
+		self.ReportScope = "Entire Survey"
+		self.GEBCOFile = ""
+		self.DepthSampleInterval = "250"
 
 		return
 
@@ -172,6 +329,10 @@ class surveyEstimator:
 				self.crossLineMultiplier		= f.readline().strip()
 				self.GenerateReport				= f.readline().strip()
 				self.SkipReport					= f.readline().strip()
+				self.ColumnarReport				= f.readline().strip() or "None"
+				self.ReportScope				= f.readline().strip() or "Entire Survey"
+				self.GEBCOFile					= f.readline().strip()
+				self.DepthSampleInterval		= f.readline().strip() or "250"
 		except :
 			return
 
@@ -187,6 +348,10 @@ class surveyEstimator:
 			f.write(str(self.crossLineMultiplier) + "\n")
 			f.write(str(self.GenerateReport) + "\n")
 			f.write(str(self.SkipReport) + "\n")
+			f.write(str(self.ColumnarReport) + "\n")
+			f.write(str(self.ReportScope) + "\n")
+			f.write(str(self.GEBCOFile) + "\n")
+			f.write(str(self.DepthSampleInterval) + "\n")
 			f.close()
 		except :
 			return
@@ -206,6 +371,10 @@ class surveyEstimator:
 		crossLineMultiplier		= float(parameters[6].valueAsText)
 		reportAction			= parameters[7].valueAsText
 		skipReport				= parameters[8].valueAsText
+		columnarReport			= parameters[9].valueAsText
+		reportScope				= parameters[10].valueAsText
+		gebcoFile				= parameters[11].valueAsText or ""
+		depthSampleInterval		= float(parameters[12].valueAsText or 0)
 		polygonIsGeographic		= False #used to manage both grid and geographical polygons, so we can compute both with ease.
 		projectName				= arcpy.env.workspace
 		targetFCName			= "Proposed_Survey_Run_Lines" #Official SSDM V2 FC name
@@ -220,6 +389,10 @@ class surveyEstimator:
 		self.crossLineMultiplier	= crossLineMultiplier
 		self.reportAction			= reportAction
 		self.skipReport				= skipReport
+		self.ColumnarReport			= columnarReport
+		self.ReportScope			= reportScope
+		self.GEBCOFile				= gebcoFile
+		self.DepthSampleInterval	= depthSampleInterval
 		self.polygonIsGeographic	= polygonIsGeographic
 		self.projectName			= projectName
 		self.targetFCName			= targetFCName
@@ -232,7 +405,7 @@ class surveyEstimator:
 			arcpy.AddMessage ("No selected polygon to process, exiting...")
 			exit(1)
 
-		if lineSpacing == 0 or lineSpacing < -1:
+		if lineSpacing == 0 or lineSpacing < -2:
 			arcpy.AddMessage ("Please select a sensible line spacing and try again!")
 			exit(1)
 
@@ -263,7 +436,7 @@ class surveyEstimator:
 
 		if reportAction == 'true':
 			#now export the features to a CSV...
-			self.FC2CSV(targetFCName, vesselSpeedInKnots, turnDuration, lineSpacing, lineHeading, polygonIsGeographic, linePrefix, skipReport)
+			self.FC2CSV(targetFCName, vesselSpeedInKnots, turnDuration, lineSpacing, lineHeading, polygonIsGeographic, linePrefix, skipReport, columnarReport, reportScope, MBESCoverageMultiplier, gebcoFile, depthSampleInterval)
 			return
 
 		#test to ensure a GDB is attached to the project
@@ -273,12 +446,6 @@ class surveyEstimator:
 		if not self.checkRunlineFCExists(targetFCName, spatialReference):
 			return 1
 
-		TMPName = "TempLines" #Temporary featureclass for the unclipped survey line computation loops. This gets cleared out at the end.
-		self.checkRunlineFCExists(TMPName, spatialReference)
-
-		ClippedName = "TempClipped" #Temporary featureclass for clipping results. This gets compied into the SSDM layer at the end and then cleared out
-		self.checkRunlineFCExists(ClippedName, spatialReference)
-
 		# find the user selected polygon from which we can conduct the estimation.
 		polyClipper = self.getSurveyArea(sourceFCName)
 
@@ -293,77 +460,237 @@ class surveyEstimator:
 		polygonCentroidX = polyClipper[0].centroid.X
 		polygonCentroidY = polyClipper[0].centroid.Y
 
-		#compute the long axis...
-		polygonDiagonalLength = math.hypot(polyClipper[0].extent.XMax - polyClipper[0].extent.XMin, polyClipper[0].extent.YMax - polyClipper[0].extent.YMin )
-		arcpy.AddMessage("Diagonal Length of input polygon: %.3f" % (polygonDiagonalLength))
+		depthGrid = None
+		if lineSpacing == -2:
+			depthGrid = self.loadSoundingGrid("Survey_Sounding_Grid", spatialReference, polyClipper, polygonIsGeographic)
+			if depthGrid is None:
+				arcpy.AddMessage("!!!!!!Will default to a 1000m line spacing so you get some form of result!!!!!!")
+				lineSpacing = 1000
 
-		#
-		#if lineHeading == -2:
-		#	lineHeading = self.computeOptimalHeadingandDuration(polyClipper, polygonIsGeographic)
-		#	if polygonIsGeographic:
-		#		polygonDiagonalLength = geodetic.degreesToMetres(polygonDiagonalLength)
-		#	for i in range(0,360,30):
-		#		lineHeading = i
-		#		arcpy.AddMessage ("Computing Primary Survey Lines for line heading:%d" % (i))
-		#		self.computeSurveyLines (polygonCentroidX, polygonCentroidY, lineSpacing, lineHeading, polygonDiagonalLength, polygonIsGeographic, spatialReference, linePrefix, projectName, TMPName)
-		#		#clip the lines from the TMP to the Clipped FC
-		#		arcpy.AddMessage ("Clipping to polygon...")
-		#		arcpy.Clip_analysis(TMPName, polyClipper, ClippedName)
-		#
-				##append the clipped lines into the final FC
-				#arcpy.Append_management(ClippedName, targetFCName)
-
-				#clean up
-#				arcpy.DeleteFeatures_management(TMPName)
-#				arcpy.DeleteFeatures_management(ClippedName)
+		if lineHeading == -2:
+			lineHeading = self.computeMinimumDurationHeading(polyClipper, lineSpacing, crossLineMultiplier, vesselSpeedInKnots, turnDuration, polygonIsGeographic, depthGrid, MBESCoverageMultiplier)
 
 		arcpy.AddMessage("Creating Survey Plan...")
 
+		# geographic polygons are projected into a local grid centred on the centroid, so both are planned the same way
+		polygonX, polygonY = self.getPolygonCoordinates(polyClipper[0])
 		if polygonIsGeographic:
-			arcpy.AddMessage ("Layer is Geographicals...")
-			polygonDiagonalLength = geodetic.degreesToMetres(polygonDiagonalLength)
-			arcpy.AddMessage("Diagonal Length of input polygon: %.3f" % (polygonDiagonalLength))
-			# numlines = math.ceil(polygonDiagonalLength / geodetic.metresToDegrees(float(lineSpacing)))
-			numlines = math.ceil(polygonDiagonalLength / float(lineSpacing))
+			arcpy.AddMessage ("Layer is Geographicals, planning in a local transverse mercator grid...")
+			gridX, gridY = geodetic.geographicalsToLocalGrid(polygonX, polygonY, polygonCentroidX, polygonCentroidY)
 		else:
 			arcpy.AddMessage ("Layer is Grid NOT Geographicals...")
+			gridX, gridY = polygonX, polygonY
+
+		#compute the long axis...
+		polygonDiagonalLength = math.hypot(np.nanmax(gridX) - np.nanmin(gridX), np.nanmax(gridY) - np.nanmin(gridY))
+		arcpy.AddMessage("Diagonal Length of input polygon: %.3f" % (polygonDiagonalLength))
+		if depthGrid is None:
 			numlines = math.ceil(polygonDiagonalLength / float(lineSpacing))
-		arcpy.AddMessage("Line spacing: %.3f" % (lineSpacing))
-		arcpy.AddMessage ("Number of potential lines for clipping:" +str(numlines))
+			arcpy.AddMessage("Line spacing: %.3f" % (lineSpacing))
+			arcpy.AddMessage ("Number of potential lines for clipping:" +str(numlines))
+		else:
+			arcpy.AddMessage("Line spacing: adapted to depth with a coverage multiplier of %.1f" % (MBESCoverageMultiplier))
+
+		# compare the inputs with the previous run of this prefix, so we only replan what has changed
+		fingerprint = lineplanner.planFingerprint(polygonX, polygonY, lineSpacing, lineHeading, crossLineMultiplier, linePrefix, polygonCentroidX, polygonCentroidY, polygonIsGeographic)
+		fingerprints = self.loadPlanFingerprints()
+		fingerprintKey = targetFCName + "/" + linePrefix
+		previous = fingerprints.get(fingerprintKey)
+		if not self.replanSurveyLines(previous, fingerprint, polygonX, polygonY, targetFCName, spatialReference, projectName, vesselSpeedInKnots, turnDuration):
+			# clear the previous survey lines with the same prefix, so we do not double up
+			self.deleteSurveyLines(targetFCName, [linePrefix, linePrefix + "_X"])
+
+			# lines are planned and clipped in memory by the line planner, so we only touch the geodatabase to write the results
+			arcpy.AddMessage ("Computing Primary and Cross Survey Lines...")
+			plan = lineplanner.planSurveyLines(polygonX, polygonY, lineSpacing, lineHeading, crossLineMultiplier, vesselSpeedInKnots, turnDuration, linePrefix, polygonCentroidX, polygonCentroidY, polygonIsGeographic, depthGrid, MBESCoverageMultiplier)
+			primary = np.array(plan.linePrefixes) == linePrefix
+			if depthGrid is not None and np.any(primary):
+				arcpy.AddMessage("Adaptive line spacing from %.1f to %.1f m" % (np.min(plan.lineSpacings[primary]), np.max(plan.lineSpacings[primary])))
+			fingerprint["runId"] = self.createRunId()
+			self.writeSurveyLines(plan, targetFCName, spatialReference, projectName, fingerprint["runId"])
+			arcpy.AddMessage ("%d Lines created" % (plan.lineCount()))
+			fingerprint["lineCount"] = plan.lineCount()
+		fingerprints[fingerprintKey] = fingerprint
+		self.savePlanFingerprints(fingerprints)
+		self.updateSurveySummary(targetFCName, [linePrefix, linePrefix + "_X"], polygonIsGeographic)
 
-		# clear the previous survey lines with the same prefix, so we do not double up
-		self.deleteSurveyLines(targetFCName, sourceFCName, linePrefix)
+		#add ther resulting estimation to the map.
+		self.addResultsToMap(targetFCName)
 
-		# now run the computation on the PRIMARY lines...
-		arcpy.AddMessage ("Computing Primary Survey Lines...")
-		self.computeSurveyLines (polygonCentroidX, polygonCentroidY, lineSpacing, lineHeading, polygonDiagonalLength, polygonIsGeographic, spatialReference, linePrefix, projectName, TMPName)
+		#now export the features to a CSV...
+		self.FC2CSV(targetFCName, vesselSpeedInKnots, turnDuration, lineSpacing, lineHeading, polygonIsGeographic, linePrefix, skipReport, columnarReport, reportScope, MBESCoverageMultiplier, gebcoFile, depthSampleInterval)
 
-		# now run the computation on the CROSS lines...
-		if crossLineMultiplier > 0:
-			arcpy.AddMessage ("Computing Cross Lines...")
-			hdg = geodetic.normalize360(lineHeading+90)
-			crosslineSpacing = lineSpacing*crossLineMultiplier
-			self.computeSurveyLines (polygonCentroidX, polygonCentroidY, crosslineSpacing, hdg, polygonDiagonalLength, polygonIsGeographic, spatialReference, linePrefix+"_X", projectName, TMPName)
+		self.saveConfig()
 
-		#clip the lines from the TMP to the Clipped FC
-		arcpy.AddMessage ("Clipping to polygon...")
-		arcpy.Clip_analysis(TMPName, polyClipper, ClippedName)
+		return
 
-		#append the clipped lines into the final FC
-		arcpy.Append_management(ClippedName, targetFCName)
+	def replanSurveyLines(self, previous, fingerprint, polygonX, polygonY, targetFCName, spatialReference, projectName, vesselSpeedInKnots, turnDuration):
+		'''replan only what has changed since the previous plan with the same prefix, and return False if the whole plan needs to be recomputed.
+		A change of speed or turn duration only needs the report. A change of cross line multiplier only replans the cross lines. An edit to the polygon only replans the lines which cross the edited edges'''
+		if previous is None:
+			return False
+		#depth adapted lines depend on the soundings as well as the inputs, so they are always replanned
+		if fingerprint["lineSpacing"] < 0:
+			return False
+		for key in ("lineSpacing", "lineHeading", "isGeographic"):
+			if previous.get(key) != fingerprint[key]:
+				return False
 
-		#clean up
-		arcpy.DeleteFeatures_management(TMPName)
-		arcpy.DeleteFeatures_management(ClippedName)
+		linePrefix = fingerprint["linePrefix"]
+		crossPrefix = linePrefix + "_X"
+		if self.countSurveyLines(targetFCName, [linePrefix, crossPrefix]) != previous.get("lineCount"):
+			arcpy.AddMessage("The line plan has been edited since it was computed, so all lines will be replanned...")
+			return False
+
+		#keep the lines on the same offsets as the previous plan, even if the edit has moved the centroid. The replanned lines stay part of the previous run
+		runId = fingerprint["runId"] = previous.get("runId")
+		originX = fingerprint["originX"] = previous["originX"]
+		originY = fingerprint["originY"] = previous["originY"]
+		isGeographic = fingerprint["isGeographic"]
+		lineSpacing = fingerprint["lineSpacing"]
+		lineHeading = fingerprint["lineHeading"]
+		crossLineMultiplier = fingerprint["crossLineMultiplier"]
+		polygonChanged = previous["polygonHash"] != fingerprint["polygonHash"]
+		crossLinesChanged = previous["crossLineMultiplier"] != crossLineMultiplier
+		lineCount = previous["lineCount"]
+
+		lineSets = [(linePrefix, lineSpacing, lineHeading)]
+		if crossLineMultiplier > 0 and not crossLinesChanged:
+			lineSets.append((crossPrefix, lineSpacing * crossLineMultiplier, geodetic.normalize360(lineHeading + 90)))
+
+		if polygonChanged:
+			for prefix, spacing, heading in lineSets:
+				offsetRange = lineplanner.editedOffsetRange(previous["polygonX"], previous["polygonY"], polygonX, polygonY, heading, originX, originY, isGeographic)
+				if offsetRange is None:
+					continue
+				arcpy.AddMessage("Polygon has been edited, replanning %s lines between offsets %.1f and %.1f..." % (prefix, offsetRange[0], offsetRange[1]))
+				lineNames = [lineplanner.lineName(prefix, k * spacing) for k in range(math.ceil(offsetRange[0] / spacing), math.floor(offsetRange[1] / spacing) + 1)]
+				lineCount -= self.deleteSurveyLineNames(targetFCName, prefix, lineNames)
+				plan = lineplanner.planLineSet(polygonX, polygonY, spacing, heading, vesselSpeedInKnots, turnDuration, prefix, originX, originY, isGeographic, offsetRange)
+				self.writeSurveyLines(plan, targetFCName, spatialReference, projectName, runId)
+				lineCount += plan.lineCount()
+
+		if crossLinesChanged:
+			arcpy.AddMessage("Cross line multiplier has changed, replanning the cross lines only...")
+			lineCount -= self.deleteSurveyLineNames(targetFCName, crossPrefix)
+			if crossLineMultiplier > 0:
+				plan = lineplanner.planLineSet(polygonX, polygonY, lineSpacing * crossLineMultiplier, geodetic.normalize360(lineHeading + 90), vesselSpeedInKnots, turnDuration, crossPrefix, originX, originY, isGeographic)
+				self.writeSurveyLines(plan, targetFCName, spatialReference, projectName, runId)
+				lineCount += plan.lineCount()
+
+		if not polygonChanged and not crossLinesChanged:
+			arcpy.AddMessage("Line plan is unchanged, updating the report only...")
+		fingerprint["lineCount"] = lineCount
+		arcpy.AddMessage ("%d Lines in the plan" % (lineCount))
+		return True
 
-		#add ther resulting estimation to the map.
-		self.addResultsToMap(targetFCName)
+	def planFingerprintFileName(self):
+		'''the plan fingerprints are kept in a JSON file alongside the geodatabase'''
+		workspace = arcpy.env.workspace
+		return os.path.join(os.path.dirname(workspace), os.path.splitext(os.path.basename(workspace))[0] + "_survey_plans.json")
 
-		#now export the features to a CSV...
-		self.FC2CSV(targetFCName, vesselSpeedInKnots, turnDuration, lineSpacing, lineHeading, polygonIsGeographic, linePrefix, skipReport)
+	def loadPlanFingerprints(self):
+		try:
+			with open(self.planFingerprintFileName()) as f:
+				return json.load(f)
+		except :
+			return {}
 
-		self.saveConfig()
+	def savePlanFingerprints(self, fingerprints):
+		try:
+			with open(self.planFingerprintFileName(), 'w') as f:
+				json.dump(fingerprints, f)
+		except :
+			arcpy.AddMessage("Unable to save the plan fingerprints, the next run will replan all lines.")
 
+	def computeBatch(self, parameters):
+		'''computes a survey line plan for every polygon in a layer, planning each block in a worker process'''
+		sourceFCName			= parameters[0].valueAsText
+		lineSpacing				= float(parameters[1].valueAsText)
+		lineHeading				= float(parameters[2].valueAsText)
+		linePrefix				= parameters[3].valueAsText
+		vesselSpeedInKnots		= float(parameters[4].valueAsText)
+		turnDuration			= float(parameters[5].valueAsText) / 60.0
+		crossLineMultiplier		= float(parameters[6].valueAsText)
+		workers					= int(parameters[7].valueAsText)
+		skipReport				= parameters[8].valueAsText
+		polygonIsGeographic		= False
+		projectName				= arcpy.env.workspace
+		targetFCName			= "Proposed_Survey_Run_Lines" #Official SSDM V2 FC name
+
+		if lineSpacing <= 0:
+			arcpy.AddMessage ("Please select a sensible line spacing and try again!")
+			exit(1)
+
+		if vesselSpeedInKnots <= 0:
+			arcpy.AddMessage ("Please select a sensible vessel speed and try again!")
+			exit(1)
+
+		spatialReference = arcpy.Describe(sourceFCName).spatialReference
+		arcpy.AddMessage("Spatial Reference: %s" % (spatialReference.name))
+		if spatialReference.type == "Geographic":
+			polygonIsGeographic = True
+
+		#test to ensure a GDB is attached to the project
+		if not self.checkGDBExists():
+			return 1
+		#test to ensure the OUTPUT polyline featureclass exists in the SSDM format + create if not
+		if not self.checkRunlineFCExists(targetFCName, spatialReference):
+			return 1
+
+		blocks = []
+		sCursor = arcpy.da.SearchCursor(sourceFCName, ["OID@", "SHAPE@"])
+		for row in sCursor:
+			polygonX, polygonY = self.getPolygonCoordinates(row[1])
+			blocks.append((row[0], polygonX, polygonY))
+		del sCursor
+		arcpy.AddMessage ("Survey blocks to plan: %d" % (len(blocks)))
+		if len(blocks) == 0:
+			return 1
+
+		useWorkerInterpreter()
+
+		# clear the lines of the previous batch with the same prefix, so we do not double up
+		fingerprints = self.loadPlanFingerprints()
+		fingerprintKey = targetFCName + "/" + linePrefix + "_B"
+		self.deleteSurveyLines(targetFCName, [linePrefix + "_B%"])
+
+		arcpy.AddMessage ("Computing Primary and Cross Survey Lines...")
+		plan, blockPlans = lineplanner.planSurveyBatch(blocks, lineSpacing, lineHeading, crossLineMultiplier, vesselSpeedInKnots, turnDuration, linePrefix, polygonIsGeographic, workers or None)
+		runId = self.createRunId()
+		self.writeSurveyLines(plan, targetFCName, spatialReference, projectName, runId)
+		arcpy.AddMessage ("%d Lines created" % (plan.lineCount()))
+		fingerprints[fingerprintKey] = {"runId": runId, "lineCount": plan.lineCount()}
+		self.savePlanFingerprints(fingerprints)
+		self.updateSurveySummary(targetFCName, [linePrefix + "_B%"], polygonIsGeographic)
+
+		report = ""
+		for (blockName, polygonX, polygonY), blockPlan in zip(blocks, blockPlans):
+			arcpy.AddMessage(lineplanner.summaryReport("Block %s Results" % (blockName), blockPlan.lineCount(), blockPlan.totalLength(), blockPlan.totalDuration()))
+			report += str("%s,%d,%.3f,%.3f,%.3f\n" % (blockName, blockPlan.lineCount(), blockPlan.totalLength()/1000, blockPlan.totalDuration(), blockPlan.totalDuration()/24))
+		report += str("Entire Survey,%d,%.3f,%.3f,%.3f\n" % (plan.lineCount(), plan.totalLength()/1000, plan.totalDuration(), plan.totalDuration()/24))
+
+		msg = lineplanner.summaryReport("Entire Survey Results", plan.lineCount(), plan.totalLength(), plan.totalDuration())
+		copy2clip(msg)
+		arcpy.AddMessage("##########################")
+		arcpy.AddMessage(msg)
+		arcpy.AddMessage("##########################")
+
+		if skipReport == 'false':
+			csvname = os.path.dirname(arcpy.env.workspace) + "\\" + "Proposed_Survey_Blocks.csv"
+			csvname = createOutputFileName(csvname)
+
+			arcpy.AddMessage("writing results to file: %s" % (csvname))
+			file = open(csvname, 'w')
+			hdr = "block,linecount,length(km),duration(h),duration(days)\n"
+			file.write(hdr)
+			file.write(report)
+			file.close()
+			#now open the file for the user...
+			os.startfile('"' + csvname + '"')
+
+		#add ther resulting estimation to the map.
+		self.addResultsToMap(targetFCName)
 		return
 
 	def	addResultsToMap(self, targetFCName):
@@ -395,6 +722,40 @@ class surveyEstimator:
 		arcpy.AddMessage("oops, no selected polygon in the source featureclass.  Please select a polygon and try again")
 		return None
 
+	def getPolygonCoordinates(self, polygon):
+		'''convert an arcpy polygon into coordinate arrays for the line planner.  Parts and interior rings are separated by NaN'''
+		xc=[]
+		yc=[]
+		for part in polygon:
+			for pnt in part:
+				if pnt:
+					xc.append(pnt.X)
+					yc.append(pnt.Y)
+				else:
+					# If pnt is None, this represents an interior ring
+					xc.append(math.nan)
+					yc.append(math.nan)
+			xc.append(math.nan)
+			yc.append(math.nan)
+		return xc, yc
+
+	def writeSurveyLines(self, plan, targetFCName, spatialReference, projectName, runId=None):
+		'''write a line plan computed by the line planner into the featureclass through a single cursor. Lines split by the polygon are written as multipart polylines. Every line is tagged with the runId of the run which wrote it'''
+		#the geometry of every line is computed up front, and the fields which are the same for the whole run only once
+		shapes = plan.lineWKT(GEOGRAPHIC_VERTEX_PLACES if spatialReference.type == "Geographic" else GRID_VERTEX_PLACES)
+		preparedDate = datetime.now()
+		userName = (self.get_username() or "")[:50]
+		projectName = projectName[:250]
+
+		#limit the string size so it does not crash
+		rows = [(shapes[line], plan.linePrefixes[line][:20], plan.lineNames[line][:20], float(plan.lineHeadings[line]), projectName, userName, preparedDate, str(plan.lineSpacings[line]), plan.lineBlocks[line][:50] or None, runId) for line in range(plan.lineCount())]
+		fields = ["SHAPE@WKT", "LINE_PREFIX", "LINE_NAME", "LINE_DIRECTION", "PROJECT_NAME", "PREPARED_BY", "PREPARED_DATE", "REMARKS", "SURVEY_BLOCK_NAME", "RUN_ID"]
+
+		cursor = arcpy.da.InsertCursor(targetFCName, fields)
+		for row in rows:
+			cursor.insertRow(row)
+		del cursor
+
 	def getSourceFeatureClassName(self):
 		'''search through all the layers in the GIS and find the layer name with a selected feature. If there is no selected feature return an empty string '''
 		aprx = arcpy.mp.ArcGISProject("current")
@@ -411,45 +772,6 @@ class surveyEstimator:
 			arcpy.AddMessage ("!!!!Oops.  Problem finding a valid layer.  Please select a polygon for processing and try again!!!!")
 			return ""
 
-	def computeSurveyLines (self, polygonCentroidX, polygonCentroidY, lineSpacing, lineHeading, polygonDiagonalLength, polygonIsGeographic, spatialReference, linePrefix, projectName, targetFCName):
-		''' compute a survey line plan and add it to the featureclass'''
-		lineCount = 0
-		cursor = arcpy.da.InsertCursor(targetFCName, ["SHAPE@", "LINE_PREFIX", "LINE_NAME", "LINE_DIRECTION", "PROJECT_NAME", "PREPARED_BY", "PREPARED_DATE", "REMARKS"])
-		#do the CENTRELINE
-		x2, y2, x3, y3 = self.CalcLineFromPoint(polygonCentroidX, polygonCentroidY, lineHeading, polygonDiagonalLength, polygonIsGeographic)
-		lineName = linePrefix + "_Centreline"
-		polyLine = self.addPolyline(cursor, x2, y2, x3, y3, targetFCName, spatialReference, linePrefix, lineName, float(lineHeading), projectName, lineSpacing)
-		arcpy.AddMessage ("Centreline created")
-		lineCount += 1
-
-		#do the Starboard Lines
-		offset = lineSpacing
-		while (offset < polygonDiagonalLength):
-			#newCentreX, newCentreY = self.CalcGridCoord(polygonCentroidX, polygonCentroidY, lineHeading - 90.0, offset)
-			newCentreX, newCentreY = geodetic.calculateCoordinateFromRangeBearing(polygonCentroidX, polygonCentroidY, offset, lineHeading - 90.0, polygonIsGeographic)
-			x2, y2, x3, y3 = self.CalcLineFromPoint(newCentreX, newCentreY, lineHeading, polygonDiagonalLength, polygonIsGeographic)
-			lineName = linePrefix + "_S" + str("%.1f" %(offset))
-			polyLine = self.addPolyline(cursor, x2, y2, x3, y3, targetFCName, spatialReference, linePrefix, lineName, float(lineHeading), projectName, lineSpacing)
-			offset = offset + lineSpacing
-			lineCount += 1
-			if lineCount % 25 == 0:
-				arcpy.AddMessage ("Computing Starboard Survey Lines for potential offset at: %dm" % (lineCount))
-
-		#do the PORT Lines
-		offset = -lineSpacing
-		while (offset > -polygonDiagonalLength):
-			#newCentreX, newCentreY = self.CalcGridCoord(polygonCentroidX, polygonCentroidY, lineHeading - 90.0, offset)
-			newCentreX, newCentreY = geodetic.calculateCoordinateFromRangeBearing(polygonCentroidX, polygonCentroidY, offset, lineHeading - 90.0, polygonIsGeographic)
-			x2, y2, x3, y3 = self.CalcLineFromPoint(newCentreX, newCentreY, lineHeading, polygonDiagonalLength, polygonIsGeographic)
-			lineName = linePrefix + "_P" + str("%.1f" %(offset))
-			polyLine = self.addPolyline(cursor, x2, y2, x3, y3, targetFCName, spatialReference, linePrefix, lineName, float(lineHeading), projectName, lineSpacing)
-			offset = offset - lineSpacing
-			lineCount += 1
-			if lineCount % 25 == 0:
-				arcpy.AddMessage ("Computing Port Survey Lines for potential offset at: %dm" % (lineCount))
-
-		arcpy.AddMessage ("%d Lines created" % (lineCount))
-
 	def checkGDBExists(self):
 		# check the output FGDB is in place
 		if os.path.exists(arcpy.env.workspace):
@@ -550,10 +872,12 @@ class surveyEstimator:
 				("APPROVED_BY", "TEXT", None, None, 50, "", "NULLABLE", "NON_REQUIRED"),
 				("APPROVED_DATE", "DATE", None, None, None, "", "NULLABLE", "NON_REQUIRED"),
 				("LAYER", "TEXT", None, None, 255, "", "NULLABLE", "NON_REQUIRED"),
+				("RUN_ID", "TEXT", None, None, 50, "Run ID", "NULLABLE", "NON_REQUIRED"),
 				)
 				fc = arcpy.CreateFeatureclass_management(arcpy.env.workspace, targetFCName, "POLYLINE", None, None, None, spatialReference)
 				for fc_field in fc_fields:
 					arcpy.AddField_management(targetFCName, fc_field[0], fc_field[1], fc_field[2], fc_field[3], fc_field[4], fc_field[5], fc_field[6], fc_field[7])
+				self.checkRunlineIndexes(targetFCName)
 				return fc
 			except Exception as e:
 				print(e)
@@ -561,6 +885,7 @@ class surveyEstimator:
 				return False
 		else:
 			arcpy.AddMessage("FC %s already exists, will use it." % (targetFCName))
+			self.checkRunlineIndexes(targetFCName)
 			return True
 
 	def checkSoundingGridFCExists(self, targetFCName, spatialReference):
@@ -601,93 +926,225 @@ class surveyEstimator:
 			arcpy.AddMessage("FC %s already exists, will use it." % (targetFCName))
 			return True
 
-	def addPolyline(self, cursor, x1, y1, x2, y2, targetFCName, spatialReference, linePrefix, lineName, lineDirection, projectName, layerComment):
-		'''add a survey line to the geodatabase'''
-		#http://pro.arcgis.com/en/pro-app/arcpy/get-started/writing-geometries.htm
-
-		# arcpy.AddMessage("%f %f %f %f" %(x1, y1, x2, y2))
-		# cursor = arcpy.da.InsertCursor(targetFCName, ["SHAPE@", "LINE_PREFIX", "LINE_NAME", "LINE_DIRECTION", "PROJECT_NAME", "PREPARED_BY", "PREPARED_DATE", "REMARKS"])
-		array = arcpy.Array([arcpy.Point(x1,y1), arcpy.Point(x2,y2)])
-		polyline = arcpy.Polyline(array, spatialReference)
-
-		preparedDate = datetime.now()
-		userName = self.get_username()
-		#limit the string size so it does not crash
-		cursor.insertRow((polyline, linePrefix[:20], lineName[:20], lineDirection, projectName[:250], userName[:50], preparedDate, str(layerComment) ))
-		return polyline
-
-	def CalcLineFromPoint(self, centreX, centreY, bearing,  rng, polygonIsGeographic):
-		x2, y2 = geodetic.calculateCoordinateFromRangeBearing(centreX, centreY, rng, bearing, polygonIsGeographic)
-		x3, y3 = geodetic.calculateCoordinateFromRangeBearing(centreX, centreY, rng*-1.0, bearing, polygonIsGeographic)
-		return (x2, y2, x3, y3)
-
 	def CalcGridCoord(self, x1, y1, bearing, rng):
 		x2 = x1 + (math.cos(math.radians(270 - bearing)) * rng)
 		y2 = y1 + (math.sin(math.radians(270 - bearing)) * rng)
 		return (x2, y2)
 
-	def deleteSurveyLines(self, targetFCName, sourceFCName, linePrefix):
-		arcpy.AddMessage("Clearing out existing lines from layer: %s with prefix %s" % (sourceFCName, linePrefix))
-		whereclause = "LINE_PREFIX LIKE '%" + linePrefix + "%'"
-		arcpy.SelectLayerByAttribute_management (targetFCName, "NEW_SELECTION", whereclause)
-		arcpy.DeleteRows_management(targetFCName)
-
-	def get_username(self):
-		return os.getenv('username')
+	def checkRunlineIndexes(self, targetFCName):
+		'''make sure the RUN_ID field and the attribute indexes used to find and delete lines exist, adding them to featureclasses made by earlier versions. File geodatabases only index single fields, so each field gets its own index'''
+		try:
+			fieldNames = [field.name.upper() for field in arcpy.ListFields(targetFCName)]
+			if "RUN_ID" not in fieldNames:
+				arcpy.AddMessage("Adding RUN_ID field to %s..." % (targetFCName))
+				arcpy.AddField_management(targetFCName, "RUN_ID", "TEXT", None, None, 50, "Run ID", "NULLABLE", "NON_REQUIRED")
+			indexNames = [index.name.upper() for index in arcpy.ListIndexes(targetFCName)]
+			for fieldName in ("LINE_PREFIX", "LINE_NAME", "RUN_ID"):
+				if ("IDX_" + fieldName) not in indexNames:
+					arcpy.AddMessage("Adding attribute index on %s..." % (fieldName))
+					arcpy.AddIndex_management(targetFCName, [fieldName], "IDX_" + fieldName)
+		except Exception as e:
+			arcpy.AddMessage("Unable to add the attribute indexes to %s, continuing without them: %s" % (targetFCName, e))
 
-	def FC2CSV(self, targetFCName, vesselSpeedInKnots, turnDuration, lineSpacing, lineHeading, polygonIsGeographic, linePrefix, skipReport):
-		'''read through the featureclass and convert the file to a CSV so we can open it in Excel and complete the survey estimation process'''
-		currentPolygonDuration	= 0
-		currentPolygonLineLength= 0
-		currentPolygonLineCount	= 0
-		currentlineSpacing 		= 0
+	def deleteSurveyLines(self, targetFCName, linePrefixes):
+		'''delete the lines of the previous run, matched on the exact prefix alone so the LINE_PREFIX index serves the query. The match is exact, so a prefix of area6 no longer deletes area61. A prefix ending in % matches every prefix which starts with it, which is how the blocks of a batch are found. The lines are selected once and deleted in bulk, or the featureclass is truncated if they are all of it. Returns the number of lines deleted'''
+		whereclause = self.prefixWhereClause(linePrefixes)
 
-		entireSurveyDuration	= 0
-		entireSurveyLineLength	= 0
-		entireSurveyLineCount	= 0
-		report = ""
-
-		speed = vesselSpeedInKnots *(1852/3600) #convert from knots to metres/second
-		sCursor = arcpy.da.SearchCursor(targetFCName, ["SHAPE@", "LINE_NAME", "LINE_DIRECTION", "REMARKS", "LINE_PREFIX"])
-		for row in sCursor:
-			if polygonIsGeographic:
-				lineLength = geodetic.degreesToMetres(float(row[0].length))
+		arcpy.AddMessage("Clearing out existing lines from layer: %s with prefix %s" % (targetFCName, ", ".join(linePrefixes)))
+		layerName = "SurveyLinesToDelete"
+		arcpy.MakeFeatureLayer_management(targetFCName, layerName, whereclause)
+		try:
+			deleted = int(arcpy.GetCount_management(layerName).getOutput(0))
+			if deleted > 0 and deleted == int(arcpy.GetCount_management(targetFCName).getOutput(0)):
+				#every line is being replaced, so empty the featureclass rather than delete row by row. Versioned data cannot be truncated, so fall back to deleting the selection
+				try:
+					arcpy.TruncateTable_management(targetFCName)
+				except Exception as e:
+					arcpy.AddMessage("Cannot truncate %s, deleting the lines instead: %s" % (targetFCName, e))
+					arcpy.DeleteRows_management(layerName)
+			elif deleted > 0:
+				arcpy.DeleteRows_management(layerName)
+		finally:
+			arcpy.Delete_management(layerName)
+		arcpy.AddMessage("%d lines deleted" % (deleted))
+		return deleted
+
+	def prefixWhereClause(self, linePrefixes):
+		'''match the lines with exactly these prefixes. A prefix ending in % matches every prefix which starts with it'''
+		prefixClauses = []
+		for linePrefix in linePrefixes:
+			if linePrefix.endswith("%"):
+				pattern = linePrefix[:-1].replace("'", "''").replace("\\", "\\\\").replace("_", "\\_").replace("%", "\\%")
+				prefixClauses.append("LINE_PREFIX LIKE '%s%%' ESCAPE '\\'" % (pattern))
 			else:
-				lineLength = float(row[0].length)
-#			lineLength = float(row[0].length)
-
-			duration = lineLength / speed / 3600.00
-			totalDuration = duration + turnDuration
-			entireSurveyDuration += totalDuration
-			entireSurveyLineLength += lineLength
-			entireSurveyLineCount += 1
+				prefixClauses.append("LINE_PREFIX = '%s'" % (linePrefix[:20].replace("'", "''")))
+		return " OR ".join(prefixClauses)
+
+	def createRunId(self):
+		'''a unique identifier for the lines written by one run'''
+		return uuid.uuid4().hex
+
+	def deleteSurveyLineNames(self, targetFCName, linePrefix, lineNames=None):
+		'''delete the lines with exactly this prefix, or only the named lines with this prefix, and return the number of lines deleted'''
+		whereclause = "LINE_PREFIX = '%s'" % (linePrefix[:20].replace("'", "''"))
+		names = None if lineNames is None else set(name[:20] for name in lineNames)
+		deleted = 0
+		with arcpy.da.UpdateCursor(targetFCName, ["LINE_NAME"], whereclause) as cursor:
+			for row in cursor:
+				if names is None or row[0] in names:
+					cursor.deleteRow()
+					deleted += 1
+		return deleted
+
+	def countSurveyLines(self, targetFCName, linePrefixes):
+		'''count the lines with exactly these prefixes'''
+		whereclause = "LINE_PREFIX IN (%s)" % (", ".join("'%s'" % (prefix[:20].replace("'", "''")) for prefix in linePrefixes))
+		count = 0
+		with arcpy.da.SearchCursor(targetFCName, ["OID@"], whereclause) as cursor:
+			for row in cursor:
+				count += 1
+		return count
+
+	def sumSurveyLines(self, targetFCName, whereclause, polygonIsGeographic):
+		'''return the line count and length in metres of each prefix matched by the whereclause, or of every prefix if it is None. Grid lengths come from the SHAPE@LENGTH token, so no geometry is read. Geographic lengths need the geometry to measure them on the ellipsoid'''
+		totals = {}
+		fields = ["LINE_PREFIX", "SHAPE@" if polygonIsGeographic else "SHAPE@LENGTH"]
+		with arcpy.da.SearchCursor(targetFCName, fields, whereclause) as sCursor:
+			for row in sCursor:
+				lineLength = row[1].getLength("GEODESIC", "METERS") if polygonIsGeographic else float(row[1] or 0)
+				total = totals.setdefault(row[0] or "", [0, 0.0])
+				total[0] += 1
+				total[1] += lineLength
+		return totals
+
+	def checkSurveySummaryExists(self, targetFCName, polygonIsGeographic):
+		'''make sure the summary table of the run lines exists. A new table is filled from the whole featureclass, which is the only time the summary needs a full table scan'''
+		summaryName = targetFCName + SUMMARY_TABLE_SUFFIX
+		if arcpy.Exists(summaryName):
+			return summaryName
+		arcpy.AddMessage("Creating Summary Table: %s..." % (summaryName))
+		arcpy.CreateTable_management(arcpy.env.workspace, summaryName)
+		arcpy.AddField_management(summaryName, "LINE_PREFIX", "TEXT", None, None, 20, "", "NULLABLE", "NON_REQUIRED")
+		arcpy.AddField_management(summaryName, "LINE_COUNT", "LONG", None, None, None, "Line Count", "NULLABLE", "NON_REQUIRED")
+		arcpy.AddField_management(summaryName, "LINE_LENGTH", "DOUBLE", None, None, None, "Line Length (m)", "NULLABLE", "NON_REQUIRED")
+		arcpy.AddField_management(summaryName, "LAST_UPDATE", "DATE", None, None, None, "", "NULLABLE", "NON_REQUIRED")
+		self.writeSurveySummary(summaryName, None, self.sumSurveyLines(targetFCName, None, polygonIsGeographic))
+		return summaryName
+
+	def writeSurveySummary(self, summaryName, whereclause, totals):
+		'''replace the summary rows matched by the whereclause, or all of them if it is None, with the totals'''
+		with arcpy.da.UpdateCursor(summaryName, ["OID@"], whereclause) as cursor:
+			for row in cursor:
+				cursor.deleteRow()
+		lastUpdate = datetime.now()
+		with arcpy.da.InsertCursor(summaryName, ["LINE_PREFIX", "LINE_COUNT", "LINE_LENGTH", "LAST_UPDATE"]) as cursor:
+			for prefix, (count, length) in totals.items():
+				cursor.insertRow((prefix, count, length, lastUpdate))
+
+	def updateSurveySummary(self, targetFCName, linePrefixes, polygonIsGeographic, totals=None):
+		'''refresh the summary rows of these prefixes, or of every prefix if linePrefixes is None, after their lines have been written. Pass totals if they have already been summed from the featureclass'''
+		try:
+			summaryName = self.checkSurveySummaryExists(targetFCName, polygonIsGeographic)
+			whereclause = None if linePrefixes is None else self.prefixWhereClause(linePrefixes)
+			if totals is None:
+				totals = self.sumSurveyLines(targetFCName, whereclause, polygonIsGeographic)
+			self.writeSurveySummary(summaryName, whereclause, totals)
+		except Exception as e:
+			arcpy.AddMessage("Unable to update the survey summary table, continuing without it: %s" % (e))
 
-			prefix = row[4]
-			if linePrefix in prefix:
-				currentPolygonDuration		+= duration + turnDuration
-				currentPolygonLineLength 	+= lineLength
-				currentPolygonLineCount		+= 1
-				# currentlineSpacing 			= float(row[3])
+	def readSurveySummary(self, targetFCName, polygonIsGeographic):
+		'''return the line count and length in metres of the entire survey from the summary table'''
+		summaryName = self.checkSurveySummaryExists(targetFCName, polygonIsGeographic)
+		lineCount = 0
+		lineLength = 0.0
+		with arcpy.da.SearchCursor(summaryName, ["LINE_COUNT", "LINE_LENGTH"]) as sCursor:
+			for row in sCursor:
+				lineCount += row[0] or 0
+				lineLength += row[1] or 0.0
+		return lineCount, lineLength
 
-			# lineSpacing = float(row[3])
-			report += str("%s,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f\n" % (row[1], float(row[3]), row[0].firstPoint.X, row[0].firstPoint.Y, row[0].lastPoint.X, row[0].lastPoint.Y, lineLength, row[2], vesselSpeedInKnots, vesselSpeedInKnots*(1852/3600), duration, turnDuration, totalDuration))
+	def get_username(self):
+		return os.getenv('username')
 
+	def FC2CSV(self, targetFCName, vesselSpeedInKnots, turnDuration, lineSpacing, lineHeading, polygonIsGeographic, linePrefix, skipReport, columnarReport="None", reportScope="Entire Survey", MBESCoverageMultiplier=4.0, gebcoFile="", depthSampleInterval=0):
+		'''report the survey estimate, and stream the lines to a CSV so we can open it in Excel and complete the survey estimation process. The totals are accumulated in the same pass, so the report runs in constant memory however large the table is.
+		columnarReport can be Parquet or NPZ to also write the lines to a columnar file for analysis.
+		Unless an Entire Survey report is written, only the lines of this prefix and its cross lines are read, through an indexed whereclause. The entire survey totals come from the summary table, so a small block in a large project does not read every line.
+		If depthSampleInterval is set, the depth profile of every line is sampled from the GEBCO file, or the Survey_Sounding_Grid, a chunk of lines at a time'''
+		csvname = None
+		columnarname = None
 		if skipReport == 'false':
 			csvname = os.path.dirname(arcpy.env.workspace) + "\\" + targetFCName + ".csv"
 			csvname = createOutputFileName(csvname)
-
 			arcpy.AddMessage("writing results to file: %s" % (csvname))
-			file = open(csvname, 'w')
-			hdr = "linename,linespacing,startx,starty,endx,endy,length(m),heading,speed(kts),speed(m/s),duration(h),turnduration(h),totalduration(h)\n"
-			file.write(hdr)
-			file.write(report)
-			file.close()
-			#now open the file for the user...
-			os.startfile('"' + csvname + '"')
+		if columnarReport in ("Parquet", "NPZ"):
+			columnarname = os.path.dirname(arcpy.env.workspace) + "\\" + targetFCName + "." + columnarReport.lower()
+			columnarname = createOutputFileName(columnarname)
+			arcpy.AddMessage("writing columnar results to file: %s" % (columnarname))
+
+		currentPrefixes = [linePrefix, linePrefix + "_X"]
+		entireSurvey = reportScope == "Entire Survey" and (csvname is not None or columnarname is not None)
+		whereclause = None if entireSurvey else self.prefixWhereClause(currentPrefixes)
+
+		speed = vesselSpeedInKnots *(1852/3600) #convert from knots to metres/second
+		reportLineCount = 0
+		if csvname or columnarname:
+			depthSource = None
+			if depthSampleInterval > 0:
+				depthSource = self.loadReportDepths(targetFCName, gebcoFile, polygonIsGeographic)
+
+			totals = {}
+			with surveyreport.surveyReportWriter(csvname, columnarname, depthColumns=depthSource is not None) as writer:
+				lines = []
+				with arcpy.da.SearchCursor(targetFCName, ["SHAPE@", "LINE_NAME", "LINE_DIRECTION", "REMARKS", "LINE_PREFIX"], whereclause) as sCursor:
+					for row in sCursor:
+						if polygonIsGeographic:
+							lineLength = row[0].getLength("GEODESIC", "METERS")
+						else:
+							lineLength = float(row[0].length)
+						total = totals.setdefault(row[4] or "", [0, 0.0])
+						total[0] += 1
+						total[1] += lineLength
+
+						duration = lineLength / speed / 3600.00
+						line = (row[1], float(row[3]), row[0].firstPoint.X, row[0].firstPoint.Y, row[0].lastPoint.X, row[0].lastPoint.Y, lineLength, row[2], vesselSpeedInKnots, duration, turnDuration)
+						if depthSource is None:
+							writer.writeRow(*line)
+							continue
+						#cross lines are not spaced for coverage, so they are not judged against their spacing
+						lines.append((line, row[0], (row[4] or "").endswith("_X")))
+						if len(lines) >= PROFILE_CHUNK_LINES:
+							self.writeDepthProfiles(writer, lines, depthSource, MBESCoverageMultiplier, depthSampleInterval)
+							lines = []
+				if len(lines) > 0:
+					self.writeDepthProfiles(writer, lines, depthSource, MBESCoverageMultiplier, depthSampleInterval)
+			reportLineCount = writer.rowCount
+		else:
+			#there are no lines to write, so only the lengths of the current lines are read
+			totals = self.sumSurveyLines(targetFCName, whereclause, polygonIsGeographic)
+
+		#refresh the summary with the lines we have just read, which picks up any edits made in ArcGIS since they were written
+		self.updateSurveySummary(targetFCName, None if entireSurvey else currentPrefixes, polygonIsGeographic, totals)
+		entireSurveyLineCount, entireSurveyLineLength = self.readSurveySummary(targetFCName, polygonIsGeographic)
+		entireSurveyDuration = entireSurveyLineLength / speed / 3600.00 + entireSurveyLineCount * turnDuration
+
+		currentPolygonLineCount = sum(totals.get(prefix, (0, 0.0))[0] for prefix in currentPrefixes)
+		currentPolygonLineLength = sum(totals.get(prefix, (0, 0.0))[1] for prefix in currentPrefixes)
+		currentPolygonDuration = currentPolygonLineLength / speed / 3600.00 + currentPolygonLineCount * turnDuration
+
+		#now open the file for the user, unless it is too big for Excel
+		if csvname:
+			if reportLineCount <= surveyreport.EXCEL_MAX_ROWS:
+				os.startfile('"' + csvname + '"')
+			else:
+				arcpy.AddMessage("The report has more lines than Excel can open, so it has not been opened for you.")
 
 		#report the CURRENT survey stats to a string...
 		msg = "Current Polygon Results\n"
-		msg += "Line Spacing:				%.3f m\n" % (lineSpacing)
+		if lineSpacing < 0:
+			msg += "Line Spacing:				adapted to depth\n"
+		else:
+			msg += "Line Spacing:				%.3f m\n" % (lineSpacing)
 		msg += "Line Heading:				%.1f deg\n" % (lineHeading)
 		msg += "Turn Duration:				%.3f mins\n" % (turnDuration*60)
 		msg += "Speed:					%.3fKnots\n" % (vesselSpeedInKnots)
@@ -710,33 +1167,70 @@ class surveyEstimator:
 		arcpy.AddMessage("##########################")
 
 
+###############################################################################
+	def loadReportDepths(self, targetFCName, gebcoFile, polygonIsGeographic):
+		'''return the (sampleDepths, isGeographic, spatialReference) used to sample the depth profiles of the report, or None if there are no depths. sampleDepths(x, y) takes coordinates in spatialReference, or in the featureclass if that is None'''
+		#the depths are read around every line of the survey, not the whole GEBCO grid or sounding layer
+		description = arcpy.Describe(targetFCName)
+		if gebcoFile:
+			arcpy.AddMessage("Sampling line depths from GEBCO file: %s" % (gebcoFile))
+			wgs84 = None if polygonIsGeographic else arcpy.SpatialReference(4326)
+			extent = description.extent if wgs84 is None else description.extent.projectAs(wgs84)
+			#the GEBCO cells are held in memory like the soundings, so the file is closed before the lines are sampled
+			depthGrid = soundinggrid.soundingGrid.fromGEBCOFile(gebcoFile, extent.XMin, extent.YMin, extent.XMax, extent.YMax)
+			return (depthGrid.sample, True, wgs84)
+
+		depthGrid = self.loadSoundingGrid("Survey_Sounding_Grid", description.spatialReference, None, extent=description.extent)
+		if depthGrid is None:
+			arcpy.AddMessage("No depths to sample, the report will not list the depth along each line")
+			return None
+		return (depthGrid.sample, polygonIsGeographic, None)
+
+	def writeDepthProfiles(self, writer, lines, depthSource, MBESCoverageMultiplier, depthSampleInterval):
+		'''sample the depth profiles of a chunk of (reportRow, geometry, isCrossLine) lines in one batch, and write them to the report. Cross lines get depths but no undercoverage'''
+		sampleDepths, isGeographic, spatialReference = depthSource
+		vertexLine = []
+		vertexPart = []
+		x = []
+		y = []
+		partCount = 0
+		for index, (line, geometry, isCrossLine) in enumerate(lines):
+			for part in geometry:
+				for point in part:
+					if point:
+						vertexLine.append(index)
+						vertexPart.append(partCount)
+						x.append(point.X)
+						y.append(point.Y)
+				partCount += 1
+		x = np.array(x, dtype=np.float64)
+		y = np.array(y, dtype=np.float64)
+		#the vertices of the whole chunk are projected in one call, rather than one line geometry at a time
+		if spatialReference is not None and len(x) > 0:
+			x, y = self.projectPoints(x, y, lines[0][1].spatialReference, spatialReference)
+		#each pair of neighbouring vertices in the same part is a segment
+		vertexPart = np.array(vertexPart, dtype=np.int64)
+		starts = np.flatnonzero(vertexPart[:-1] == vertexPart[1:])
+		segmentLine = np.array(vertexLine, dtype=np.int64)[starts]
+		lineSpacings = [np.nan if isCrossLine else line[1] for line, geometry, isCrossLine in lines]
+		profiles = lineplanner.lineDepthProfiles(segmentLine, x[starts], y[starts], x[starts + 1], y[starts + 1], lineSpacings, sampleDepths, MBESCoverageMultiplier, depthSampleInterval, isGeographic)
+		for index, (line, geometry, isCrossLine) in enumerate(lines):
+			writer.writeRow(*line, depthProfile=[profile[index] for profile in profiles])
+
+	def projectPoints(self, x, y, fromSpatialReference, toSpatialReference):
+		'''project arrays of coordinates with a single projectAs call, through one multipoint holding all of them'''
+		points = arcpy.Array([arcpy.Point(pointX, pointY) for pointX, pointY in zip(x.tolist(), y.tolist())])
+		projected = arcpy.Multipoint(points, fromSpatialReference).projectAs(toSpatialReference)
+		coordinates = np.array([(point.X, point.Y) for point in projected], dtype=np.float64).reshape(-1, 2)
+		return coordinates[:, 0], coordinates[:, 1]
+
 ###############################################################################
 	def computeOptimalHeading(self, polyClipper, polygonIsGeographic):
 		arcpy.AddMessage("Computing Optimal Survey Heading from the selected polygon...")
 		try:
-			# Step through each part of the feature
-			xc=[]
-			yc=[]
-			for poly in polyClipper:
-				for part in poly:
-					for pnt in part:
-						if pnt:
-							xc.append(pnt.X)
-							yc.append(pnt.Y)
-						else:
-							# If pnt is None, this represents an interior ring
-							print("Interior Ring:")
-			#now compute the length of each vector
-			ranges=[]
-			maxRange = 0
-			optimalBearing = 0
-			for count, item in enumerate(xc, start=1 ):
-				if count < len(xc):
-					rng, brg = geodetic.calculateRangeBearingFromCoordinates(xc[count-1], yc[count-1], xc[count], yc[count], polygonIsGeographic)
-					if rng > maxRange:
-						optimalBearing = brg
-						maxRange = rng
-					#ranges.append([rng,brg])
+			# Step through each ring of the feature. Interior rings are separated from the exterior ring, so we never measure a vector from one ring to the next
+			polygonX, polygonY = self.getPolygonCoordinates(polyClipper[0])
+			optimalBearing = lineplanner.longestEdgeHeading(polygonX, polygonY, polygonIsGeographic)
 			arcpy.AddMessage("*******************")
 			arcpy.AddMessage("Optimal Bearing is %.2f" % (optimalBearing))
 			arcpy.AddMessage("*******************")
@@ -745,38 +1239,94 @@ class surveyEstimator:
 			arcpy.AddMessage("Error computing optimal heading, skipping...")
 			return 0
 
+###############################################################################
+	def computeMinimumDurationHeading(self, polyClipper, lineSpacing, crossLineMultiplier, vesselSpeedInKnots, turnDuration, polygonIsGeographic, depthGrid=None, MBESCoverageMultiplier=None):
+		'''sweep the line heading across the selected polygon and return the heading with the shortest total survey duration, including turns and cross lines. With a depthGrid the line spacing adapts to depth at every heading'''
+		arcpy.AddMessage("Searching for the survey heading with the shortest duration...")
+		useWorkerInterpreter()
+		polygonX, polygonY = self.getPolygonCoordinates(polyClipper[0])
+		originX = polyClipper[0].centroid.X
+		originY = polyClipper[0].centroid.Y
+		heading, duration, curve = lineplanner.optimiseHeading(polygonX, polygonY, lineSpacing, crossLineMultiplier, vesselSpeedInKnots, turnDuration, originX=originX, originY=originY, isGeographic=polygonIsGeographic, depthGrid=depthGrid, coverageMultiplier=MBESCoverageMultiplier)
+
+		arcpy.AddMessage("Heading(deg),Duration(h)")
+		for hdg, hours in curve:
+			arcpy.AddMessage("%.2f,%.3f" % (hdg, hours))
+		arcpy.AddMessage("*******************")
+		arcpy.AddMessage("Optimal Bearing is %.2f Duration %.2f Hours" % (heading, duration))
+		arcpy.AddMessage("*******************")
+		return heading
+
+###############################################################################
+	def loadSoundingGrid(self, targetFCName, spatialReference, polyClipper, toLocalGrid=False, extent=None):
+		'''read the soundings around the selected polygon into an in memory depth raster in the spatial reference of the polygon, or return None if there are no soundings. Only the soundings within the extent, the extent of the polygon unless one is given, are read, in one call with no clipping in the geodatabase. Set toLocalGrid for geographic polygons to get the raster in the local grid the line planner uses'''
+		arcpy.AddMessage("Loading depths from %s..." % (targetFCName))
+		if not arcpy.Exists(targetFCName):
+			arcpy.AddMessage("!!!!!!%s does not exist, skipping computation of depth!!!!!!" % (targetFCName))
+			return None
+
+		x, y, z = self.readSoundings(targetFCName, spatialReference, polyClipper[0].extent if extent is None else extent)
+		if len(z) == 0:
+			arcpy.AddMessage("!!!!!!No soundings around the selected polygon, skipping computation of depth!!!!!!")
+			return None
+
+		#the grid holds elevations, so a layer of depths positive down is negated
+		positiveDown = soundinggrid.isPositiveDown(z)
+		if positiveDown:
+			arcpy.AddMessage("Most soundings in %s are above zero, so they are read as depths positive down" % (targetFCName))
+
+		#geographic polygons are planned in a local grid about the centroid, so the soundings go into the same grid. A geographic lattice is not aligned with the local grid, so its cells are sized in geographicals, then scaled into metres at the centroid
+		if toLocalGrid:
+			cellSizeX, cellSizeY = soundinggrid.estimateCellSize(x, y)
+			centroid = polyClipper[0].centroid
+			cornerX, cornerY = geodetic.geographicalsToLocalGrid(np.array([centroid.X, centroid.X + cellSizeX, centroid.X]), np.array([centroid.Y, centroid.Y, centroid.Y + cellSizeY]), centroid.X, centroid.Y)
+			x, y = geodetic.geographicalsToLocalGrid(x, y, centroid.X, centroid.Y)
+			depthGrid = soundinggrid.soundingGrid.fromPoints(x, y, z, math.hypot(cornerX[1] - cornerX[0], cornerY[1] - cornerY[0]), math.hypot(cornerX[2] - cornerX[0], cornerY[2] - cornerY[0]), positiveDown=positiveDown)
+		else:
+			depthGrid = soundinggrid.soundingGrid.fromPoints(x, y, z, positiveDown=positiveDown)
+		arcpy.AddMessage("Depth grid: %d soundings in %d cells of %.6g x %.6g, median depth %.1f m" % (len(z), depthGrid.cellCount(), depthGrid.cellSizeX, depthGrid.cellSizeY, depthGrid.medianDepth()))
+		return depthGrid
+
+	def readSoundings(self, targetFCName, spatialReference, extent):
+		'''return the x, y and elevation arrays of the soundings within the extent, and a margin of a tenth of its size all round so the cells along its edges are complete. The soundings are selected by location, through the spatial index of the featureclass, so a national sounding layer is not read for one block'''
+		marginX = (extent.XMax - extent.XMin) * 0.1
+		marginY = (extent.YMax - extent.YMin) * 0.1
+		corners = [(extent.XMin - marginX, extent.YMin - marginY), (extent.XMax + marginX, extent.YMin - marginY), (extent.XMax + marginX, extent.YMax + marginY), (extent.XMin - marginX, extent.YMax + marginY)]
+		box = arcpy.Polygon(arcpy.Array([arcpy.Point(cornerX, cornerY) for cornerX, cornerY in corners]), extent.spatialReference)
+
+		layerName = "SoundingsNearSurvey"
+		arcpy.MakeFeatureLayer_management(targetFCName, layerName)
+		try:
+			arcpy.SelectLayerByLocation_management(layerName, "INTERSECT", box)
+			soundings = arcpy.da.FeatureClassToNumPyArray(layerName, ["SHAPE@X", "SHAPE@Y", "ELEVATION"], spatial_reference=spatialReference, skip_nulls=True)
+		finally:
+			arcpy.Delete_management(layerName)
+		return soundings["SHAPE@X"], soundings["SHAPE@Y"], soundings["ELEVATION"]
+
 ###############################################################################
 	def computeMeanDepthFromSoundingGrid(self, targetFCName, spatialReference, polyClipper, MBESCoverageMultiplier):
-		'''iterate through all features inside the sounding_grid (if present) and compute the mean depth within the selected polygon.'''
+		'''compute the mean depth of the sounding_grid (if present) within the selected polygon, from an in memory depth grid and a point in polygon mask of its cells.'''
 		arcpy.AddMessage("Computing Depth within polygon...")
 
-		if not arcpy.Exists(targetFCName):
-			arcpy.AddMessage("!!!!!!%s does not exist, skipping computation of mean depth. Will default to a 1000m line spacing soe you get some form of result!!!!!!" % (targetFCName))
+		depthGrid = self.loadSoundingGrid(targetFCName, spatialReference, polyClipper)
+		if depthGrid is None:
+			arcpy.AddMessage("!!!!!!Will default to a 1000m line spacing so you get some form of result!!!!!!")
 			return 1000
-		else:
-			ClippedName = "TempClippedSoundings" #Temporary featureclass for clipping results. This gets compied into the SSDM layer at the end and then cleared out
-			self.checkSoundingGridFCExists(ClippedName, spatialReference)
-			arcpy.AddMessage ("Clipping soundings grid to survey polygon for estimation...")
-			#we need to clear out the temp soundings grid in case it is run more than once...
-			arcpy.DeleteFeatures_management(ClippedName)
-			arcpy.Clip_analysis(targetFCName, polyClipper, ClippedName)
-
-			sumZ = 0
-			countZ = 0
-			sCursor = arcpy.da.SearchCursor(ClippedName, ["SHAPE@", "ELEVATION"])
-			for row in sCursor:
-				sumZ += float(row[1])
-				countZ += 1
-				if countZ % 10 == 0:
-					arcpy.AddMessage("ID:%d X:%.2f Y:%.2f Z:%.2f" % (countZ, row[0].centroid.X, row[0].centroid.Y, row[1]))
-			if countZ > 0:
-				arcpy.AddMessage("****************")
-				arcpy.AddMessage("Mean Depth within Selected Polygon:%.2f Sample Count:%d" % (sumZ/countZ, countZ))
-				arcpy.AddMessage("e.g. with a coverage rate of %.1f, the primary line spacing should be %.2f" % (MBESCoverageMultiplier, MBESCoverageMultiplier * sumZ/countZ))
-				arcpy.AddMessage("****************")
-				return math.fabs(MBESCoverageMultiplier * sumZ/countZ)
-			else:
-				return 1000
+
+		polygonX, polygonY = self.getPolygonCoordinates(polyClipper[0])
+		statistics = depthGrid.polygonStatistics(polygonX, polygonY)
+		if statistics is None:
+			arcpy.AddMessage("!!!!!!No soundings within the selected polygon. Will default to a 1000m line spacing so you get some form of result!!!!!!")
+			return 1000
+
+		meanDepth = statistics["mean"]
+		arcpy.AddMessage("****************")
+		arcpy.AddMessage("Mean Depth within Selected Polygon:%.2f Sample Count:%d" % (meanDepth, statistics["count"]))
+		arcpy.AddMessage("Depth Range within Selected Polygon:%.2f to %.2f Percentiles 5%%:%.2f 50%%:%.2f 95%%:%.2f" % (statistics["min"], statistics["max"], statistics["p5"], statistics["p50"], statistics["p95"]))
+		arcpy.AddMessage("e.g. with a coverage rate of %.1f, the primary line spacing should be %.2f" % (MBESCoverageMultiplier, MBESCoverageMultiplier * meanDepth))
+		arcpy.AddMessage("****************")
+		return math.fabs(MBESCoverageMultiplier * meanDepth)
+
 	#def createFileGDB(self, FGDBName):
 	#	# Set workspace
 	#	# arcpy.env.workspace = "Z:\\home\\user\\mydata"
@@ -840,6 +1390,12 @@ def copy2clip(txt):
 	else:
 		raise Exception('Platform not supported')
 
+###############################################################################
+def useWorkerInterpreter():
+	'''inside ArcGIS Pro sys.executable is ArcGISPro.exe, so worker processes need to be started with the python interpreter instead'''
+	if os.path.basename(sys.executable).lower().startswith("arcgispro"):
+		multiprocessing.set_executable(os.path.join(sys.exec_prefix, "pythonw.exe"))
+
 ###############################################################################
 def createOutputFileName(path, ext=""):
 	'''Create a valid output filename. if the name of the file already exists the file name is auto-incremented.'''
@@ -68,6 +68,29 @@ def medfilt (x, k):
 		y[-j:,-(i+1)] = x[-1]
 	return np.median (y, axis=1)
 
+def formatField(values, places):
+	'''format an array of numbers with a fixed number of decimal places into an (n, width) array of ascii bytes, right aligned and padded on the left with zero bytes. This is how the exports write text without formatting one point at a time'''
+	values = np.asarray(values, dtype=np.float64)
+	scaled = np.rint(np.abs(values) * 10 ** places).astype(np.int64)
+	digits = max(len(str(int(scaled.max()))) if len(scaled) > 0 else 1, places + 1)
+	width = 1 + digits + (1 if places > 0 else 0)
+	field = np.zeros((len(values), width), dtype=np.uint8)
+	#the sign goes in the first byte, the padding between it and the digits is dropped when the text is written
+	field[:, 0] = np.where((values < 0) & (scaled > 0), ord("-"), 0)
+	column = width - 1
+	power = 1
+	for digit in range(digits):
+		if digit == places and places > 0:
+			field[:, column] = ord(".")
+			column -= 1
+		field[:, column] = ord("0") + (scaled // power) % 10
+		#blank the leading zeros, but keep the zero before the decimal point
+		if digit > places:
+			field[scaled < power, column] = 0
+		power *= 10
+		column -= 1
+	return field
+
 # from: http://mathforum.org/library/drmath/view/62034.html
 def calculateRangeBearingFromGridPosition(easting1, northing1, easting2, northing2):
 	"""given 2 east, north, pairs, compute the range and bearing"""
@@ -492,6 +515,407 @@ def calculateGeographicalPositionFromRangeBearing(latitude1, longitude1, alpha1T
 
   # END of Vincenty's Direct formulae
 
+#-------------------------------------------------------------------------------
+# Array versions of Vincenty's Inverse and Direct formulae				|
+# These take and return numpy arrays, and give the same results as the		|
+# scalar functions above.  All elements are iterated together, and each		|
+# element keeps the values of the iteration on which it converged.			|
+# Inputs are worked through in blocks, so numpy's temporaries stay in the	|
+# processor cache rather than being allocated and paged in for every step.	|
+#-------------------------------------------------------------------------------
+
+#elements per block in the array Vincenty functions
+VINCENTY_BLOCK_SIZE = 4096
+
+def calculateRangeBearingFromGeographicalsArray(longitude1, latitude1, longitude2, latitude2, maxIterations=200):
+		"""
+		Array version of calculateRangeBearingFromGeographicals.
+		lats, longs and azimuths are numpy arrays in decimal degrees, distance in metres.
+		Nearly antipodal points, where the iteration does not converge, fall back to a spherical estimate.
+
+		Returns ( s, alpha1Tp2,  alpha21 ) as a tuple of arrays
+		"""
+		longitude1, latitude1, longitude2, latitude2 = np.broadcast_arrays(np.asarray(longitude1, dtype=np.float64), np.asarray(latitude1, dtype=np.float64), np.asarray(longitude2, dtype=np.float64), np.asarray(latitude2, dtype=np.float64))
+		shape = longitude1.shape
+		longitude1 = longitude1.ravel()
+		latitude1 = latitude1.ravel()
+		longitude2 = longitude2.ravel()
+		latitude2 = latitude2.ravel()
+		count = len(longitude1)
+
+		s = np.zeros(count)
+		alpha1Tp2 = np.zeros(count)
+		alpha21 = np.zeros(count)
+		for start in range(0, count, VINCENTY_BLOCK_SIZE):
+			block = slice(start, start + VINCENTY_BLOCK_SIZE)
+			s[block], alpha1Tp2[block], alpha21[block] = rangeBearingFromGeographicalsBlock(longitude1[block], latitude1[block], longitude2[block], latitude2[block], maxIterations)
+
+		return s.reshape(shape), alpha1Tp2.reshape(shape), alpha21.reshape(shape)
+
+def rangeBearingFromGeographicalsBlock(longitude1, latitude1, longitude2, latitude2, maxIterations):
+		'''Vincenty's inverse formulae on one block of 1D arrays, for calculateRangeBearingFromGeographicalsArray'''
+		a = 6378137.0
+		b = 6356752.3142
+		f = (a-b)/a
+
+		piD4   = math.atan( 1.0 )
+		two_pi = piD4 * 8.0
+
+		count = len(longitude1)
+		s = np.zeros(count)
+		alpha1Tp2 = np.zeros(count)
+		alpha21 = np.zeros(count)
+
+		#coincident points are zero distance, exactly as the scalar version
+		work = np.flatnonzero(~((np.abs( latitude2 - latitude1 ) < 1e-8) & ( np.abs( longitude2 - longitude1) < 1e-8 )))
+		if len(work) == 0:
+			return s, alpha1Tp2, alpha21
+
+		b = a * (1.0 - f)
+
+		#the reduced latitudes and their sines and cosines are computed as in the scalar version, so the rounding matches
+		TanU1 = (1-f) * np.tan( np.radians(latitude1[work]) )
+		TanU2 = (1-f) * np.tan( np.radians(latitude2[work]) )
+		U1 = np.arctan(TanU1)
+		U2 = np.arctan(TanU2)
+		sinU1 = np.sin(U1)
+		cosU1 = np.cos(U1)
+		sinU2 = np.sin(U2)
+		cosU2 = np.cos(U2)
+
+		#each longitude is converted to radians before they are differenced, exactly as the scalar version, so the rounding matches
+		omega = np.radians(longitude2[work]) - np.radians(longitude1[work])
+		lembda = omega.copy()
+
+		#products of the reduced latitudes which do not change between iterations
+		sinU1sinU2 = sinU1 * sinU2
+		cosU1cosU2 = cosU1 * cosU2
+		cosU1sinU2 = cosU1 * sinU2
+		sinU1cosU2 = sinU1 * cosU2
+
+		Sin_sigma = np.zeros(len(work))
+		Cos_sigma = np.zeros(len(work))
+		sigma = np.zeros(len(work))
+		cos_sq_alpha = np.zeros(len(work))
+		Cos2sigma_m = np.zeros(len(work))
+
+		# Iterate the following equations on every element until there is no significant change in lembda.
+		#  Converged elements keep the values of the iteration they converged on, exactly as the scalar version stops there
+		active = np.ones(len(work), dtype=bool)
+		iteration = 0
+		with np.errstate(divide='ignore', invalid='ignore'):
+			while iteration < maxIterations:
+				sinLam = np.sin(lembda)
+				cosLam = np.cos(lembda)
+				sqr = (cosU2 * sinLam) ** 2 + (cosU1sinU2 - sinU1cosU2 * cosLam) ** 2
+				sinSig = np.sqrt(sqr)
+				cosSig = sinU1sinU2 + cosU1cosU2 * cosLam
+				sig = np.arctan2(sinSig, cosSig)
+
+				#sin(sigma) and cos(sigma) are sinSig and cosSig, and cos^2(alpha) is 1 - sin^2(alpha)
+				sinAlpha = np.clip(cosU1cosU2 * sinLam / sinSig, -1.0, 1.0)
+				cosSqAlpha = 1.0 - sinAlpha * sinAlpha
+
+				#equatorial lines have cos(alpha) = 0, where cos(2 sigma_m) is taken as zero
+				c2sm = cosSig - (2 * sinU1sinU2 / cosSqAlpha)
+				c2sm[cosSqAlpha == 0] = 0.0
+
+				C = (f/16) * cosSqAlpha * (4 + f * (4 - 3 * cosSqAlpha))
+
+				newLam = omega + (1-C) * f * sinAlpha * (sig + C * sinSig * \
+						(c2sm + C * cosSig * (-1 + 2 * c2sm * c2sm )))
+
+				np.copyto(Sin_sigma, sinSig, where=active)
+				np.copyto(Cos_sigma, cosSig, where=active)
+				np.copyto(sigma, sig, where=active)
+				np.copyto(cos_sq_alpha, cosSqAlpha, where=active)
+				np.copyto(Cos2sigma_m, c2sm, where=active)
+				#the relative change test of the scalar version, where a zero lembda counts as converged
+				stillActive = active & (newLam != 0) & (np.abs((lembda - newLam) / newLam) > 1.0e-9)
+				np.copyto(lembda, newLam, where=active)
+				active = stillActive
+
+				iteration += 1
+				if not active.any():
+					break
+
+		sqr_sin_sigma = Sin_sigma * Sin_sigma
+		u2 = cos_sq_alpha * (a*a-b*b) / (b*b)
+
+		A = 1 + (u2/16384) * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+
+		B = (u2/1024) * (256 + u2 * (-128+ u2 * (74 - 47 * u2)))
+
+		delta_sigma = B * Sin_sigma * (Cos2sigma_m + (B/4) * \
+				(Cos_sigma * (-1 + 2 * Cos2sigma_m ** 2 ) - \
+				(B/6) * Cos2sigma_m * (-3 + 4 * sqr_sin_sigma) * \
+				(-3 + 4 * Cos2sigma_m ** 2 )))
+
+		dist = b * A * (sigma - delta_sigma)
+
+		sinLembda = np.sin(lembda)
+		cosLembda = np.cos(lembda)
+		az12 = np.arctan2( (cosU2 * sinLembda), \
+				(cosU1 * sinU2 - sinU1 * cosU2 * cosLembda))
+
+		az21 = np.arctan2( (cosU1 * sinLembda), \
+				(-sinU1 * cosU2 + cosU1 * sinU2 * cosLembda))
+
+		#arctan2 is within +-pi, so only negative forward azimuths need wrapping, and the reverse azimuth is already within 0 to 2 pi
+		az12 = np.where(az12 < 0.0, az12 + two_pi, az12)
+
+		az21 = az21 + two_pi / 2.0
+
+		s[work] = dist
+		alpha1Tp2[work] = az12 * 45.0 / piD4
+		alpha21[work] = az21 * 45.0 / piD4
+
+		#nearly antipodal points which did not converge get a spherical estimate
+		if active.any():
+			failed = work[active]
+			s[failed], alpha1Tp2[failed], alpha21[failed] = sphericalRangeBearing(longitude1[failed], latitude1[failed], longitude2[failed], latitude2[failed], (2 * a + b) / 3.0)
+
+		return s, alpha1Tp2, alpha21
+
+def calculateGeographicalPositionFromRangeBearingArray(latitude1, longitude1, alpha1To2, s, maxIterations=200):
+		"""
+		Array version of calculateGeographicalPositionFromRangeBearing.
+		lats, longs and azimuths are numpy arrays in decimal degrees, distance in metres
+
+		Returns ( latitude2,  longitude2,  alpha2To1 ) as a tuple of arrays
+		"""
+		latitude1, longitude1, alpha1To2, s = np.broadcast_arrays(np.asarray(latitude1, dtype=np.float64), np.asarray(longitude1, dtype=np.float64), np.asarray(alpha1To2, dtype=np.float64), np.asarray(s, dtype=np.float64))
+		shape = latitude1.shape
+		latitude1 = latitude1.ravel()
+		longitude1 = longitude1.ravel()
+		alpha1To2 = alpha1To2.ravel()
+		s = s.ravel()
+		count = len(s)
+
+		latitude2 = np.zeros(count)
+		longitude2 = np.zeros(count)
+		alpha21 = np.zeros(count)
+		for start in range(0, count, VINCENTY_BLOCK_SIZE):
+			block = slice(start, start + VINCENTY_BLOCK_SIZE)
+			latitude2[block], longitude2[block], alpha21[block] = geographicalPositionFromRangeBearingBlock(latitude1[block], longitude1[block], alpha1To2[block], s[block], maxIterations)
+
+		return latitude2.reshape(shape), longitude2.reshape(shape), alpha21.reshape(shape)
+
+def geographicalPositionFromRangeBearingBlock(latitude1, longitude1, alpha1To2, s, maxIterations):
+		'''Vincenty's direct formulae on one block of 1D arrays, for calculateGeographicalPositionFromRangeBearingArray'''
+		f = 1.0 / 298.257223563		# WGS84
+		a = 6378137.0 			# metres
+
+		piD4 = math.atan( 1.0 )
+		two_pi = piD4 * 8.0
+
+		#zero distance returns the start point, exactly as the scalar version
+		latitude2 = latitude1.copy()
+		longitude2 = longitude1.copy()
+		alpha21 = np.zeros(len(s))
+		work = np.flatnonzero(s != 0)
+		if len(work) == 0:
+			return latitude2, longitude2, alpha21
+
+		dist = s[work]
+		lat1 = latitude1[work] * piD4 / 45.0
+		lon1 = longitude1[work] * piD4 / 45.0
+		alpha = alpha1To2[work] * piD4 / 45.0
+		#azimuths are wrapped into 0 to 2 pi, and U1 and sigma1 computed, as in the scalar version, so the rounding matches
+		alpha = np.where(alpha < 0.0, alpha + two_pi, alpha)
+		alpha = np.where(alpha > two_pi, alpha - two_pi, alpha)
+		sinAlpha = np.sin(alpha)
+		cosAlpha = np.cos(alpha)
+
+		b = a * (1.0 - f)
+
+		TanU1 = (1-f) * np.tan(lat1)
+		U1 = np.arctan(TanU1)
+		sinU1 = np.sin(U1)
+		cosU1 = np.cos(U1)
+		sigma1 = np.arctan2(TanU1, cosAlpha)
+		Sinalpha = cosU1 * sinAlpha
+		cosalpha_sq = 1.0 - Sinalpha * Sinalpha
+
+		u2 = cosalpha_sq * (a * a - b * b ) / (b * b)
+		A = 1.0 + (u2 / 16384) * (4096 + u2 * (-768 + u2 * \
+				(320 - 175 * u2) ) )
+		B = (u2 / 1024) * (256 + u2 * (-128 + u2 * (74 - 47 * u2) ) )
+
+		# Starting with the approximation
+		sigma0 = (dist / (b * A))
+		sigma = sigma0.copy()
+		cos2sm = np.zeros(len(work))
+
+		# Iterate the following three equations on every element until there is no significant change in sigma.
+		#  Converged elements keep the values of the iteration they converged on, exactly as the scalar version stops there
+		active = np.ones(len(work), dtype=bool)
+		iteration = 0
+		while iteration < maxIterations:
+			sinSig = np.sin(sigma)
+			cosSig = np.cos(sigma)
+			cosTsm = np.cos(2 * sigma1 + sigma)
+			cosTsmSq = cosTsm * cosTsm
+
+			delta_sigma = B * sinSig * ( cosTsm \
+					+ (B/4) * (cosSig * \
+					(-1 + 2 * cosTsmSq -  \
+					(B/6) * cosTsm * \
+					(-3 + 4 * sinSig * sinSig ) *  \
+					(-3 + 4 * cosTsmSq ))))
+
+			newSigma = sigma0 + delta_sigma
+			#the relative change test of the scalar version
+			stillActive = active & (np.abs((sigma - newSigma) / newSigma) > 1.0e-9)
+			np.copyto(cos2sm, cosTsm, where=active)
+			np.copyto(sigma, newSigma, where=active)
+			active = stillActive
+
+			iteration += 1
+			if not active.any():
+				break
+
+		sinSigma = np.sin(sigma)
+		cosSigma = np.cos(sigma)
+
+		lat2 = np.arctan2 ( (sinU1 * cosSigma + cosU1 * sinSigma * cosAlpha ), \
+				((1-f) * np.sqrt( Sinalpha ** 2 +  \
+				(sinU1 * sinSigma - cosU1 * cosSigma * cosAlpha) ** 2)))
+
+		lembda = np.arctan2( (sinSigma * sinAlpha), (cosU1 * cosSigma -  \
+				sinU1 *  sinSigma * cosAlpha))
+
+		C = (f/16) * cosalpha_sq * (4 + f * (4 - 3 * cosalpha_sq ))
+
+		omega = lembda - (1-C) * f * Sinalpha *  \
+				(sigma + C * sinSigma * (cos2sm + \
+				C * cosSigma * (-1 + 2 * cos2sm ** 2 )))
+
+		lon2 = lon1 + omega
+
+		az21 = np.arctan2 ( Sinalpha, (-sinU1 * sinSigma +  \
+				cosU1 * cosSigma * cosAlpha))
+
+		#arctan2 is within +-pi, so the reverse azimuth is already within 0 to 2 pi
+		az21 = az21 + two_pi / 2.0
+
+		latitude2[work] = lat2 * 45.0 / piD4
+		longitude2[work] = lon2 * 45.0 / piD4
+		alpha21[work] = az21 * 45.0 / piD4
+
+		return latitude2, longitude2, alpha21
+
+def sphericalRangeBearing(longitude1, latitude1, longitude2, latitude2, radius):
+	"""great circle distance and forward and reverse azimuths on a sphere, used where Vincenty's inverse formulae do not converge. Arrays in decimal degrees, distance in metres"""
+	phi1 = np.radians(latitude1)
+	phi2 = np.radians(latitude2)
+	dLembda = np.radians(longitude2 - longitude1)
+	h = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dLembda / 2) ** 2
+	s = 2 * radius * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+	alpha12 = np.degrees(np.arctan2(np.sin(dLembda) * np.cos(phi2), np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(dLembda))) % 360
+	alpha21 = (np.degrees(np.arctan2(-np.sin(dLembda) * np.cos(phi1), np.cos(phi2) * np.sin(phi1) - np.sin(phi2) * np.cos(phi1) * np.cos(dLembda)))) % 360
+	return s, alpha12, alpha21
+
+def calculateCoordinatesFromRangeBearingArray(X, Y, Range, Bearing, isGeographic):
+	"""array version of calculateCoordinateFromRangeBearing"""
+	if isGeographic:
+		Y1, X1, s = calculateGeographicalPositionFromRangeBearingArray(Y, X, Bearing, Range )
+		return X1, Y1
+	else:
+		X1 = np.asarray(X) + (np.cos(np.radians(270 - np.asarray(Bearing))) * Range)
+		Y1 = np.asarray(Y) + (np.sin(np.radians(270 - np.asarray(Bearing))) * Range)
+		return X1, Y1
+
+def calculateRangeBearingFromCoordinatesArray(X1, Y1, X2, Y2, isGeographic):
+	"""array version of calculateRangeBearingFromCoordinates. Bearings are in decimal degrees"""
+	if isGeographic:
+		rng, bearing, reverse = calculateRangeBearingFromGeographicalsArray(X1, Y1, X2, Y2 )
+		return rng, bearing
+	else:
+		dx = np.asarray(X2) - np.asarray(X1)
+		dy = np.asarray(Y2) - np.asarray(Y1)
+		bearing = 90 - np.degrees(np.arctan2(dy, dx))
+		return np.hypot(dx, dy), bearing
+
+#-------------------------------------------------------------------------------
+# Local transverse Mercator grid								|
+# Geographic polygons are projected into a transverse Mercator grid whose		|
+# central meridian and origin are the polygon centroid, with unit scale		|
+# on the central meridian.  Over survey sized areas the scale error is a few	|
+# parts in 1e5, so plans can be computed with plain grid math and then		|
+# projected back.  Kruger's series to 4th order in n (WGS84), accurate to		|
+# well under a millimetre within a few hundred km of the central meridian.	|
+#-------------------------------------------------------------------------------
+def krugerCoefficients():
+	"""return the rectifying radius and the Kruger series coefficients for WGS84"""
+	f = 1.0 / 298.257223563		# WGS84
+	a = 6378137.0 			# metres
+	n = f / (2.0 - f)
+	A = a / (1 + n) * (1 + n**2 / 4 + n**4 / 64)
+	alpha = (n/2 - 2*n**2/3 + 5*n**3/16 + 41*n**4/180,
+			13*n**2/48 - 3*n**3/5 + 557*n**4/1440,
+			61*n**3/240 - 103*n**4/140,
+			49561*n**4/161280)
+	beta = (n/2 - 2*n**2/3 + 37*n**3/96 - n**4/360,
+			n**2/48 + n**3/15 - 437*n**4/1440,
+			17*n**3/480 - 37*n**4/840,
+			4397*n**4/161280)
+	delta = (2*n - 2*n**2/3 - 2*n**3 + 116*n**4/45,
+			7*n**2/3 - 8*n**3/5 - 227*n**4/45,
+			56*n**3/15 - 136*n**4/35,
+			4279*n**4/630)
+	return n, A, alpha, beta, delta
+
+def transverseMercatorForward(longitude, latitude, centralMeridian):
+	"""project geographicals in decimal degrees onto a transverse Mercator grid with unit scale on the central meridian. Returns (easting, northing) in metres from the central meridian and the equator"""
+	n, A, alpha, beta, delta = krugerCoefficients()
+	e = 2 * math.sqrt(n) / (1 + n)
+	lam = np.radians(np.asarray(longitude, dtype=np.float64) - centralMeridian)
+	sinPhi = np.sin(np.radians(np.asarray(latitude, dtype=np.float64)))
+
+	#tan of the conformal latitude
+	t = np.sinh(np.arctanh(sinPhi) - e * np.arctanh(e * sinPhi))
+	xiPrime = np.arctan2(t, np.cos(lam))
+	etaPrime = np.arctanh(np.sin(lam) / np.sqrt(1 + t * t))
+
+	xi = xiPrime.copy()
+	eta = etaPrime.copy()
+	for j, coefficient in enumerate(alpha, start=1):
+		xi += coefficient * np.sin(2*j*xiPrime) * np.cosh(2*j*etaPrime)
+		eta += coefficient * np.cos(2*j*xiPrime) * np.sinh(2*j*etaPrime)
+	return A * eta, A * xi
+
+def transverseMercatorInverse(easting, northing, centralMeridian):
+	"""inverse of transverseMercatorForward. Returns (longitude, latitude) in decimal degrees"""
+	n, A, alpha, beta, delta = krugerCoefficients()
+	xi = np.asarray(northing, dtype=np.float64) / A
+	eta = np.asarray(easting, dtype=np.float64) / A
+
+	xiPrime = xi.copy()
+	etaPrime = eta.copy()
+	for j, coefficient in enumerate(beta, start=1):
+		xiPrime -= coefficient * np.sin(2*j*xi) * np.cosh(2*j*eta)
+		etaPrime -= coefficient * np.cos(2*j*xi) * np.sinh(2*j*eta)
+
+	#conformal latitude, then the series back to the geodetic latitude
+	chi = np.arcsin(np.sin(xiPrime) / np.cosh(etaPrime))
+	phi = chi.copy()
+	for j, coefficient in enumerate(delta, start=1):
+		phi += coefficient * np.sin(2*j*chi)
+	lam = np.arctan2(np.sinh(etaPrime), np.cos(xiPrime))
+	return centralMeridian + np.degrees(lam), np.degrees(phi)
+
+def geographicalsToLocalGrid(longitude, latitude, originLongitude, originLatitude):
+	"""project geographicals in decimal degrees into a local transverse Mercator grid in metres, centred on the origin"""
+	x, y = transverseMercatorForward(longitude, latitude, originLongitude)
+	x0, y0 = transverseMercatorForward(originLongitude, originLatitude, originLongitude)
+	return x - x0, y - y0
+
+def localGridToGeographicals(x, y, originLongitude, originLatitude):
+	"""inverse of geographicalsToLocalGrid. Returns (longitude, latitude) in decimal degrees"""
+	x0, y0 = transverseMercatorForward(originLongitude, originLatitude, originLongitude)
+	return transverseMercatorInverse(np.asarray(x) + x0, np.asarray(y) + y0, originLongitude)
+
 #--------------------------------------------------------------------------
 # Notes:
 #
@@ -0,0 +1,775 @@
+#name:			lineplanner
+#description:   pure python survey line planning engine.  No arcpy required, so it runs in batch on any platform
+#designed for:  ArcGISPro 2.2.4 or standalone python with numpy
+
+# See readme.md for more details
+
+# The engine takes a polygon as coordinate arrays (rings separated by NaN, the way arcpy separates interior rings with None)
+# and the same parameters as the toolbox.  Lines are computed in a 'line frame' centred on the origin of the plan:
+#   u is the distance along the line heading
+#   v is the offset to starboard of the centreline
+# In this frame every survey line is a line of constant v, so clipping against the polygon is a 1D problem.
+# Geographic polygons are projected once into a local transverse Mercator grid centred on the origin, planned there,
+# and the line ends are projected back to geographicals in one batch.
+# With a depth grid, the primary lines are spaced adaptively from port to starboard: each line is placed so its swath
+# reaches the swath edge of the previous line, using the shallowest depth along that edge times the coverage multiplier.
+# Depth grids and depth samplers give elevations, negative below sea level, as in soundinggrid.  A sounding at or above
+# sea level is land, which gives no coverage: no lines are placed over land alone, and land along a line is undercovered.
+
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import geodetic
+import surveyreport
+
+#starting a worker process and importing numpy in it costs about this long, so a batch only goes to worker processes if they save more than that
+WORKER_STARTUP_SECONDS = 0.5
+#the blocks of a batch planned in this process to time them, before deciding whether the rest go to worker processes
+BATCH_TIMING_BLOCKS = 4
+
+def main():
+
+	parser = ArgumentParser(description='Plan survey lines over every polygon in a GeoJSON file and report the line count, length and duration of each block and of the entire survey.')
+	parser.add_argument('-i', dest='inputFile', action='store', default='', help='-i <blocks.geojson> : input GeoJSON file of survey block polygons.')
+	parser.add_argument('-o', dest='outputFile', action='store', default='', help='-o <lines.csv> : optional CSV of every survey line, in the same layout as the toolbox report.')
+	parser.add_argument('-c', dest='columnarFile', action='store', default='', help='-c <lines.npz> : optional columnar file of every survey line for analysis, .npz or .parquet (needs pyarrow).')
+	parser.add_argument('-s', dest='lineSpacing', action='store', default='1000', help='-s <metres> : primary line spacing. [Default: 1000]')
+	parser.add_argument('-hdg', dest='lineHeading', action='store', default='-1', help='-hdg <degrees> : primary line heading, -1 for the long axis of each block, -2 for the shortest duration of each block. [Default: -1]')
+	parser.add_argument('-x', dest='crossLineMultiplier', action='store', default='15', help='-x <multiplier> : cross line spacing as a multiple of the primary line spacing, 0 for no cross lines. [Default: 15]')
+	parser.add_argument('-v', dest='vesselSpeedInKnots', action='store', default='3.5', help='-v <knots> : vessel speed. [Default: 3.5]')
+	parser.add_argument('-t', dest='turnDuration', action='store', default='10', help='-t <minutes> : turn duration at the end of each line. [Default: 10]')
+	parser.add_argument('-p', dest='linePrefix', action='store', default='MainLine', help='-p <prefix> : line prefix. Each block is named prefix_B<block>. [Default: MainLine]')
+	parser.add_argument('-w', dest='workers', action='store', default='0', help='-w <count> : number of worker processes, 0 for one per cpu. [Default: 0]')
+	parser.add_argument('-grid', dest='isGrid', action='store_true', default=False, help='-grid : the polygons are grid coordinates in metres rather than GeoJSON longitude, latitude.')
+
+	if len(sys.argv)==1:
+		parser.print_help()
+		sys.exit(1)
+
+	args = parser.parse_args()
+
+	lineSpacing = float(args.lineSpacing)
+	lineHeading = float(args.lineHeading)
+	crossLineMultiplier = float(args.crossLineMultiplier)
+	vesselSpeedInKnots = float(args.vesselSpeedInKnots)
+	turnDuration = float(args.turnDuration) / 60.0
+	workers = int(args.workers) or None
+
+	blocks = readGeoJSONBlocks(args.inputFile)
+	print ("Survey blocks loaded: %d" % (len(blocks)))
+	plan, blockPlans = planSurveyBatch(blocks, lineSpacing, lineHeading, crossLineMultiplier, vesselSpeedInKnots, turnDuration, args.linePrefix, not args.isGrid, workers)
+
+	for (blockName, polygonX, polygonY), blockPlan in zip(blocks, blockPlans):
+		print (summaryReport("Block %s Results" % (blockName), blockPlan.lineCount(), blockPlan.totalLength(), blockPlan.totalDuration()))
+	print ("##########################")
+	print (summaryReport("Entire Survey Results", plan.lineCount(), plan.totalLength(), plan.totalDuration()))
+
+	if len(args.outputFile) > 0 or len(args.columnarFile) > 0:
+		print ("Writing lines to:%s %s..." % (args.outputFile, args.columnarFile))
+		exportPlanToCSV(plan, args.outputFile or None, args.columnarFile or None)
+
+class surveyPlan:
+	'''A computed survey line plan.  A clipped line may be split into several segments by the polygon, so the per-line arrays and the per-segment arrays are held separately. segmentLine indexes each segment back to its line'''
+	def __init__(self):
+		self.lineNames			= []
+		self.linePrefixes		= []
+		self.lineBlocks			= []
+		self.lineHeadings		= np.empty(0)
+		self.lineSpacings		= np.empty(0)
+		self.lineOffsets		= np.empty(0)
+		self.lineLengths		= np.empty(0)
+		self.lineDurations		= np.empty(0)
+
+		self.segmentLine		= np.empty(0, dtype=np.int64)
+		self.segmentX1			= np.empty(0)
+		self.segmentY1			= np.empty(0)
+		self.segmentX2			= np.empty(0)
+		self.segmentY2			= np.empty(0)
+
+		self.vesselSpeedInKnots	= 0.0
+		self.turnDuration		= 0.0
+
+	def lineCount(self):
+		return len(self.lineNames)
+
+	def totalLength(self):
+		'''total clipped line length in metres'''
+		return float(np.sum(self.lineLengths))
+
+	def totalDuration(self):
+		'''total duration in hours, including a turn at the end of every line'''
+		return float(np.sum(self.lineDurations))
+
+	def extend(self, other):
+		'''append the lines from another plan to this one'''
+		self.segmentLine	= np.concatenate((self.segmentLine, other.segmentLine + self.lineCount()))
+		self.segmentX1		= np.concatenate((self.segmentX1, other.segmentX1))
+		self.segmentY1		= np.concatenate((self.segmentY1, other.segmentY1))
+		self.segmentX2		= np.concatenate((self.segmentX2, other.segmentX2))
+		self.segmentY2		= np.concatenate((self.segmentY2, other.segmentY2))
+
+		self.lineNames		= self.lineNames + other.lineNames
+		self.linePrefixes	= self.linePrefixes + other.linePrefixes
+		self.lineBlocks		= self.lineBlocks + other.lineBlocks
+		self.lineHeadings	= np.concatenate((self.lineHeadings, other.lineHeadings))
+		self.lineSpacings	= np.concatenate((self.lineSpacings, other.lineSpacings))
+		self.lineOffsets	= np.concatenate((self.lineOffsets, other.lineOffsets))
+		self.lineLengths	= np.concatenate((self.lineLengths, other.lineLengths))
+		self.lineDurations	= np.concatenate((self.lineDurations, other.lineDurations))
+
+	def computeDurations(self, vesselSpeedInKnots, turnDuration):
+		'''compute the duration of each line in hours. turnDuration is in hours and is added to every line'''
+		self.vesselSpeedInKnots = vesselSpeedInKnots
+		self.turnDuration = turnDuration
+		speed = vesselSpeedInKnots * (1852 / 3600) #convert from knots to metres/second
+		self.lineDurations = self.lineLengths / speed / 3600.0 + turnDuration
+
+	def toGeographicals(self, originLongitude, originLatitude):
+		'''project the segments of a plan computed in the local grid of geodetic.geographicalsToLocalGrid back to geographicals, and replace the line lengths with the geodesic lengths'''
+		self.segmentX1, self.segmentY1 = geodetic.localGridToGeographicals(self.segmentX1, self.segmentY1, originLongitude, originLatitude)
+		self.segmentX2, self.segmentY2 = geodetic.localGridToGeographicals(self.segmentX2, self.segmentY2, originLongitude, originLatitude)
+		segmentLengths, forward, reverse = geodetic.calculateRangeBearingFromGeographicalsArray(self.segmentX1, self.segmentY1, self.segmentX2, self.segmentY2)
+		self.lineLengths = np.bincount(self.segmentLine, weights=segmentLengths, minlength=self.lineCount())
+
+	def lineWKT(self, places=4):
+		'''return every line as a well known text MULTILINESTRING, in line order, so a cursor can write the lines without building arcpy geometry one point at a time. The text of every segment is built at once as numpy bytes, as the GEBCO exports are, with the coordinates to places decimals'''
+		order = np.argsort(self.segmentLine, kind='stable')
+		segmentLine = self.segmentLine[order]
+		count = len(order)
+		#the first segment of a line opens its MULTILINESTRING, and the last one closes it
+		first = np.ones(count, dtype=bool)
+		first[1:] = segmentLine[1:] != segmentLine[:-1]
+		last = np.ones(count, dtype=bool)
+		last[:-1] = first[1:]
+		opening = textColumn("MULTILINESTRING (", count)
+		opening[~first] = 0
+		closing = np.where(last[:, np.newaxis], textColumn(")\n", count), textColumn(", ", count))
+		text = np.hstack([opening, textColumn("(", count), geodetic.formatField(self.segmentX1[order], places), textColumn(" ", count), geodetic.formatField(self.segmentY1[order], places), textColumn(", ", count),
+			geodetic.formatField(self.segmentX2[order], places), textColumn(" ", count), geodetic.formatField(self.segmentY2[order], places), textColumn(")", count), closing]).ravel()
+		#the fields are padded with zero bytes, which are dropped here
+		lines = text[text != 0].tobytes().decode("ascii").split("\n")[:-1]
+		if len(lines) == self.lineCount():
+			return lines
+		#a line with no segments has no text of its own
+		lines = iter(lines)
+		counts = np.bincount(self.segmentLine, minlength=self.lineCount())
+		return [next(lines) if segments > 0 else "MULTILINESTRING EMPTY" for segments in counts.tolist()]
+
+	def lineSegments(self, line):
+		'''return the segments of a line as a list of ((x1, y1), (x2, y2)) tuples, in order along the line heading'''
+		idx = np.flatnonzero(self.segmentLine == line)
+		return [((self.segmentX1[i], self.segmentY1[i]), (self.segmentX2[i], self.segmentY2[i])) for i in idx]
+
+def textColumn(text, count):
+	'''the same ascii text repeated as count rows of bytes, to stack beside the fields of geodetic.formatField'''
+	return np.tile(np.frombuffer(text.encode("ascii"), dtype=np.uint8), (count, 1))
+
+###############################################################################
+def planSurveyLines(polygonX, polygonY, lineSpacing, lineHeading, crossLineMultiplier, vesselSpeedInKnots, turnDuration, linePrefix="MainLine", originX=None, originY=None, isGeographic=False, depthGrid=None, coverageMultiplier=None):
+	'''compute the primary and cross lines for a polygon, clipped to the polygon. Coordinates and line spacing are in metres, headings in degrees and turnDuration in hours. The lines are centred on the polygon centroid unless an origin is supplied.
+	If isGeographic, the polygon and origin are longitude, latitude in decimal degrees. The plan is computed in a local grid and returned in geographicals with geodesic line lengths.
+	If a depthGrid is supplied, lineSpacing is not used. The primary lines are spaced adaptively at coverageMultiplier times the depth, and the cross lines at crossLineMultiplier times the median primary spacing. The depthGrid is in the planning grid: the polygon's own grid, or for geographic polygons the local grid of geodetic.geographicalsToLocalGrid about the origin'''
+	x = np.asarray(polygonX, dtype=np.float64)
+	y = np.asarray(polygonY, dtype=np.float64)
+	if originX is None or originY is None:
+		originX, originY = polygonCentroid(x, y)
+
+	if depthGrid is not None:
+		plan = planAdaptiveLineSet(x, y, depthGrid, coverageMultiplier, lineHeading, vesselSpeedInKnots, turnDuration, linePrefix, originX, originY, isGeographic)
+		lineSpacing = float(np.median(plan.lineSpacings)) if plan.lineCount() > 0 else 0.0
+	else:
+		plan = planLineSet(x, y, lineSpacing, lineHeading, vesselSpeedInKnots, turnDuration, linePrefix, originX, originY, isGeographic)
+
+	if crossLineMultiplier > 0 and lineSpacing > 0:
+		hdg = geodetic.normalize360(lineHeading + 90)
+		crossLines = planLineSet(x, y, lineSpacing * crossLineMultiplier, hdg, vesselSpeedInKnots, turnDuration, linePrefix + "_X", originX, originY, isGeographic)
+		plan.extend(crossLines)
+	return plan
+
+def planLineSet(polygonX, polygonY, lineSpacing, lineHeading, vesselSpeedInKnots, turnDuration, linePrefix, originX, originY, isGeographic=False, offsetRange=None):
+	'''compute one set of parallel lines, either the primary lines or the cross lines, clipped to the polygon. If offsetRange is (vMin, vMax), only the lines with an offset in that range are computed, which is how an edit to the polygon is replanned'''
+	x, y, gridOriginX, gridOriginY = preparePolygon(polygonX, polygonY, originX, originY, isGeographic)
+	plan = planParallelLines(x, y, gridOriginX, gridOriginY, lineSpacing, lineHeading, linePrefix, offsetRange)
+	if isGeographic:
+		plan.toGeographicals(originX, originY)
+	plan.computeDurations(vesselSpeedInKnots, turnDuration)
+	return plan
+
+def planAdaptiveLineSet(polygonX, polygonY, depthGrid, coverageMultiplier, lineHeading, vesselSpeedInKnots, turnDuration, linePrefix, originX, originY, isGeographic=False):
+	'''compute the primary lines with a spacing which adapts to the depth, clipped to the polygon. The spacing of each line is recorded in lineSpacings'''
+	x, y, gridOriginX, gridOriginY = preparePolygon(polygonX, polygonY, originX, originY, isGeographic)
+	u, v = toLineFrame(x, y, gridOriginX, gridOriginY, lineHeading)
+	offsets, spacings = adaptiveLineOffsets(u, v, gridOriginX, gridOriginY, lineHeading, depthGrid, coverageMultiplier)
+	plan = planLinesAtOffsets(u, v, gridOriginX, gridOriginY, offsets, spacings, lineHeading, linePrefix)
+	if isGeographic:
+		plan.toGeographicals(originX, originY)
+	plan.computeDurations(vesselSpeedInKnots, turnDuration)
+	return plan
+
+###############################################################################
+def planFingerprint(polygonX, polygonY, lineSpacing, lineHeading, crossLineMultiplier, linePrefix, originX, originY, isGeographic):
+	'''return a dictionary of the inputs of a plan, which can be saved as JSON and compared with a later run to find out what needs to be replanned. The polygon is kept as well as its hash, so the edited edges can be found'''
+	x = np.asarray(polygonX, dtype=np.float64)
+	y = np.asarray(polygonY, dtype=np.float64)
+	return {
+		"polygonHash": hashlib.sha1(x.tobytes() + y.tobytes()).hexdigest(),
+		"polygonX": [None if math.isnan(value) else value for value in x.tolist()],
+		"polygonY": [None if math.isnan(value) else value for value in y.tolist()],
+		"lineSpacing": float(lineSpacing),
+		"lineHeading": float(lineHeading),
+		"crossLineMultiplier": float(crossLineMultiplier),
+		"linePrefix": linePrefix,
+		"originX": float(originX),
+		"originY": float(originY),
+		"isGeographic": bool(isGeographic),
+		}
+
+def editedOffsetRange(oldX, oldY, newX, newY, lineHeading, originX, originY, isGeographic=False):
+	'''return the (vMin, vMax) range of line offsets crossed by the edges which differ between two versions of a polygon, or None if the edges are the same. Only lines in this range can clip differently'''
+	oldX, oldY, gridOriginX, gridOriginY = preparePolygon(np.array(oldX, dtype=np.float64), np.array(oldY, dtype=np.float64), originX, originY, isGeographic)
+	newX, newY, gridOriginX, gridOriginY = preparePolygon(np.array(newX, dtype=np.float64), np.array(newY, dtype=np.float64), originX, originY, isGeographic)
+	oldEdges = np.column_stack(polygonEdges(oldX, oldY))
+	newEdges = np.column_stack(polygonEdges(newX, newY))
+	oldKeys = set(map(tuple, oldEdges.tolist()))
+	newKeys = set(map(tuple, newEdges.tolist()))
+	changed = [edge for edge in oldEdges.tolist() if tuple(edge) not in newKeys] + [edge for edge in newEdges.tolist() if tuple(edge) not in oldKeys]
+	if len(changed) == 0:
+		return None
+	changed = np.array(changed)
+	u, v = toLineFrame(np.concatenate((changed[:, 0], changed[:, 2])), np.concatenate((changed[:, 1], changed[:, 3])), gridOriginX, gridOriginY, lineHeading)
+	return float(np.min(v)), float(np.max(v))
+
+###############################################################################
+def estimateSurvey(polygonX, polygonY, lineSpacing, lineHeading, crossLineMultiplier, vesselSpeedInKnots, turnDuration, originX=None, originY=None, isGeographic=False, depthGrid=None, coverageMultiplier=None):
+	'''fast estimate of a survey without creating any line geometry. Only the summed chord length of each line across the polygon is computed, which is all that is needed for the totals. Geographic polygons are estimated in the local grid, so lengths carry its scale error of a few parts in 1e5. A depthGrid gives adaptive line spacing, as in planSurveyLines. Returns (lineCount, totalLength in metres, totalDuration in hours)'''
+	x, y, originX, originY = preparePolygon(polygonX, polygonY, originX, originY, isGeographic)
+
+	if depthGrid is not None:
+		u, v = toLineFrame(x, y, originX, originY, lineHeading)
+		offsets, spacings = adaptiveLineOffsets(u, v, originX, originY, lineHeading, depthGrid, coverageMultiplier)
+		lineCount, totalLength = estimateLinesAtOffsets(u, v, offsets)
+		lineSpacing = float(np.median(spacings)) if len(spacings) > 0 else 0.0
+	else:
+		lineCount, totalLength = estimateParallelLines(x, y, originX, originY, lineSpacing, lineHeading)
+
+	if crossLineMultiplier > 0 and lineSpacing > 0:
+		hdg = geodetic.normalize360(lineHeading + 90)
+		crossLineCount, crossLineLength = estimateParallelLines(x, y, originX, originY, lineSpacing * crossLineMultiplier, hdg)
+		lineCount += crossLineCount
+		totalLength += crossLineLength
+
+	speed = vesselSpeedInKnots * (1852 / 3600) #convert from knots to metres/second
+	totalDuration = totalLength / speed / 3600.0 + lineCount * turnDuration
+	return lineCount, totalLength, totalDuration
+
+def estimateParallelLines(x, y, originX, originY, lineSpacing, lineHeading):
+	'''return the number of lines which intersect the polygon and their total clipped length, from the width profile of the polygon across the line heading'''
+	u, v = toLineFrame(x, y, originX, originY, lineHeading)
+	offsets = computeLineOffsets(v, lineSpacing)
+	return estimateLinesAtOffsets(u, v, offsets)
+
+def estimateLinesAtOffsets(u, v, offsets):
+	'''return the number of lines at these offsets which intersect the polygon, and their total clipped length'''
+	segmentLine, uStart, uEnd = clipParallelLines(u, v, offsets)
+	lineCount = np.count_nonzero(np.bincount(segmentLine, minlength=len(offsets)))
+	return int(lineCount), float(np.sum(uEnd - uStart))
+
+###############################################################################
+def optimiseHeading(polygonX, polygonY, lineSpacing, crossLineMultiplier, vesselSpeedInKnots, turnDuration, sweepStep=5.0, tolerance=0.05, workers=None, originX=None, originY=None, isGeographic=False, depthGrid=None, coverageMultiplier=None):
+	'''find the line heading which minimises the total survey duration, including turns and cross lines.  A coarse sweep over 0-180 degrees is evaluated in parallel (a heading and its reciprocal give the same plan), then the best heading is refined with a golden-section search. A depthGrid sweeps the adaptive line spacing, as in planSurveyLines.
+	The sweep is split into one run of headings per worker process, but only if the time that saves pays for starting the workers, as in planSurveyBatch. A plain polygon takes about a millisecond a heading, so it is swept in this process, while a large adaptive plan goes to the workers. Set workers to 1 to never start any, e.g. inside a worker already.
+	Returns (heading, duration in hours, curve) where curve is a list of (heading, duration) pairs for every heading evaluated, sorted by heading'''
+	x, y, originX, originY = preparePolygon(polygonX, polygonY, originX, originY, isGeographic)
+
+	def duration(heading):
+		return estimateSurvey(x, y, lineSpacing, heading, crossLineMultiplier, vesselSpeedInKnots, turnDuration, originX, originY, depthGrid=depthGrid, coverageMultiplier=coverageMultiplier)[2]
+
+	durations = {}
+	def evaluate(heading):
+		heading = geodetic.normalize360(heading) % 180
+		if heading not in durations:
+			durations[heading] = duration(heading)
+		return durations[heading]
+
+	#coarse sweep. The first heading is timed here, and the rest go to the workers in one run of headings each if that saves more than starting them costs
+	headings = [float(h) for h in np.arange(0.0, 180.0, sweepStep)]
+	workers = min(workers or os.cpu_count() or 1, os.cpu_count() or 1)
+	started = time.perf_counter()
+	results = [duration(headings[0])]
+	rest = headings[1:]
+	serialSeconds = (time.perf_counter() - started) * len(rest)
+	if workers == 1 or serialSeconds * (1 - 1.0 / workers) <= WORKER_STARTUP_SECONDS * workers:
+		results += [duration(heading) for heading in rest]
+	else:
+		tasks = [(x, y, lineSpacing, rest[worker * len(rest) // workers:(worker + 1) * len(rest) // workers], crossLineMultiplier, vesselSpeedInKnots, turnDuration, originX, originY, depthGrid, coverageMultiplier) for worker in range(workers)]
+		with ProcessPoolExecutor(max_workers=workers) as executor:
+			for sweep in executor.map(sweepHeadings, tasks):
+				results += sweep
+	durations.update(zip(headings, results))
+	best = headings[int(np.argmin(results))]
+
+	#golden-section refinement within one sweep step either side of the best coarse heading. Each pass keeps one of the two inner headings, so only one new heading is evaluated
+	invPhi = (math.sqrt(5) - 1) / 2
+	a = best - sweepStep
+	b = best + sweepStep
+	c = b - invPhi * (b - a)
+	d = a + invPhi * (b - a)
+	durationC = evaluate(c)
+	durationD = evaluate(d)
+	while (b - a) > tolerance:
+		if durationC < durationD:
+			b = d
+			d = c
+			durationD = durationC
+			c = b - invPhi * (b - a)
+			durationC = evaluate(c)
+		else:
+			a = c
+			c = d
+			durationC = durationD
+			d = a + invPhi * (b - a)
+			durationD = evaluate(d)
+
+	curve = sorted(durations.items())
+	heading, duration = min(curve, key=lambda item: item[1])
+	return heading, duration, curve
+
+def sweepHeadings(task):
+	'''the durations of a run of headings of the coarse sweep. This runs in a worker process, so it is a module level function which takes a single picklable tuple'''
+	x, y, lineSpacing, headings, crossLineMultiplier, vesselSpeedInKnots, turnDuration, originX, originY, depthGrid, coverageMultiplier = task
+	return [estimateSurvey(x, y, lineSpacing, heading, crossLineMultiplier, vesselSpeedInKnots, turnDuration, originX, originY, depthGrid=depthGrid, coverageMultiplier=coverageMultiplier)[2] for heading in headings]
+
+###############################################################################
+def planSurveyBatch(blocks, lineSpacing, lineHeading, crossLineMultiplier, vesselSpeedInKnots, turnDuration, linePrefix="MainLine", isGeographic=False, workers=None):
+	'''plan many survey blocks, spread over worker processes when that is quicker. blocks is a list of (blockName, polygonX, polygonY). Each block is centred on its own centroid and its lines are prefixed linePrefix_B<blockName>. A line heading of -1 uses the long axis of each block and -2 searches for the heading with the shortest duration of each block.
+	Returns (plan, blockPlans) where plan holds every line of every block and blockPlans is the plan of each block, in the order of the blocks'''
+	tasks = [(blockName, polygonX, polygonY, lineSpacing, lineHeading, crossLineMultiplier, vesselSpeedInKnots, turnDuration, linePrefix, isGeographic) for blockName, polygonX, polygonY in blocks]
+	#more processes than cpus only add start up and pickling
+	workers = min(workers or os.cpu_count() or 1, os.cpu_count() or 1)
+
+	#time the first few blocks here. The rest only go to worker processes if the time they save on the blocks left pays for starting them
+	started = time.perf_counter()
+	blockPlans = [planSurveyBlock(task) for task in tasks[:BATCH_TIMING_BLOCKS]]
+	tasks = tasks[BATCH_TIMING_BLOCKS:]
+	serialSeconds = (time.perf_counter() - started) / max(len(blockPlans), 1) * len(tasks)
+	if workers == 1 or serialSeconds * (1 - 1.0 / workers) <= WORKER_STARTUP_SECONDS * workers:
+		blockPlans += [planSurveyBlock(task) for task in tasks]
+	else:
+		#hand the blocks out in a few chunks per worker, so small blocks do not pay for a round trip each
+		chunksize = max(1, len(tasks) // (workers * 4))
+		with ProcessPoolExecutor(max_workers=workers) as executor:
+			blockPlans += list(executor.map(planSurveyBlock, tasks, chunksize=chunksize))
+	return mergePlans(blockPlans), blockPlans
+
+def planSurveyBlock(task):
+	'''plan one block of a batch. This runs in a worker process, so it is a module level function which takes a single picklable tuple'''
+	blockName, polygonX, polygonY, lineSpacing, lineHeading, crossLineMultiplier, vesselSpeedInKnots, turnDuration, linePrefix, isGeographic = task
+	x = np.asarray(polygonX, dtype=np.float64)
+	y = np.asarray(polygonY, dtype=np.float64)
+	originX, originY = polygonCentroid(x, y)
+	if lineHeading == -1:
+		lineHeading = longestEdgeHeading(x, y, isGeographic)
+	elif lineHeading == -2:
+		lineHeading = optimiseHeading(x, y, lineSpacing, crossLineMultiplier, vesselSpeedInKnots, turnDuration, workers=1, originX=originX, originY=originY, isGeographic=isGeographic)[0]
+	plan = planSurveyLines(x, y, lineSpacing, lineHeading, crossLineMultiplier, vesselSpeedInKnots, turnDuration, linePrefix + "_B" + str(blockName), originX, originY, isGeographic)
+	plan.lineBlocks = [str(blockName)] * plan.lineCount()
+	return plan
+
+def mergePlans(plans):
+	'''merge a list of plans into one plan in a single pass, rather than extending one plan at a time'''
+	merged = surveyPlan()
+	if len(plans) == 0:
+		return merged
+	lineCounts = np.array([plan.lineCount() for plan in plans], dtype=np.int64)
+	lineStarts = np.cumsum(lineCounts) - lineCounts
+	merged.segmentLine = np.concatenate([plan.segmentLine + start for plan, start in zip(plans, lineStarts)])
+	for name in ("segmentX1", "segmentY1", "segmentX2", "segmentY2", "lineHeadings", "lineSpacings", "lineOffsets", "lineLengths", "lineDurations"):
+		setattr(merged, name, np.concatenate([getattr(plan, name) for plan in plans]))
+	merged.lineNames = [name for plan in plans for name in plan.lineNames]
+	merged.linePrefixes = [prefix for plan in plans for prefix in plan.linePrefixes]
+	merged.lineBlocks = [block for plan in plans for block in plan.lineBlocks]
+	merged.vesselSpeedInKnots = plans[0].vesselSpeedInKnots
+	merged.turnDuration = plans[0].turnDuration
+	return merged
+
+def longestEdgeHeading(polygonX, polygonY, isGeographic=False):
+	'''return the heading of the longest edge of the polygon, which is generally the most efficient line heading'''
+	x1, y1, x2, y2 = polygonEdges(polygonX, polygonY)
+	if len(x1) == 0:
+		return 0.0
+	rng, brg = geodetic.calculateRangeBearingFromCoordinatesArray(x1, y1, x2, y2, isGeographic)
+	return float(brg[np.argmax(rng)])
+
+def summaryReport(title, lineCount, totalLength, totalDuration):
+	'''format the line count, length and duration of a plan the same way as the toolbox survey report'''
+	msg = title + "\n"
+	msg += "Line Count:				%d Lines\n" % (lineCount)
+	msg += "Total Line Length:				%.2f Km\n" % (totalLength/1000)
+	msg += "Duration:				%.2f Hours\n" % (totalDuration)
+	msg += "Duration:				%.2f Days\n" % (totalDuration/24)
+	return msg
+
+def readGeoJSONBlocks(fileName):
+	'''read the Polygon and MultiPolygon features of a GeoJSON file into a list of (blockName, polygonX, polygonY). Rings and parts are separated by NaN. The block is named from the name or id property of the feature, or its position in the file'''
+	with open(fileName) as f:
+		geojson = json.load(f)
+	features = geojson.get("features", [geojson]) if geojson.get("type") == "FeatureCollection" else [geojson]
+
+	blocks = []
+	for index, feature in enumerate(features):
+		geometry = feature.get("geometry", feature)
+		if geometry is None:
+			continue
+		if geometry.get("type") == "Polygon":
+			polygons = [geometry["coordinates"]]
+		elif geometry.get("type") == "MultiPolygon":
+			polygons = geometry["coordinates"]
+		else:
+			continue
+		xc = []
+		yc = []
+		for polygon in polygons:
+			for ring in polygon:
+				for point in ring:
+					xc.append(point[0])
+					yc.append(point[1])
+				xc.append(math.nan)
+				yc.append(math.nan)
+		properties = feature.get("properties") or {}
+		blockName = properties.get("name", properties.get("id", feature.get("id", index + 1)))
+		blocks.append((blockName, xc, yc))
+	return blocks
+
+def exportPlanToCSV(plan, fileName, columnarFileName=None):
+	'''write every line of a plan to a CSV file, in the same layout as the toolbox report, and optionally to a columnar .npz or .parquet file'''
+	first = np.full(plan.lineCount(), -1, dtype=np.int64)
+	last = np.full(plan.lineCount(), -1, dtype=np.int64)
+	segments = np.arange(len(plan.segmentLine))
+	first[plan.segmentLine[::-1]] = segments[::-1]
+	last[plan.segmentLine] = segments
+	with surveyreport.surveyReportWriter(fileName, columnarFileName) as writer:
+		for line in range(plan.lineCount()):
+			writer.writeRow(plan.lineNames[line], plan.lineSpacings[line], plan.segmentX1[first[line]], plan.segmentY1[first[line]], plan.segmentX2[last[line]], plan.segmentY2[last[line]], plan.lineLengths[line], plan.lineHeadings[line], plan.vesselSpeedInKnots, plan.lineDurations[line] - plan.turnDuration, plan.turnDuration)
+
+###############################################################################
+def lineDepthProfiles(segmentLine, segmentX1, segmentY1, segmentX2, segmentY2, lineSpacings, sampleDepths, coverageMultiplier, sampleInterval, isGeographic=False):
+	'''sample the depth along every line in one batch, every sampleInterval metres and at both ends of every segment. sampleDepths(x, y) returns the elevations, negative below sea level, at arrays of coordinates, e.g. soundingGrid.sample.
+	Returns (minDepth, meanDepth, maxDepth, underCoverage) arrays, one value per line. The depths are of the water along the line, and the mean is weighted by length. underCoverage is the percentage of the line where the swath, coverageMultiplier times the depth, is narrower than the line spacing, and land along the line counts as undercovered. Lines without soundings are NaN, lines with nothing but land have NaN depths, and the underCoverage of lines with a NaN spacing, such as cross lines, which are not spaced for coverage, is NaN'''
+	segmentLine = np.asarray(segmentLine, dtype=np.int64)
+	segmentX1 = np.asarray(segmentX1, dtype=np.float64)
+	segmentY1 = np.asarray(segmentY1, dtype=np.float64)
+	segmentX2 = np.asarray(segmentX2, dtype=np.float64)
+	segmentY2 = np.asarray(segmentY2, dtype=np.float64)
+	lineSpacings = np.asarray(lineSpacings, dtype=np.float64)
+	lineCount = len(lineSpacings)
+	segmentLengths, bearings = geodetic.calculateRangeBearingFromCoordinatesArray(segmentX1, segmentY1, segmentX2, segmentY2, isGeographic)
+
+	#every segment gets at least its two ends, and each sample stands for the length either side of it
+	samples = np.maximum(np.ceil(segmentLengths / sampleInterval).astype(np.int64), 1) + 1
+	segment = np.repeat(np.arange(len(samples)), samples)
+	position = np.arange(np.sum(samples)) - np.repeat(np.cumsum(samples) - samples, samples)
+	fraction = position / (samples[segment] - 1)
+	x = segmentX1[segment] + (segmentX2 - segmentX1)[segment] * fraction
+	y = segmentY1[segment] + (segmentY2 - segmentY1)[segment] * fraction
+	weights = segmentLengths[segment] / (samples[segment] - 1)
+	weights[(position == 0) | (position == samples[segment] - 1)] *= 0.5
+	line = segmentLine[segment]
+
+	elevations = sampleDepths(x, y)
+	valid = np.isfinite(elevations)
+	line = line[valid]
+	depths = -elevations[valid]
+	weights = weights[valid]
+
+	#soundings at or above sea level are land, which no swath covers, so they count as undercovered and are left out of the depths
+	water = depths > 0
+	under = ~water | ((coverageMultiplier * depths) < lineSpacings[line])
+	totalWeight = np.bincount(line, weights=weights, minlength=lineCount)
+	waterLine = line[water]
+	waterDepths = depths[water]
+	waterWeights = weights[water]
+
+	minDepth = np.full(lineCount, np.inf)
+	maxDepth = np.full(lineCount, -np.inf)
+	np.minimum.at(minDepth, waterLine, waterDepths)
+	np.maximum.at(maxDepth, waterLine, waterDepths)
+	waterWeight = np.bincount(waterLine, weights=waterWeights, minlength=lineCount)
+	with np.errstate(invalid='ignore', divide='ignore'):
+		meanDepth = np.bincount(waterLine, weights=waterWeights * waterDepths, minlength=lineCount) / waterWeight
+		underCoverage = np.bincount(line, weights=weights * under, minlength=lineCount) / totalWeight * 100.0
+	#a line sampled at a single point has no length to weight by, so fall back to a plain count
+	counts = np.bincount(line, minlength=lineCount)
+	waterCounts = np.bincount(waterLine, minlength=lineCount)
+	single = (totalWeight == 0) & (counts > 0)
+	with np.errstate(invalid='ignore', divide='ignore'):
+		meanDepth[single] = np.bincount(waterLine, weights=waterDepths, minlength=lineCount)[single] / waterCounts[single]
+	underCoverage[single] = np.bincount(line, weights=under, minlength=lineCount)[single] / counts[single] * 100.0
+	dry = waterCounts == 0
+	minDepth[dry] = np.nan
+	maxDepth[dry] = np.nan
+	meanDepth[dry] = np.nan
+	underCoverage[counts == 0] = np.nan
+	underCoverage[~np.isfinite(lineSpacings)] = np.nan
+	return minDepth, meanDepth, maxDepth, underCoverage
+
+###############################################################################
+def planParallelLines(x, y, originX, originY, lineSpacing, lineHeading, linePrefix, offsetRange=None):
+	'''compute a set of parallel lines at lineSpacing through the origin, clipped to the polygon. The centreline passes through the origin, then starboard and port lines are offset from it. offsetRange optionally limits the lines to those with offsets in (vMin, vMax)'''
+	u, v = toLineFrame(x, y, originX, originY, lineHeading)
+	offsets = computeLineOffsets(v, lineSpacing)
+	if offsetRange is not None:
+		offsets = offsets[(offsets >= offsetRange[0]) & (offsets <= offsetRange[1])]
+	return planLinesAtOffsets(u, v, originX, originY, offsets, np.full(len(offsets), float(lineSpacing)), lineHeading, linePrefix)
+
+def planLinesAtOffsets(u, v, originX, originY, offsets, lineSpacings, lineHeading, linePrefix):
+	'''compute the lines at these offsets from the origin, clipped to the polygon in the line frame. Lines which miss the polygon are dropped'''
+	plan = surveyPlan()
+	segmentLine, uStart, uEnd = clipParallelLines(u, v, offsets)
+
+	#drop lines which do not intersect the polygon at all, keeping the order of the survivors
+	lines = np.unique(segmentLine)
+	remap = np.full(len(offsets), -1, dtype=np.int64)
+	remap[lines] = np.arange(len(lines))
+	offsets = offsets[lines]
+	lineSpacings = np.asarray(lineSpacings, dtype=np.float64)[lines]
+
+	plan.segmentLine = remap[segmentLine]
+	plan.segmentX1, plan.segmentY1 = fromLineFrame(uStart, offsets[plan.segmentLine], originX, originY, lineHeading)
+	plan.segmentX2, plan.segmentY2 = fromLineFrame(uEnd, offsets[plan.segmentLine], originX, originY, lineHeading)
+
+	plan.lineNames = [lineName(linePrefix, offset) for offset in offsets]
+	plan.linePrefixes = [linePrefix] * len(offsets)
+	plan.lineBlocks = [""] * len(offsets)
+	plan.lineHeadings = np.full(len(offsets), float(lineHeading))
+	plan.lineSpacings = lineSpacings
+	plan.lineOffsets = offsets
+	plan.lineLengths = np.bincount(plan.segmentLine, weights=uEnd - uStart, minlength=len(offsets))
+	return plan
+
+###############################################################################
+def computeLineOffsets(v, lineSpacing):
+	'''compute the offsets of all lines which may intersect the polygon, in the order centreline, starboard lines outwards, then port lines outwards'''
+	vMin = np.nanmin(v)
+	vMax = np.nanmax(v)
+	starboard = np.arange(1, max(math.floor(vMax / lineSpacing), 0) + 1) * lineSpacing
+	port = -np.arange(1, max(math.floor(-vMin / lineSpacing), 0) + 1) * lineSpacing
+	return np.concatenate(([0.0], starboard, port))
+
+def adaptiveLineOffsets(u, v, originX, originY, lineHeading, depthGrid, coverageMultiplier, minimumSpacing=1.0):
+	'''compute the offsets of lines spaced to the depth, working from the port edge of the polygon to starboard. Each line is placed half a swath beyond the swath edge of the previous line, where the swath is coverageMultiplier times the shallowest depth along that edge. If the seafloor shoals under the new line, its swath edge is pulled in to match. A line is never placed behind the swath edge already covered, and stretches with nothing but land along them get no lines. Depths come from a profile computed once, so the lines are stepped out in plain python. Returns (offsets, spacings)'''
+	vMin = float(np.nanmin(v))
+	vMax = float(np.nanmax(v))
+	profileStart, profileStep, profile = shallowestDepthProfile(u, v, originX, originY, lineHeading, depthGrid)
+	profile = profile.tolist()
+	lastBin = len(profile) - 1
+
+	def profileBin(offset):
+		#an offset on the boundary of two bins, to within rounding, is in the starboard one
+		return min(max(int((offset - profileStart) / profileStep + 1e-9), 0), lastBin)
+
+	def swath(offset, default):
+		depth = profile[profileBin(offset)]
+		if math.isnan(depth) or depth <= 0:
+			return default
+		return max(coverageMultiplier * depth, minimumSpacing)
+
+	#until we find a sounding, fall back to the median depth of the grid
+	spacing = coverageMultiplier * depthGrid.medianDepth()
+	if math.isnan(spacing):
+		return np.empty(0), np.empty(0)
+	spacing = max(spacing, minimumSpacing)
+
+	offsets = []
+	spacings = []
+	edge = vMin
+	#a line on the boundary clips to nothing, so the last line is kept just inside the polygon. Once the edge is that close to the boundary there is nothing left to cover
+	while edge < vMax - minimumSpacing / 2:
+		landBin = profileBin(edge)
+		if profile[landBin] == 0:
+			edge = profileStart + (landBin + 1) * profileStep
+			continue
+		spacing = swath(edge, spacing)
+		offset = min(edge + spacing / 2, vMax - minimumSpacing / 2)
+		offsets.append(offset)
+		spacings.append(spacing)
+		edge = offset + min(spacing, swath(offset, spacing)) / 2
+	return np.array(offsets), np.array(spacings)
+
+def shallowestDepthProfile(u, v, originX, originY, lineHeading, depthGrid):
+	'''return (start, step, profile) where profile[i] is the shallowest depth inside the polygon along the lines with offsets from start + i * step to start + (i + 1) * step, and its neighbours either side, so it is safe to use anywhere in the bin. Lines are sampled at the smaller cell size of the depth grid.
+	Soundings at or above sea level give no coverage, so they are left out of the shallowest depth, and a bin with nothing but those is 0. Bins without soundings are NaN'''
+	step = min(depthGrid.cellSizeX, depthGrid.cellSizeY)
+	vMin = float(np.nanmin(v))
+	vMax = float(np.nanmax(v))
+	count = max(int(math.ceil((vMax - vMin) / step)), 1)
+	binOffsets = vMin + (np.arange(count) + 0.5) * step
+	segmentLine, uStart, uEnd = clipParallelLines(u, v, binOffsets)
+
+	#sample each clipped segment at both ends and every cell in between
+	samples = np.ceil((uEnd - uStart) / step).astype(np.int64) + 1
+	segment = np.repeat(np.arange(len(samples)), samples)
+	position = np.arange(np.sum(samples)) - np.repeat(np.cumsum(samples) - samples, samples)
+	sampleU = uStart[segment] + (uEnd - uStart)[segment] * position / (samples[segment] - 1)
+	sampleBin = segmentLine[segment]
+	x, y = fromLineFrame(sampleU, binOffsets[sampleBin], originX, originY, lineHeading)
+	elevations = depthGrid.sample(x, y)
+
+	profile = np.full(count, np.inf)
+	water = elevations < 0
+	np.minimum.at(profile, sampleBin[water], -elevations[water])
+	landOnly = np.zeros(count, dtype=bool)
+	landOnly[sampleBin[elevations >= 0]] = True
+	landOnly &= np.isinf(profile)
+	profile[np.isinf(profile)] = np.nan
+	profile[1:] = np.fmin(profile[1:], profile[:-1].copy())
+	profile[:-1] = np.fmin(profile[:-1], profile[1:].copy())
+	profile[landOnly] = 0.0
+	return vMin, step, profile
+
+def lineName(linePrefix, offset):
+	'''name a line by its offset from the centreline, e.g. MainLine_S200.0, MainLine_P-200.0'''
+	if offset == 0:
+		return linePrefix + "_Centreline"
+	if offset > 0:
+		return linePrefix + "_S" + str("%.1f" % (offset))
+	return linePrefix + "_P" + str("%.1f" % (offset))
+
+###############################################################################
+def clipParallelLines(u, v, offsets):
+	'''clip lines of constant v against the polygon edges using the even-odd rule, so concave polygons and interior rings are handled. All lines are clipped in a single pass: every edge is paired with only the lines it crosses, so the work is proportional to the number of intersections. Returns the line index, start and end u of every clipped segment'''
+	u1, v1, u2, v2 = polygonEdges(u, v)
+	offsets = np.asarray(offsets, dtype=np.float64)
+
+	#an edge crosses every line with vLow <= offset < vHigh.  Horizontal edges cross nothing.
+	order = np.argsort(offsets, kind='stable')
+	sortedOffsets = offsets[order]
+	first = np.searchsorted(sortedOffsets, np.minimum(v1, v2), 'left')
+	last = np.searchsorted(sortedOffsets, np.maximum(v1, v2), 'left')
+	counts = last - first
+
+	#expand into one entry per (edge, line) intersection
+	edge = np.repeat(np.arange(len(u1)), counts)
+	position = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(first, counts)
+	line = order[position]
+	t = (offsets[line] - v1[edge]) / (v2[edge] - v1[edge])
+	crossings = u1[edge] + t * (u2[edge] - u1[edge])
+
+	#sort the intersections along each line. Each line crosses the boundary an even number of times, so consecutive pairs are inside intervals
+	sort = np.lexsort((crossings, line))
+	line = line[sort]
+	crossings = crossings[sort]
+	segmentLine = line[0::2]
+	starts = crossings[0::2]
+	ends = crossings[1::2]
+	keep = ends > starts
+	return segmentLine[keep], starts[keep], ends[keep]
+
+###############################################################################
+def pointsInPolygon(x, y, polygonX, polygonY):
+	'''return a boolean mask of the points inside the polygon, using the even-odd rule so interior rings are holes. Like clipParallelLines, every edge is paired with only the points level with it, so the work is proportional to the number of crossings rather than points times edges'''
+	x = np.asarray(x, dtype=np.float64)
+	y = np.asarray(y, dtype=np.float64)
+	x1, y1, x2, y2 = polygonEdges(polygonX, polygonY)
+
+	#an edge is level with every point with yLow <= y < yHigh.  Horizontal edges are level with nothing.
+	order = np.argsort(y, kind='stable')
+	sortedY = y[order]
+	first = np.searchsorted(sortedY, np.minimum(y1, y2), 'left')
+	last = np.searchsorted(sortedY, np.maximum(y1, y2), 'left')
+	counts = last - first
+
+	edge = np.repeat(np.arange(len(x1)), counts)
+	position = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(first, counts)
+	point = order[position]
+	t = (y[point] - y1[edge]) / (y2[edge] - y1[edge])
+	crossings = x1[edge] + t * (x2[edge] - x1[edge])
+
+	#count the edges crossed by a ray from each point towards +x. An odd count is inside
+	crossed = np.bincount(point[crossings > x[point]], minlength=len(x))
+	return crossed % 2 == 1
+
+###############################################################################
+def preparePolygon(polygonX, polygonY, originX, originY, isGeographic):
+	'''return the polygon as float grid arrays and the origin of the plan, defaulting to the polygon centroid. Geographic polygons are projected into the local grid centred on the origin, so the origin becomes (0, 0)'''
+	x = np.asarray(polygonX, dtype=np.float64)
+	y = np.asarray(polygonY, dtype=np.float64)
+	if originX is None or originY is None:
+		originX, originY = polygonCentroid(x, y)
+	if isGeographic:
+		x, y = geodetic.geographicalsToLocalGrid(x, y, originX, originY)
+		originX, originY = 0.0, 0.0
+	return x, y, originX, originY
+
+###############################################################################
+def polygonEdges(x, y):
+	'''return the edges of a polygon as arrays of start and end coordinates. Rings are separated by NaN and are closed if the last vertex does not repeat the first'''
+	x1 = []
+	y1 = []
+	x2 = []
+	y2 = []
+	for rx, ry in polygonRings(x, y):
+		if rx[0] != rx[-1] or ry[0] != ry[-1]:
+			rx = np.append(rx, rx[0])
+			ry = np.append(ry, ry[0])
+		x1.append(rx[:-1])
+		y1.append(ry[:-1])
+		x2.append(rx[1:])
+		y2.append(ry[1:])
+	if len(x1) == 0:
+		return np.empty(0), np.empty(0), np.empty(0), np.empty(0)
+	return np.concatenate(x1), np.concatenate(y1), np.concatenate(x2), np.concatenate(y2)
+
+def polygonRings(x, y):
+	'''split NaN separated coordinate arrays into a list of (x, y) rings'''
+	x = np.asarray(x, dtype=np.float64)
+	y = np.asarray(y, dtype=np.float64)
+	breaks = np.flatnonzero(np.isnan(x) | np.isnan(y))
+	rings = []
+	start = 0
+	for end in np.append(breaks, len(x)):
+		if end - start > 2:
+			rings.append((x[start:end], y[start:end]))
+		start = end + 1
+	return rings
+
+def polygonCentroid(x, y):
+	'''compute the area centroid of a polygon. Interior rings wound in the opposite direction to the exterior ring are subtracted'''
+	area = 0.0
+	cx = 0.0
+	cy = 0.0
+	for rx, ry in polygonRings(x, y):
+		cross = rx * np.roll(ry, -1) - np.roll(rx, -1) * ry
+		area += np.sum(cross) / 2.0
+		cx += np.sum((rx + np.roll(rx, -1)) * cross) / 6.0
+		cy += np.sum((ry + np.roll(ry, -1)) * cross) / 6.0
+	if area == 0:
+		return float(np.nanmean(x)), float(np.nanmean(y))
+	return cx / area, cy / area
+
+###############################################################################
+def toLineFrame(x, y, originX, originY, lineHeading):
+	'''rotate grid coordinates into the line frame: u along the line heading, v to starboard'''
+	h = math.radians(lineHeading)
+	dx = x - originX
+	dy = y - originY
+	u = dx * math.sin(h) + dy * math.cos(h)
+	v = dx * math.cos(h) - dy * math.sin(h)
+	return u, v
+
+def fromLineFrame(u, v, originX, originY, lineHeading):
+	'''rotate line frame coordinates back onto the grid'''
+	h = math.radians(lineHeading)
+	x = originX + u * math.sin(h) + v * math.cos(h)
+	y = originY + u * math.cos(h) - v * math.sin(h)
+	return x, y
+
+###############################################################################
+if __name__ == "__main__":
+		main()
@@ -0,0 +1,143 @@
+#name:			soundinggrid
+#description:   in memory depth raster of a sounding grid, so depths can be sampled anywhere in a survey area without a round trip to the geodatabase
+#designed for:  ArcGISPro 2.2.4 or standalone python with numpy
+
+# See readme.md for more details
+
+# The raster is a regular grid of cells, each holding the mean of the soundings which fall in it.  Cells without
+# soundings are NaN.  The cells hold elevations, negative below sea level, as GEBCO does, and a cell at or above sea
+# level is land.  Sounding layers which store depths positive down are negated as they are gridded, so the median
+# depth, the depth profiles and the adaptive line spacing of the line planner all see the same sign.
+
+import math
+import numpy as np
+
+import lineplanner
+
+class soundingGrid:
+	'''A regular raster of depths. Cell [row, col] is centred on (originX + col * cellSizeX, originY + row * cellSizeY). The cells are square unless cellSizeY is given'''
+	def __init__(self, depths, originX, originY, cellSizeX, cellSizeY=None):
+		self.depths		= np.asarray(depths, dtype=np.float64)
+		self.originX	= float(originX)
+		self.originY	= float(originY)
+		self.cellSizeX	= float(cellSizeX)
+		self.cellSizeY	= float(cellSizeX if cellSizeY is None else cellSizeY)
+
+	@classmethod
+	def fromPoints(cls, x, y, z, cellSizeX=None, cellSizeY=None, positiveDown=None):
+		'''grid scattered soundings, averaging the soundings in each cell. If cellSizeX is None the cell sizes are estimated from the soundings, which recovers the spacing along each axis of a regular grid such as GEBCO. cellSizeY defaults to cellSizeX. Set positiveDown if z holds depths positive down rather than elevations, or leave it None to decide with isPositiveDown'''
+		x = np.asarray(x, dtype=np.float64)
+		y = np.asarray(y, dtype=np.float64)
+		z = np.asarray(z, dtype=np.float64)
+		valid = np.isfinite(x) & np.isfinite(y) & np.isfinite(z)
+		x = x[valid]
+		y = y[valid]
+		z = z[valid]
+		if positiveDown is None:
+			positiveDown = isPositiveDown(z)
+		if positiveDown:
+			z = -z
+		if len(z) == 0:
+			return cls(np.full((1, 1), np.nan), 0.0, 0.0, cellSizeX or 1.0, cellSizeY)
+
+		if cellSizeX is None:
+			cellSizeX, cellSizeY = estimateCellSize(x, y)
+		elif cellSizeY is None:
+			cellSizeY = cellSizeX
+		originX = float(np.min(x))
+		originY = float(np.min(y))
+		cols = np.rint((x - originX) / cellSizeX).astype(np.int64)
+		rows = np.rint((y - originY) / cellSizeY).astype(np.int64)
+		shape = (int(rows.max()) + 1, int(cols.max()) + 1)
+		cells = rows * shape[1] + cols
+		sums = np.bincount(cells, weights=z, minlength=shape[0] * shape[1])
+		counts = np.bincount(cells, minlength=shape[0] * shape[1])
+		with np.errstate(invalid='ignore', divide='ignore'):
+			depths = np.where(counts > 0, sums / counts, np.nan)
+		return cls(depths.reshape(shape), originX, originY, cellSizeX, cellSizeY)
+
+	@classmethod
+	def fromGEBCO(cls, gebco):
+		'''take the grid a GEBCOReader has loaded with loadBoundingBoxDepths, in longitude, latitude, without going through a point layer'''
+		cellSizeX, cellSizeY = gebco.gridStep()
+		return cls(gebco.depths.astype(np.float64), gebco.longitude[0], gebco.latitude[0], cellSizeX, cellSizeY)
+
+	@classmethod
+	def fromGEBCOFile(cls, fileName, west, south, east, north):
+		'''read the GEBCO cells covering a box, in longitude, latitude, into a grid with fromGEBCO and close the file again. The box is widened by a cell, so points on its edges fall in whole cells'''
+		import GEBCO1DExtractor
+		gebco = GEBCO1DExtractor.GEBCOReader(fileName)
+		try:
+			marginX = float(gebco.spacing[0])
+			marginY = float(gebco.spacing[1])
+			gebco.loadBoundingBoxDepths([[west - marginX, north + marginY], [east + marginX, south - marginY]], 1)
+			return cls.fromGEBCO(gebco)
+		finally:
+			gebco.close()
+
+	def sample(self, x, y):
+		'''return the depth of the cell containing each point, or NaN outside the grid'''
+		x = np.asarray(x, dtype=np.float64)
+		y = np.asarray(y, dtype=np.float64)
+		cols = np.rint((x - self.originX) / self.cellSizeX)
+		rows = np.rint((y - self.originY) / self.cellSizeY)
+		inside = (rows >= 0) & (rows < self.depths.shape[0]) & (cols >= 0) & (cols < self.depths.shape[1])
+		depths = np.full(np.shape(x), np.nan)
+		depths[inside] = self.depths[rows[inside].astype(np.int64), cols[inside].astype(np.int64)]
+		return depths
+
+	def medianDepth(self):
+		'''the median depth of the cells below sea level, as a positive number, or NaN if there are none'''
+		depths = -self.depths[self.depths < 0]
+		if len(depths) == 0:
+			return math.nan
+		return float(np.median(depths))
+
+	def polygonStatistics(self, polygonX, polygonY, percentiles=(5, 50, 95)):
+		'''return a dictionary of the count, mean, min, max and percentiles of the elevations of the cells whose centres are inside the polygon, or None if there are none. Only the cells within the bounding box of the polygon are tested'''
+		polygonX = np.asarray(polygonX, dtype=np.float64)
+		polygonY = np.asarray(polygonY, dtype=np.float64)
+		colMin = max(int(math.floor((np.nanmin(polygonX) - self.originX) / self.cellSizeX)), 0)
+		colMax = min(int(math.ceil((np.nanmax(polygonX) - self.originX) / self.cellSizeX)), self.depths.shape[1] - 1)
+		rowMin = max(int(math.floor((np.nanmin(polygonY) - self.originY) / self.cellSizeY)), 0)
+		rowMax = min(int(math.ceil((np.nanmax(polygonY) - self.originY) / self.cellSizeY)), self.depths.shape[0] - 1)
+		if colMax < colMin or rowMax < rowMin:
+			return None
+
+		depths = self.depths[rowMin:rowMax + 1, colMin:colMax + 1]
+		x, y = np.meshgrid(self.originX + np.arange(colMin, colMax + 1) * self.cellSizeX, self.originY + np.arange(rowMin, rowMax + 1) * self.cellSizeY)
+		inside = lineplanner.pointsInPolygon(x.ravel(), y.ravel(), polygonX, polygonY).reshape(depths.shape) & np.isfinite(depths)
+		depths = depths[inside]
+		if len(depths) == 0:
+			return None
+		statistics = {"count": len(depths), "mean": float(np.mean(depths)), "min": float(np.min(depths)), "max": float(np.max(depths))}
+		for percentile, value in zip(percentiles, np.percentile(depths, percentiles)):
+			statistics["p%g" % (percentile)] = float(value)
+		return statistics
+
+	def cellCount(self):
+		'''the number of cells with soundings'''
+		return int(np.count_nonzero(np.isfinite(self.depths)))
+
+def isPositiveDown(z):
+	'''True if soundings are depths positive down rather than elevations. A survey area is mostly water, so most soundings are below sea level, and most are positive if they are depths'''
+	return len(z) > 0 and float(np.median(z)) > 0
+
+def estimateCellSize(x, y):
+	'''estimate the spacing of the soundings along x and y. Soundings on a lattice, such as a GEBCO grid in geographicals, have few distinct x and y values, and the spacing along each axis is its extent over the gaps between them. Otherwise both come from the density of the soundings: n regularly spaced soundings cover a box one spacing larger than their extent, so n * s^2 = (width + s) * (height + s). Returns (cellSizeX, cellSizeY)'''
+	width = float(np.max(x) - np.min(x))
+	height = float(np.max(y) - np.min(y))
+	n = len(x)
+	if n < 2 or width + height <= 0:
+		return 1.0, 1.0
+	cellSize = ((width + height) + math.sqrt((width + height) ** 2 + 4 * (n - 1) * width * height)) / (2 * (n - 1))
+	#a lattice with at least half its nodes filled
+	columns = distinctValueCount(x, cellSize)
+	rows = distinctValueCount(y, cellSize)
+	if columns * rows > 2 * n:
+		return cellSize, cellSize
+	return (width / (columns - 1) if columns > 1 else cellSize, height / (rows - 1) if rows > 1 else cellSize)
+
+def distinctValueCount(values, cellSize):
+	'''the number of distinct values, counting values within a thousandth of a cell of each other as one'''
+	return 1 + int(np.count_nonzero(np.diff(np.sort(values)) > cellSize * 1e-3))
@@ -0,0 +1,139 @@
+#name:			surveyreport
+#description:   stream survey line reports to CSV, and optionally a columnar file for analysis, in constant memory
+#designed for:  ArcGISPro 2.2.4 or standalone python with numpy
+
+# See readme.md for more details
+
+# Rows are written through a buffered file as they are read from the cursor, so a report over a million line
+# multi-project table never holds the report in memory.  The columnar output is either a parquet file, written one
+# row group at a time (needs pyarrow), or a numpy .npz file of one array per column.  The .npz columns are spilled to a
+# temporary file a chunk at a time, and streamed from it into the .npz members when the report is closed.
+
+import tempfile
+import zipfile
+
+import numpy as np
+
+REPORT_COLUMNS = ["linename", "linespacing", "startx", "starty", "endx", "endy", "length(m)", "heading", "speed(kts)", "speed(m/s)", "duration(h)", "turnduration(h)", "totalduration(h)"]
+REPORT_FORMAT = "%s,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f\n"
+
+#optional depth profile columns, from lineplanner.lineDepthProfiles
+DEPTH_COLUMNS = ["mindepth(m)", "meandepth(m)", "maxdepth(m)", "undercoverage(%)"]
+DEPTH_FORMAT = "%s,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.1f,%.1f,%.1f,%.1f\n"
+
+#the most rows excel will open, so we do not try to open larger reports for the user
+EXCEL_MAX_ROWS = 1048575
+
+class surveyReportWriter:
+	'''Write survey line report rows as they arrive. Either file name may be None to skip that output. The columnar file is parquet if the name ends in .parquet, otherwise numpy .npz. Set depthColumns to add the depth profile of each line'''
+	def __init__(self, csvFileName=None, columnarFileName=None, chunkRows=65536, depthColumns=False):
+		self.csvFileName		= csvFileName
+		self.columnarFileName	= columnarFileName
+		self.chunkRows			= chunkRows
+		self.rowCount			= 0
+		self.columns			= REPORT_COLUMNS + DEPTH_COLUMNS if depthColumns else REPORT_COLUMNS
+		self.format				= DEPTH_FORMAT if depthColumns else REPORT_FORMAT
+
+		self.csvFile = None
+		if csvFileName:
+			self.csvFile = open(csvFileName, 'w', buffering=1024*1024)
+			self.csvFile.write(",".join(self.columns) + "\n")
+
+		#columnar rows are gathered into chunks, which are written as parquet row groups, or spilled to a temporary file for the .npz
+		self.chunk = []
+		self.spillFile = None
+		self.spillChunks = []
+		self.parquetWriter = None
+		self.isParquet = bool(columnarFileName) and columnarFileName.lower().endswith(".parquet")
+		if self.isParquet:
+			try:
+				import pyarrow
+				import pyarrow.parquet
+			except ImportError:
+				raise ImportError("pyarrow is needed to write parquet reports, use a .npz file name instead")
+			self.pyarrow = pyarrow
+			self.parquetWriter = pyarrow.parquet.ParquetWriter(columnarFileName, self.parquetSchema())
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exceptionType, exceptionValue, traceback):
+		self.close()
+
+	def writeRow(self, lineName, lineSpacing, startX, startY, endX, endY, lineLength, heading, vesselSpeedInKnots, duration, turnDuration, depthProfile=()):
+		'''write one line of the report. Durations are in hours. depthProfile is the (minDepth, meanDepth, maxDepth, underCoverage) of the line if the writer has depthColumns'''
+		row = (lineName, lineSpacing, startX, startY, endX, endY, lineLength, heading, vesselSpeedInKnots, vesselSpeedInKnots*(1852/3600), duration, turnDuration, duration + turnDuration) + tuple(depthProfile)
+		if self.csvFile:
+			self.csvFile.write(self.format % row)
+		if self.columnarFileName:
+			self.chunk.append(row)
+			if len(self.chunk) >= self.chunkRows:
+				self.flushChunk()
+		self.rowCount += 1
+
+	def flushChunk(self):
+		'''convert the gathered rows into one array per column and write them out'''
+		if len(self.chunk) == 0:
+			return
+		columns = list(zip(*self.chunk))
+		self.chunk = []
+		arrays = [np.array(columns[0], dtype=str)] + [np.array(column, dtype=np.float64) for column in columns[1:]]
+		if self.isParquet:
+			self.parquetWriter.write_table(self.pyarrow.Table.from_arrays([self.pyarrow.array(array) for array in arrays], schema=self.parquetSchema()))
+		else:
+			self.spillChunk(arrays)
+
+	def spillChunk(self, arrays):
+		'''append the column arrays of a chunk to the spill file, recording where each one starts'''
+		if self.spillFile is None:
+			self.spillFile = tempfile.TemporaryFile()
+		offsets = []
+		for array in arrays:
+			offsets.append(self.spillFile.tell())
+			self.spillFile.write(array.tobytes())
+		self.spillChunks.append((len(arrays[0]), arrays[0].dtype, offsets))
+
+	def writeNPZ(self, fileName):
+		'''write the spilled chunks as a compressed .npz, the layout np.savez_compressed writes. Each column is a .npy member streamed from the spill file a chunk at a time, so only one chunk of one column is in memory'''
+		if not fileName.endswith(".npz"):
+			fileName += ".npz"
+		rowCount = sum(count for count, nameType, offsets in self.spillChunks)
+		#the line names of every chunk are widened to the longest
+		nameType = np.dtype("<U1") if len(self.spillChunks) == 0 else max((chunk[1] for chunk in self.spillChunks), key=lambda dtype: dtype.itemsize)
+		with zipfile.ZipFile(fileName, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+			for index, name in enumerate(self.columns):
+				dtype = nameType if index == 0 else np.dtype(np.float64)
+				with archive.open(columnName(name) + ".npy", 'w', force_zip64=True) as member:
+					np.lib.format.write_array_header_1_0(member, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (rowCount,)})
+					for count, chunkNameType, offsets in self.spillChunks:
+						chunkType = chunkNameType if index == 0 else dtype
+						self.spillFile.seek(offsets[index])
+						member.write(np.frombuffer(self.spillFile.read(count * chunkType.itemsize), dtype=chunkType).astype(dtype).tobytes())
+		return fileName
+
+	def parquetSchema(self):
+		return self.pyarrow.schema([(self.columns[0], self.pyarrow.string())] + [(name, self.pyarrow.float64()) for name in self.columns[1:]])
+
+	def close(self):
+		if self.csvFile:
+			self.csvFile.close()
+			self.csvFile = None
+		if self.columnarFileName:
+			self.flushChunk()
+			if self.isParquet:
+				if self.parquetWriter:
+					self.parquetWriter.close()
+					self.parquetWriter = None
+			else:
+				try:
+					self.writeNPZ(self.columnarFileName)
+				finally:
+					if self.spillFile is not None:
+						self.spillFile.close()
+						self.spillFile = None
+					self.spillChunks = []
+			self.columnarFileName = None
+
+def columnName(name):
+	'''npz array names cannot hold the brackets of the csv header, so length(m) becomes length_m and undercoverage(%) becomes undercoverage_pct'''
+	return name.replace("(", "_").replace(")", "").replace("/", "").replace("%", "pct")
@@ -0,0 +1,50 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from netCDF4 import Dataset
+
+#the modules import each other by name, as they do inside the ArcGIS toolbox
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "GGSurveyEstimator"))
+
+import GEBCO1DExtractor
+
+def pytest_addoption(parser):
+	parser.addoption("--benchmark", action="store_true", default=False, help="also run the timing benchmarks, which are skipped by default as wall clock ratios vary from machine to machine")
+
+def pytest_configure(config):
+	config.addinivalue_line("markers", "benchmark: a timing benchmark, run only with --benchmark")
+
+def pytest_collection_modifyitems(config, items):
+	if config.getoption("--benchmark"):
+		return
+	skip = pytest.mark.skip(reason="timing benchmark, run with --benchmark")
+	for item in items:
+		if "benchmark" in item.keywords:
+			item.add_marker(skip)
+
+def writeGEBCO1D(fileName, perDegree=4):
+	'''write a small global grid in the layout of GEBCO_2014_1D.nc. The elevations are random, so a cell read from the wrong place shows up'''
+	columns = 360 * perDegree
+	rows = 180 * perDegree
+	nc = Dataset(fileName, 'w')
+	nc.createDimension('side', 2)
+	nc.createDimension('xysize', columns * rows)
+	for name, values, dataType in [('x_range', [-180, 180], 'f8'), ('y_range', [-90, 90], 'f8'), ('z_range', [-8000, 3000], 'f8'), ('spacing', [1.0 / perDegree, 1.0 / perDegree], 'f8'), ('dimension', [columns, rows], 'i4')]:
+		variable = nc.createVariable(name, dataType, ('side',))
+		variable[:] = values
+	z = nc.createVariable('z', 'i2', ('xysize',), zlib=True)
+	z[:] = np.random.default_rng(0).integers(-8000, 3000, columns * rows).astype(np.int16)
+	nc.close()
+	return fileName
+
+@pytest.fixture(scope="session")
+def gebco1DFile(tmp_path_factory):
+	return writeGEBCO1D(str(tmp_path_factory.mktemp("gebco") / "GEBCO_1D.nc"))
+
+@pytest.fixture
+def gebco(gebco1DFile):
+	reader = GEBCO1DExtractor.GEBCOReader(gebco1DFile)
+	yield reader
+	reader.close()
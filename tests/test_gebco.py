@@ -0,0 +1,234 @@
+import math
+
+import numpy as np
+import pytest
+
+#top left and bottom right, including a box off the cell edges, one across the antimeridian and one over the north pole
+BOXES = [
+	[[110, -30], [115, -35]],
+	[[110.13, -30.37], [114.91, -34.02]],
+	[[175, 10], [-175, 5]],
+	[[-20, 90], [-10, 85]],
+	]
+
+@pytest.mark.parametrize("boundingBox", BOXES)
+@pytest.mark.parametrize("stepSize", [1, 3])
+def testNearestSampleReturnsExtractedDepths(gebco, boundingBox, stepSize):
+	gebco.loadBoundingBoxDepths(boundingBox, stepSize)
+	latitude, longitude = np.meshgrid(gebco.latitude, gebco.longitude, indexing="ij")
+	assert gebco.depths.size > 0
+	np.testing.assert_array_equal(gebco.sampleDepths(latitude, longitude, "nearest"), gebco.depths)
+
+def testExtractionHoldsCellCentresInsideTheBox(gebco):
+	gebco.loadBoundingBoxDepths([[110, -30], [115, -35]], 1)
+	assert gebco.depths.shape == (20, 20)
+	np.testing.assert_allclose(gebco.longitude[[0, -1]], [110.125, 114.875])
+	np.testing.assert_allclose(gebco.latitude[[0, -1]], [-34.875, -30.125])
+
+#a cell of the fixture grid in the [[110, -30], [115, -35]] box, at 4 cells per degree
+KNOWN_ROW = 485
+KNOWN_COL = 1170
+KNOWN_LATITUDE = -31.375
+KNOWN_LONGITUDE = 112.625
+
+def knownDepth(gebco):
+	return int(gebco.z[KNOWN_ROW * int(gebco.dimension[0]) + KNOWN_COL])
+
+def testBILExportPlacesCellsAtTheirCentres(gebco, tmp_path):
+	gebco.loadBoundingBoxDepths([[110, -30], [115, -35]], 1)
+	fileName = str(tmp_path / "extract.bil")
+	gebco.exportDepths(fileName)
+	header = dict(line.split() for line in open(str(tmp_path / "extract.hdr")))
+	raster = np.fromfile(fileName, dtype='<i2').reshape(int(header["NROWS"]), int(header["NCOLS"]))
+	row = (float(header["ULYMAP"]) - KNOWN_LATITUDE) / float(header["YDIM"])
+	col = (KNOWN_LONGITUDE - float(header["ULXMAP"])) / float(header["XDIM"])
+	assert row == pytest.approx(round(row)) and col == pytest.approx(round(col))
+	assert raster[int(round(row)), int(round(col))] == knownDepth(gebco)
+	worldFile = [float(line) for line in open(str(tmp_path / "extract.blw"))]
+	assert worldFile[4:] == pytest.approx([float(header["ULXMAP"]), float(header["ULYMAP"])])
+
+def testNetCDFExportPlacesCellsAtTheirCentres(gebco, tmp_path):
+	from netCDF4 import Dataset
+	gebco.loadBoundingBoxDepths([[110, -30], [115, -35]], 1)
+	fileName = str(tmp_path / "extract.nc")
+	gebco.exportDepths(fileName)
+	with Dataset(fileName) as nc:
+		row = np.flatnonzero(np.isclose(nc.variables["lat"][:], KNOWN_LATITUDE))
+		col = np.flatnonzero(np.isclose(nc.variables["lon"][:], KNOWN_LONGITUDE))
+		assert len(row) == 1 and len(col) == 1
+		assert nc.variables["elevation"][row[0], col[0]] == knownDepth(gebco)
+
+@pytest.mark.parametrize("stepSize, decimation", [(1, "sample"), (4, "shoalest"), (4, "mean")])
+def testGridEdgesAreTheBoxEdges(gebco, stepSize, decimation):
+	gebco.loadBoundingBoxDepths([[110, -30], [115, -35]], stepSize, decimation)
+	assert gebco.gridEdges() == pytest.approx((110, -35, 115, -30))
+
+@pytest.mark.parametrize("boundingBox, stepSize, decimation", [
+	([[100, 30], [130, -30]], 1, "sample"),
+	([[100.3, 29.61], [129.17, -29.9]], 3, "sample"),
+	([[100, 30], [130, -30]], 4, "shoalest"),
+	])
+def testNetCDFExportReopensAsTheSameGrid(gebco, tmp_path, boundingBox, stepSize, decimation):
+	import GEBCO1DExtractor
+	gebco.loadBoundingBoxDepths([[100, 30], [130, -30]], 1)
+	assert gebco.depths.shape == (240, 120)
+	fileName = str(tmp_path / "subset.nc")
+	gebco.exportDepths(fileName)
+	subset = GEBCO1DExtractor.GEBCOReader(fileName)
+	try:
+		assert tuple(subset.dimension) == (120, 240)
+		gebco.loadBoundingBoxDepths(boundingBox, stepSize, decimation)
+		subset.loadBoundingBoxDepths(boundingBox, stepSize, decimation)
+		np.testing.assert_array_equal(subset.depths, gebco.depths)
+		np.testing.assert_allclose(subset.latitude, gebco.latitude)
+		np.testing.assert_allclose(subset.longitude, gebco.longitude)
+	finally:
+		subset.close()
+
+#the layout conftest.writeGEBCO1D gives the fixture grid: rows run south from 90N and columns east from 180W
+FIXTURE_CELLS_PER_DEGREE = 4
+FIXTURE_COLUMNS = 360 * FIXTURE_CELLS_PER_DEGREE
+FIXTURE_ROWS = 180 * FIXTURE_CELLS_PER_DEGREE
+
+@pytest.fixture(scope="module")
+def fixtureElevations(gebco1DFile):
+	from netCDF4 import Dataset
+	with Dataset(gebco1DFile) as nc:
+		nc.set_auto_mask(False)
+		return nc.variables['z'][:]
+
+def fixtureIndex(latitude, longitude):
+	'''the 1D index of the fixture cell containing a point, worked out by hand rather than by the reader'''
+	row = min(max(int(math.floor((90.0 - latitude) * FIXTURE_CELLS_PER_DEGREE)), 0), FIXTURE_ROWS - 1)
+	col = int(math.floor((longitude + 180.0) * FIXTURE_CELLS_PER_DEGREE)) % FIXTURE_COLUMNS
+	return row * FIXTURE_COLUMNS + col
+
+def readCellByCell(reader, z):
+	'''the depths at the loaded coordinates, one read of z per cell as the original per cell loop did'''
+	return np.array([[z[fixtureIndex(latitude, longitude)] for longitude in reader.longitude] for latitude in reader.latitude], dtype=np.int16)
+
+def testFixtureIndexIsTheKnownCell():
+	assert fixtureIndex(KNOWN_LATITUDE, KNOWN_LONGITUDE) == KNOWN_ROW * FIXTURE_COLUMNS + KNOWN_COL
+
+@pytest.mark.parametrize("boundingBox", BOXES + [[[-5, -85], [5, -90]]])
+@pytest.mark.parametrize("stepSize", [1, 2])
+def testBlockReadMatchesCellByCell(gebco, fixtureElevations, boundingBox, stepSize):
+	gebco.loadBoundingBoxDepths(boundingBox, stepSize)
+	np.testing.assert_array_equal(gebco.depths, readCellByCell(gebco, fixtureElevations))
+
+#the speed up asked for over the per cell loop
+BLOCK_READ_SPEEDUP_TARGET = 100.0
+
+@pytest.mark.benchmark
+def testBlockReadIsFasterThanCellByCell(gebco):
+	import time
+	#240 x 240 cells, as many as a 2 x 2 degree box of the 120 cells a degree GEBCO grid
+	boundingBox = [[90, 30], [150, -30]]
+	start = time.perf_counter()
+	gebco.loadBoundingBoxDepths(boundingBox, 1)
+	blockSeconds = time.perf_counter() - start
+	for repeat in range(4):
+		start = time.perf_counter()
+		gebco.loadBoundingBoxDepths(boundingBox, 1)
+		blockSeconds = min(blockSeconds, time.perf_counter() - start)
+	start = time.perf_counter()
+	expected = readCellByCell(gebco, gebco.nc.variables['z'])
+	cellSeconds = time.perf_counter() - start
+	np.testing.assert_array_equal(gebco.depths, expected)
+	print("%d cells read %.0fx faster than cell by cell" % (expected.size, cellSeconds / blockSeconds))
+	assert cellSeconds / blockSeconds > BLOCK_READ_SPEEDUP_TARGET
+
+@pytest.mark.parametrize("boundingBox", BOXES)
+def testRawGridAndTileCacheMatchCellByCell(gebco, fixtureElevations, tmp_path, boundingBox):
+	import GEBCO1DExtractor
+	raw = GEBCO1DExtractor.GEBCOReader(gebco.convertToRawGrid(str(tmp_path / "GEBCO_1D.ggraw")))
+	try:
+		raw.enableTileCache(str(tmp_path / "tiles"), tileDegrees=5.0)
+		raw.loadBoundingBoxDepths(boundingBox, 1)
+		np.testing.assert_array_equal(raw.depths, readCellByCell(raw, fixtureElevations))
+	finally:
+		raw.close()
+
+def testRawGridOfAnotherVersionIsRejected(gebco, tmp_path):
+	import struct
+	import GEBCO1DExtractor
+	fileName = gebco.convertToRawGrid(str(tmp_path / "GEBCO_1D.ggraw"))
+	with open(fileName, 'r+b') as f:
+		f.seek(len(GEBCO1DExtractor.RAW_MAGIC))
+		f.write(struct.pack("<I", GEBCO1DExtractor.RAW_VERSION + 1))
+	with pytest.raises(ValueError, match="version"):
+		GEBCO1DExtractor.GEBCOReader(fileName)
+
+def testTruncatedRawGridIsRejected(gebco, tmp_path):
+	import GEBCO1DExtractor
+	fileName = gebco.convertToRawGrid(str(tmp_path / "GEBCO_1D.ggraw"))
+	with open(fileName, 'r+b') as f:
+		f.truncate(GEBCO1DExtractor.RAW_HEADER_SIZE + 1000)
+	with pytest.raises(ValueError, match="shorter"):
+		GEBCO1DExtractor.GEBCOReader(fileName)
+
+def testFractionalStepIsRejectedForBlockDecimation(gebco):
+	with pytest.raises(ValueError, match="whole number"):
+		gebco.loadBoundingBoxDepths([[110, -30], [115, -35]], 2.5, "shoalest")
+	gebco.loadBoundingBoxDepths([[110, -30], [115, -35]], 2.5, "sample")
+	assert gebco.depths.shape == (8, 8)
+
+@pytest.mark.parametrize("decimation", ["shoalest", "deepest", "sample", "median"])
+def testPyramidGivesTheSourceDecimation(gebco, tmp_path, decimation):
+	import shutil
+	import GEBCO1DExtractor
+	fileName = str(tmp_path / "GEBCO_1D.nc")
+	shutil.copy(gebco.fileName, fileName)
+	pyramid = GEBCO1DExtractor.GEBCOReader(fileName)
+	try:
+		pyramid.buildPyramid(levels=(2, 4))
+		#the box is on whole x4 cells, so the blocks do not move
+		pyramid.loadBoundingBoxDepths([[100, 30], [130, -30]], 8, decimation)
+		gebco.loadBoundingBoxDepths([[100, 30], [130, -30]], 8, decimation)
+		np.testing.assert_array_equal(pyramid.depths, gebco.depths)
+		np.testing.assert_allclose(pyramid.longitude, gebco.longitude)
+	finally:
+		pyramid.close()
+
+def testSingleRowNetCDFExportReopens(gebco, tmp_path):
+	import GEBCO1DExtractor
+	gebco.loadBoundingBoxDepths([[110, -30], [115, -30.25]], 1)
+	assert gebco.depths.shape == (1, 20)
+	fileName = gebco.exportDepths(str(tmp_path / "row.nc"))
+	row = GEBCO1DExtractor.GEBCOReader(fileName, chunkCacheBytes=1024 * 1024)
+	try:
+		assert row.chunkCache.maxBytes == 1024 * 1024
+		np.testing.assert_allclose(row.spacing, gebco.spacing)
+		row.loadBoundingBoxDepths([[110, -30], [115, -30.25]], 1)
+		np.testing.assert_array_equal(row.depths, gebco.depths)
+		np.testing.assert_allclose(row.latitude, gebco.latitude)
+	finally:
+		row.close()
+
+def testSingleRowNetCDFWithoutResolutionIsRejected(tmp_path):
+	from netCDF4 import Dataset
+	import GEBCO1DExtractor
+	fileName = str(tmp_path / "row.nc")
+	with Dataset(fileName, 'w') as nc:
+		nc.createDimension("lat", 1)
+		nc.createDimension("lon", 4)
+		nc.createVariable("lat", "f8", ("lat",))[:] = [-30.125]
+		nc.createVariable("lon", "f8", ("lon",))[:] = [110.125, 110.375, 110.625, 110.875]
+		nc.createVariable("elevation", "i2", ("lat", "lon"))[:] = [[-1, -2, -3, -4]]
+	with pytest.raises(ValueError, match="cell size"):
+		GEBCO1DExtractor.GEBCOReader(fileName)
+
+def testPyramidMeanOfAPartCellIsOfTheCellsThereAre(gebco, tmp_path):
+	import GEBCO1DExtractor
+	#30 x 30 cells, so the last x4 cell in each direction covers only 2 x 2 of them
+	gebco.loadBoundingBoxDepths([[100, 30], [107.5, 22.5]], 1)
+	subset = GEBCO1DExtractor.GEBCOReader(gebco.exportDepths(str(tmp_path / "subset.nc")))
+	try:
+		subset.buildPyramid(levels=(4,))
+		mean = subset.pyramid[4]["mean"]
+		assert tuple(mean.dimension) == (8, 8)
+		for row, col in [(3, 5), (7, 7), (7, 2)]:
+			cells = subset.readBlock(np.arange(row * 4, min(row * 4 + 4, 30)), np.arange(col * 4, min(col * 4 + 4, 30)))
+			assert mean.readBlock(np.array([row]), np.array([col]))[0, 0] == np.round(cells.mean())
+	finally:
+		subset.close()
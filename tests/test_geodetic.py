@@ -0,0 +1,102 @@
+import time
+
+import numpy as np
+import pytest
+
+import geodetic
+
+#the agreement asked for between the array and scalar functions, as a distance on the ground
+AGREEMENT_METRES = 1e-9
+METRES_PER_DEGREE = 111320.0
+#numpy's tan, arctan and arctan2 round a few inputs in a hundred to the other side of the last place from the math module's. One unit in the last place of a reduced latitude is 1.4e-9m on the ground, and of a latitude past 64 degrees 1.6e-9m, so those elements can miss 1e-9m. They are held to four units in the last place of the semi-major axis instead
+ROUNDING_METRES = 4 * 6378137.0 * np.finfo(np.float64).eps
+#the share of elements which no rounding difference touches is well over this
+AGREEING_SHARE = 0.95
+#azimuths are held to a few hundred units in the last place of 360 degrees
+AGREEMENT_DEGREES = 1e-11
+
+#the speed up asked for over a loop of the scalar functions, timed on 1e5 pairs
+SPEEDUP_TARGET = 50.0
+BENCHMARK_PAIRS = 100000
+
+def randomLines(count, seed=1, spanDegrees=2.0):
+	rng = np.random.default_rng(seed)
+	longitude1 = rng.uniform(-180, 180, count)
+	latitude1 = rng.uniform(-80, 80, count)
+	longitude2 = longitude1 + rng.uniform(-spanDegrees, spanDegrees, count)
+	latitude2 = np.clip(latitude1 + rng.uniform(-spanDegrees, spanDegrees, count), -89, 89)
+	return longitude1, latitude1, longitude2, latitude2
+
+def assertAgrees(metres):
+	assert np.mean(metres <= AGREEMENT_METRES) > AGREEING_SHARE
+	assert np.max(metres) <= ROUNDING_METRES
+
+def bestSeconds(function, repeats=5):
+	times = []
+	for repeat in range(repeats):
+		start = time.perf_counter()
+		function()
+		times.append(time.perf_counter() - start)
+	return min(times)
+
+def testInverseAgreesWithScalar():
+	longitude1, latitude1, longitude2, latitude2 = randomLines(5000, spanDegrees=5.0)
+	s, forward, reverse = geodetic.calculateRangeBearingFromGeographicalsArray(longitude1, latitude1, longitude2, latitude2)
+	expected = np.array([geodetic.calculateRangeBearingFromGeographicals(*line) for line in zip(longitude1, latitude1, longitude2, latitude2)])
+	assertAgrees(np.abs(s - expected[:, 0]))
+	assert np.max(np.abs(forward - expected[:, 1])) < AGREEMENT_DEGREES
+	assert np.max(np.abs(reverse - expected[:, 2])) < AGREEMENT_DEGREES
+
+def testDirectAgreesWithScalar():
+	rng = np.random.default_rng(2)
+	latitude1 = rng.uniform(-80, 80, 5000)
+	longitude1 = rng.uniform(-180, 180, 5000)
+	azimuth = rng.uniform(-10, 370, 5000)
+	s = rng.uniform(-200000, 200000, 5000)
+	latitude2, longitude2, reverse = geodetic.calculateGeographicalPositionFromRangeBearingArray(latitude1, longitude1, azimuth, s)
+	expected = np.array([geodetic.calculateGeographicalPositionFromRangeBearing(*line) for line in zip(latitude1, longitude1, azimuth, s)])
+	assertAgrees(np.abs(latitude2 - expected[:, 0]) * METRES_PER_DEGREE)
+	#a degree of longitude shortens towards the poles
+	assertAgrees(np.abs(longitude2 - expected[:, 1]) * METRES_PER_DEGREE * np.cos(np.radians(expected[:, 0])))
+	assert np.max(np.abs(reverse - expected[:, 2])) < AGREEMENT_DEGREES
+
+def testSpecialCases():
+	#coincident points, an equatorial line, and a nearly antipodal pair which falls back to the sphere
+	s, forward, reverse = geodetic.calculateRangeBearingFromGeographicalsArray([10.0, 0.0, 0.0], [20.0, 0.0, 0.0], [10.0, 10.0, 179.9], [20.0, 0.0, 0.1])
+	assert s[0] == 0.0 and forward[0] == 0.0
+	#along the equator the distance is the arc of the semi-major axis, to the 1e-9 convergence of lembda
+	assert s[1] == pytest.approx(6378137.0 * np.radians(10.0), rel=1e-9)
+	assert forward[1] == 90.0 and reverse[1] == 270.0
+	assert 19.9e6 < s[2] < 20.1e6
+	latitude2, longitude2, reverse = geodetic.calculateGeographicalPositionFromRangeBearingArray([45.0, 0.0], [7.0, 0.0], [30.0, 90.0], [0.0, 100000.0])
+	assert latitude2[0] == 45.0 and longitude2[0] == 7.0 and reverse[0] == 0.0
+	assert abs(latitude2[1]) < 1e-12 and reverse[1] == 270.0
+	assert longitude2[1] == pytest.approx(np.degrees(100000.0 / 6378137.0), abs=1e-12)
+
+def testBlocksMatchOneCall():
+	longitude1, latitude1, longitude2, latitude2 = randomLines(3 * geodetic.VINCENTY_BLOCK_SIZE + 17, seed=3)
+	whole = geodetic.calculateRangeBearingFromGeographicalsArray(longitude1, latitude1, longitude2, latitude2)
+	part = geodetic.calculateRangeBearingFromGeographicalsArray(longitude1[-17:], latitude1[-17:], longitude2[-17:], latitude2[-17:])
+	np.testing.assert_array_equal(whole[0][-17:], part[0])
+	grid = geodetic.calculateRangeBearingFromGeographicalsArray(longitude1[:12].reshape(3, 4), latitude1[:12].reshape(3, 4), longitude2[:12].reshape(3, 4), latitude2[:12].reshape(3, 4))
+	assert grid[0].shape == (3, 4)
+	np.testing.assert_array_equal(grid[0].ravel(), whole[0][:12])
+
+@pytest.mark.benchmark
+def testArraysAreFasterThanScalarLoops():
+	longitude1, latitude1, longitude2, latitude2 = randomLines(BENCHMARK_PAIRS)
+	#the scalar loops are timed on a slice, as they take seconds a pass over all the pairs
+	scalarCount = BENCHMARK_PAIRS // 20
+	s, forward, reverse = geodetic.calculateRangeBearingFromGeographicalsArray(longitude1, latitude1, longitude2, latitude2)
+
+	scalarSeconds = bestSeconds(lambda: [geodetic.calculateRangeBearingFromGeographicals(longitude1[i], latitude1[i], longitude2[i], latitude2[i]) for i in range(scalarCount)]) / scalarCount
+	arraySeconds = bestSeconds(lambda: geodetic.calculateRangeBearingFromGeographicalsArray(longitude1, latitude1, longitude2, latitude2)) / BENCHMARK_PAIRS
+	inverseSpeedUp = scalarSeconds / arraySeconds
+
+	scalarSeconds = bestSeconds(lambda: [geodetic.calculateGeographicalPositionFromRangeBearing(latitude1[i], longitude1[i], forward[i], s[i]) for i in range(scalarCount)]) / scalarCount
+	arraySeconds = bestSeconds(lambda: geodetic.calculateGeographicalPositionFromRangeBearingArray(latitude1, longitude1, forward, s)) / BENCHMARK_PAIRS
+	directSpeedUp = scalarSeconds / arraySeconds
+
+	print("inverse %.1fx, direct %.1fx faster than the scalar loops" % (inverseSpeedUp, directSpeedUp))
+	assert inverseSpeedUp > SPEEDUP_TARGET, "inverse only %.1fx faster" % inverseSpeedUp
+	assert directSpeedUp > SPEEDUP_TARGET, "direct only %.1fx faster" % directSpeedUp
@@ -0,0 +1,137 @@
+import math
+
+import numpy as np
+import pytest
+
+import lineplanner
+
+def testCrossLinesHaveNoUnderCoverage():
+	#two 1km lines over 50m of water, the second with no spacing to judge, as a cross line
+	profiles = lineplanner.lineDepthProfiles([0, 1], [0, 0], [0, 500], [1000, 1000], [0, 500], [300.0, np.nan], lambda x, y: np.full(len(x), -50.0), 4.0, 100.0)
+	minDepth, meanDepth, maxDepth, underCoverage = profiles
+	np.testing.assert_allclose(meanDepth, [50.0, 50.0])
+	assert underCoverage[0] == pytest.approx(100.0)
+	assert np.isnan(underCoverage[1])
+
+def testLandUnderALineIsUnderCovered():
+	#a 1km line over 100m of water, crossing a 50m high island from 350m to 650m, and a line over nothing but land
+	def elevation(x, y):
+		return np.where((x > 350) & (x < 650) | (y > 0), 50.0, -100.0)
+	profiles = lineplanner.lineDepthProfiles([0, 1], [0, 0], [0, 100], [1000, 1000], [0, 100], [300.0, 300.0], elevation, 4.0, 100.0)
+	minDepth, meanDepth, maxDepth, underCoverage = profiles
+	assert (minDepth[0], meanDepth[0], maxDepth[0]) == (100.0, 100.0, 100.0)
+	#the samples at 400m, 500m and 600m stand for 300m of the line
+	assert underCoverage[0] == pytest.approx(30.0)
+	assert np.isnan(minDepth[1]) and np.isnan(meanDepth[1]) and np.isnan(maxDepth[1])
+	assert underCoverage[1] == pytest.approx(100.0)
+
+import soundinggrid
+
+def planAdaptive(elevation, width, coverageMultiplier=4.0, cellSize=10.0):
+	'''adaptive line offsets over a width x 2000m box running north, on a grid of elevation(x)'''
+	x = np.arange(0, width + cellSize, cellSize)
+	depthGrid = soundinggrid.soundingGrid(np.tile(elevation(x), (int(2000 / cellSize) + 1, 1)), 0.0, 0.0, cellSize)
+	polygonX = np.array([0.0, width, width, 0.0, 0.0])
+	polygonY = np.array([0.0, 0.0, 2000.0, 2000.0, 0.0])
+	#heading north, so the offsets run east from the origin
+	u, v = lineplanner.toLineFrame(polygonX, polygonY, 0.0, 1000.0, 0.0)
+	offsets, spacings = lineplanner.adaptiveLineOffsets(u, v, 0.0, 1000.0, 0.0, depthGrid, coverageMultiplier)
+	return offsets, spacings
+
+def testAdaptiveLinesWidenDownASlopeWithoutGaps():
+	#10m in the west to 100m in the east
+	offsets, spacings = planAdaptive(lambda x: -(10.0 + 0.045 * x), 2000.0)
+	assert np.all(np.diff(offsets) > 0)
+	assert np.all(np.diff(spacings) >= 0)
+	assert spacings[0] == pytest.approx(40.0, abs=2.0)
+	#each swath starts where the last one ended, and the lines are never behind it
+	assert offsets[0] - spacings[0] / 2 <= 0.0
+	np.testing.assert_array_less(offsets[1:] - spacings[1:] / 2, offsets[:-1] + spacings[:-1] / 2 + 1e-6)
+	np.testing.assert_array_less(offsets[:-1] + spacings[:-1] / 2 - 1e-6, offsets[1:])
+	assert offsets[-1] + spacings[-1] / 2 >= 2000.0 - 0.5
+	#fewer lines than the 50 a fixed spacing for the shallowest depth needs
+	assert len(offsets) < 30
+
+def testLastAdaptiveLineIsNotBehindTheSwathEdge():
+	#40m swaths reach 2000m, just short of the 2000.4m boundary
+	offsets, spacings = planAdaptive(lambda x: np.full(len(x), -10.0), 2000.4)
+	assert len(offsets) == 50
+	np.testing.assert_array_less(offsets[:-1] + spacings[:-1] / 2 - 1e-6, offsets[1:])
+
+def testLandGetsNoAdaptiveLines():
+	#land in the west half, 20m of water in the east half
+	offsets, spacings = planAdaptive(lambda x: np.where(x < 1000.0, 5.0, -20.0), 2000.0)
+	np.testing.assert_allclose(spacings, 80.0)
+	assert offsets[0] > 1000.0 - 80.0
+	assert len(offsets) <= 14
+
+def testPositiveDownSoundingsPlanAsElevations():
+	#the same 10m to 100m slope as depths positive down and as elevations, with a little land in the west
+	x, y = np.meshgrid(np.arange(0.0, 2010.0, 10.0), np.arange(0.0, 2010.0, 10.0))
+	depths = np.where(x < 100.0, -2.0, 10.0 + x * 0.045)
+	polygonX = np.array([0.0, 2000.0, 2000.0, 0.0, 0.0])
+	polygonY = np.array([0.0, 0.0, 2000.0, 2000.0, 0.0])
+	u, v = lineplanner.toLineFrame(polygonX, polygonY, 0.0, 1000.0, 0.0)
+	plans = []
+	for z in (depths, -depths):
+		depthGrid = soundinggrid.soundingGrid.fromPoints(x.ravel(), y.ravel(), z.ravel())
+		#the median of the water, from 100m to 2000m east
+		assert depthGrid.medianDepth() == pytest.approx(10.0 + 1050.0 * 0.045)
+		plans.append(lineplanner.adaptiveLineOffsets(u, v, 0.0, 1000.0, 0.0, depthGrid, 4.0))
+	assert len(plans[0][0]) > 0
+	assert plans[0][0][0] > 100.0
+	np.testing.assert_array_equal(plans[0][0], plans[1][0])
+	np.testing.assert_array_equal(plans[0][1], plans[1][1])
+
+def testLineWKTHoldsEverySegment():
+	#a U shaped block west and south of the origin, so the lines across the gap are split in two
+	polygonX = np.array([-3000.0, 0.0, 0.0, -1000.0, -1000.0, -2000.0, -2000.0, -3000.0, -3000.0])
+	polygonY = np.array([-3000.0, -3000.0, 0.0, 0.0, -2000.0, -2000.0, 0.0, 0.0, -3000.0])
+	plan = lineplanner.planSurveyLines(polygonX, polygonY, 300.0, 90.0, 0, 5.0, 0.25, "U")
+	shapes = plan.lineWKT(3)
+	assert len(shapes) == plan.lineCount()
+	parts = []
+	for line, shape in enumerate(shapes):
+		assert shape.startswith("MULTILINESTRING ((") and shape.endswith("))")
+		segments = [[[float(value) for value in point.split()] for point in segment.split(", ")] for segment in shape[len("MULTILINESTRING (("):-2].split("), (")]
+		parts.append(len(segments))
+		index = np.flatnonzero(plan.segmentLine == line)
+		expected = np.stack([plan.segmentX1[index], plan.segmentY1[index], plan.segmentX2[index], plan.segmentY2[index]], axis=1)
+		np.testing.assert_allclose(np.array(segments).reshape(-1, 4), expected, atol=0.0005)
+	assert max(parts) == 2
+
+def squareBlocks(count, size=5000.0):
+	square = np.array([0.0, size, size, 0.0, 0.0])
+	return [(str(block), square + block * 2 * size, np.array([0.0, 0.0, size, size, 0.0])) for block in range(count)]
+
+def testBatchPlansTheSameInWorkerProcesses(monkeypatch):
+	blocks = squareBlocks(12)
+	serialPlan, serialBlocks = lineplanner.planSurveyBatch(blocks, 500.0, 30.0, 15, 3.5, 10 / 60.0, "M", False, workers=1)
+	#pretend there are cpus to spare and workers cost nothing to start, so the blocks after the timed ones go to processes
+	monkeypatch.setattr(lineplanner.os, "cpu_count", lambda: 2)
+	monkeypatch.setattr(lineplanner, "WORKER_STARTUP_SECONDS", 0.0)
+	plan, blockPlans = lineplanner.planSurveyBatch(blocks, 500.0, 30.0, 15, 3.5, 10 / 60.0, "M", False, workers=2)
+	assert [block.lineNames for block in blockPlans] == [block.lineNames for block in serialBlocks]
+	np.testing.assert_allclose(plan.lineLengths, serialPlan.lineLengths)
+
+def testOptimiseHeadingFindsTheLongAxis():
+	#a 20km by 2km block is quickest surveyed with lines along its length
+	heading, duration, curve = lineplanner.optimiseHeading(np.array([0.0, 20000.0, 20000.0, 0.0, 0.0]), np.array([0.0, 0.0, 2000.0, 2000.0, 0.0]), 200.0, 0, 5.0, 0.25)
+	assert heading == pytest.approx(90.0, abs=1.0)
+	assert duration == min(hours for heading, hours in curve)
+
+def testGoldenSectionEvaluatesOneHeadingAPass():
+	heading, duration, curve = lineplanner.optimiseHeading(np.array([0.0, 20000.0, 20000.0, 0.0, 0.0]), np.array([0.0, 0.0, 2000.0, 2000.0, 0.0]), 200.0, 0, 5.0, 0.25, workers=1)
+	#36 sweep headings, the two first inner headings, then one more each time the 10 degree bracket shrinks by 0.618 until it is under 0.05 degrees
+	passes = math.ceil(math.log(0.05 / 10.0) / math.log((math.sqrt(5) - 1) / 2))
+	assert len(curve) <= 36 + 2 + passes
+
+def testHeadingSweepInWorkerProcesses(monkeypatch):
+	polygonX = np.array([0.0, 20000.0, 26000.0, 3000.0, 0.0])
+	polygonY = np.array([0.0, 0.0, 9000.0, 5000.0, 0.0])
+	serial = lineplanner.optimiseHeading(polygonX, polygonY, 200.0, 15, 5.0, 0.25, workers=1)
+	#pretend there are cpus to spare and workers cost nothing to start, so the sweep is split between processes
+	monkeypatch.setattr(lineplanner.os, "cpu_count", lambda: 2)
+	monkeypatch.setattr(lineplanner, "WORKER_STARTUP_SECONDS", 0.0)
+	parallel = lineplanner.optimiseHeading(polygonX, polygonY, 200.0, 15, 5.0, 0.25, workers=2)
+	assert parallel == serial
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import soundinggrid
+
+def latticeSoundings(cellSizeX, cellSizeY, columns=50, rows=30):
+	x, y = np.meshgrid(1000.0 + np.arange(columns) * cellSizeX, 2000.0 + np.arange(rows) * cellSizeY)
+	z = -(10.0 + np.arange(x.size)).reshape(x.shape)
+	return x.ravel(), y.ravel(), z.ravel()
+
+def testRectangularLatticeCellSizes():
+	#a 15 arc second grid at 60 degrees is about 232m east west and 463m north south
+	x, y, z = latticeSoundings(232.0, 463.0)
+	assert soundinggrid.estimateCellSize(x, y) == pytest.approx((232.0, 463.0))
+	depthGrid = soundinggrid.soundingGrid.fromPoints(x, y, z)
+	assert depthGrid.depths.shape == (30, 50)
+	assert depthGrid.cellCount() == len(z)
+	np.testing.assert_array_equal(depthGrid.sample(x, y), z)
+
+def testLatticeWithMissingSoundings():
+	x, y, z = latticeSoundings(0.25, 0.5)
+	keep = np.random.default_rng(1).random(len(x)) < 0.7
+	assert soundinggrid.estimateCellSize(x[keep], y[keep]) == pytest.approx((0.25, 0.5))
+
+def testScatteredSoundingsGetSquareCells():
+	rng = np.random.default_rng(2)
+	x = rng.random(10000) * 1000.0
+	y = rng.random(10000) * 4000.0
+	cellSizeX, cellSizeY = soundinggrid.estimateCellSize(x, y)
+	assert cellSizeX == cellSizeY
+	#about one sounding per cell
+	assert cellSizeX == pytest.approx(20.0, rel=0.05)
+
+def testPolygonStatisticsWithRectangularCells():
+	x, y, z = latticeSoundings(100.0, 300.0, columns=10, rows=10)
+	depthGrid = soundinggrid.soundingGrid.fromPoints(x, y, z)
+	#the polygon covers the first two columns of the first two rows
+	statistics = depthGrid.polygonStatistics([950.0, 1150.0, 1150.0, 950.0, 950.0], [1950.0, 1950.0, 2350.0, 2350.0, 1950.0])
+	assert statistics["count"] == 4
+	assert statistics["mean"] == pytest.approx(np.mean([-10.0, -11.0, -20.0, -21.0]))
+
+def testFromGEBCOKeepsTheDecimatedInterval(gebco):
+	gebco.loadBoundingBoxDepths([[110, -30], [115, -35]], 2, "shoalest")
+	depthGrid = soundinggrid.soundingGrid.fromGEBCO(gebco)
+	assert (depthGrid.cellSizeX, depthGrid.cellSizeY) == pytest.approx((0.5, 0.5))
+	latitude, longitude = np.meshgrid(gebco.latitude, gebco.longitude, indexing="ij")
+	np.testing.assert_array_equal(depthGrid.sample(longitude, latitude), gebco.depths)
+
+def testFromGEBCOFileCoversTheBox(gebco):
+	depthGrid = soundinggrid.soundingGrid.fromGEBCOFile(gebco.fileName, 110.0, -35.0, 115.0, -30.0)
+	#points on the edges of the box, and one inside it, sample the cells which hold them
+	longitude = np.array([110.0, 115.0, 112.6, 110.0, 115.0])
+	latitude = np.array([-35.0, -30.0, -31.4, -30.0, -35.0])
+	np.testing.assert_array_equal(depthGrid.sample(longitude + 1e-6, latitude + 1e-6), gebco.sampleDepths(latitude + 1e-6, longitude + 1e-6, "nearest"))
+	np.testing.assert_array_equal(depthGrid.sample(longitude - 1e-6, latitude - 1e-6), gebco.sampleDepths(latitude - 1e-6, longitude - 1e-6, "nearest"))
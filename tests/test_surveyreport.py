@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+import surveyreport
+
+def writeReport(fileName, rowCount, chunkRows, depthColumns=False):
+	with surveyreport.surveyReportWriter(None, fileName, chunkRows=chunkRows, depthColumns=depthColumns) as writer:
+		for row in range(rowCount):
+			#names of different lengths in different chunks
+			writer.writeRow("Line_" + "P" * (row % 7) + str(row), 100.0, row, -row, row + 1.0, -row - 1.0, 1000.0 + row, 45.0, 5.0, 0.1 * row, 0.25, (row, row + 1.0, row + 2.0, 50.0) if depthColumns else ())
+
+@pytest.mark.parametrize("rowCount", [0, 1, 10, 2500])
+def testNPZHoldsEveryRow(tmp_path, rowCount):
+	fileName = str(tmp_path / "lines.npz")
+	writeReport(fileName, rowCount, chunkRows=1000, depthColumns=True)
+	with np.load(fileName) as report:
+		assert sorted(report.files) == sorted(surveyreport.columnName(name) for name in surveyreport.REPORT_COLUMNS + surveyreport.DEPTH_COLUMNS)
+		assert list(report["linename"]) == ["Line_" + "P" * (row % 7) + str(row) for row in range(rowCount)]
+		np.testing.assert_array_equal(report["startx"], np.arange(rowCount))
+		np.testing.assert_allclose(report["totalduration_h"], 0.1 * np.arange(rowCount) + 0.25)
+		np.testing.assert_array_equal(report["undercoverage_pct"], np.full(rowCount, 50.0))
+
+def testNPZIsSpilledRatherThanHeld(tmp_path):
+	fileName = str(tmp_path / "lines.npz")
+	writer = surveyreport.surveyReportWriter(None, fileName, chunkRows=100)
+	for row in range(1000):
+		writer.writeRow("Line%d" % (row), 100.0, 0, 0, 1, 1, 1.0, 0.0, 5.0, 1.0, 0.25)
+		assert len(writer.chunk) < 100
+	assert len(writer.spillChunks) == 10
+	writer.close()
+	with np.load(fileName) as report:
+		assert len(report["linename"]) == 1000